@@ -0,0 +1,226 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, AuthenticationFailed, PermissionDenied
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from utils.geo_utils import Location
+from .db_functions import anearest_activities, arandom_activities, add_activity_relations, remove_activity_relations
+from .models import View as ActivityView, Like as ActivityLike, Save as ActivitySave
+from .pagination import InvalidCursor
+from .serializers import ActivitySerializer
+from .spatial_index import tree_nearest_activities
+from .view_buffer import get_view_buffer
+from .views import get_feed_queryset, get_liked_page_size, get_liked_queryset, get_seen_ids, \
+    mark_viewed, paginate_liked_activities
+
+
+def prepare_request(request):
+    """
+    Authenticates and checks the permissions of a request with the REST
+    framework settings, as `api_view` does before calling its view.
+    """
+    request = Request(
+        request,
+        parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        authenticators=[authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+
+    for permission in api_settings.DEFAULT_PERMISSION_CLASSES:
+        if not permission().has_permission(request, None):
+            if request.authenticators and not request.successful_authenticator:
+                raise NotAuthenticated()
+            raise PermissionDenied()
+
+    return request
+
+
+@sync_to_async
+def parse(request, parser_classes=None):
+    # The body is parsed in a sync thread, and only by the views reading it.
+    # `parser_classes` replaces the default ones, as `parser_classes` does
+    if parser_classes is not None:
+        request.parsers = [parser() for parser in parser_classes]
+    return request.data
+
+
+def error_response(request, exc):
+    response = JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+
+    # Same status as a DRF view: 401 when the first authenticator can challenge
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        authenticators = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        authenticate_header = authenticators[0]().authenticate_header(request) if authenticators else None
+        if authenticate_header:
+            response['WWW-Authenticate'] = authenticate_header
+        else:
+            response.status_code = status.HTTP_403_FORBIDDEN
+
+    return response
+
+
+def async_api_view(view):
+    """
+    Async counterpart of `api_view(['POST'])`: `view` is a coroutine function
+    getting a DRF request, authenticated in a single sync step, and returning
+    a Django response. Views reading the body get it from `parse`.
+    """
+
+    # Session requests are CSRF checked by SessionAuthentication, as in DRF views
+    @csrf_exempt
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return JsonResponse(
+                {'detail': f'Method "{request.method}" not allowed.'},
+                status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                headers={'Allow': 'POST, OPTIONS'}
+            )
+
+        try:
+            api_request = await sync_to_async(prepare_request)(request)
+            return await view(api_request, *args, **kwargs)
+        except APIException as exc:
+            return error_response(request, exc)
+        except Http404:
+            return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    return wrapper
+
+
+@sync_to_async
+def serialize(activities, context):
+    # Prefetching the relations of the activities is left to the sync ORM
+    return ActivitySerializer(activities, many=True, context=context).data
+
+
+async def toggle_activity_relation(request, activity_id, model, counter_field, add, message):
+    try:
+        activity_id = int(activity_id)
+    except ValueError:
+        raise Http404
+
+    change_relations = add_activity_relations if add else remove_activity_relations
+    found, _ = await sync_to_async(change_relations)(model, counter_field, request.user.id, [activity_id])
+    if not found:
+        raise Http404
+
+    return JsonResponse({'message': message})
+
+
+@async_api_view
+async def like_activity(request, activity_id):
+    return await toggle_activity_relation(request, activity_id, ActivityLike, 'like_count', True, 'Activity liked')
+
+
+@async_api_view
+async def unlike_activity(request, activity_id):
+    return await toggle_activity_relation(
+        request, activity_id, ActivityLike, 'like_count', False, 'Activity unliked'
+    )
+
+
+@async_api_view
+async def save_activity(request, activity_id):
+    return await toggle_activity_relation(request, activity_id, ActivitySave, 'save_count', True, 'Activity saved')
+
+
+@async_api_view
+async def unsave_activity(request, activity_id):
+    return await toggle_activity_relation(
+        request, activity_id, ActivitySave, 'save_count', False, 'Activity unsaved'
+    )
+
+
+@async_api_view
+async def get_some_activities(request):
+    data = await parse(request, (JSONParser,))
+    ignored_ids = [int(id) for id in data.get('ignored_ids', [])]
+    user_latitude = data.get('latitude')
+    user_longitude = data.get('longitude')
+    user_location = None
+
+    count_to_get = int(request.query_params.get('count', 10))
+
+    queryset = get_feed_queryset(request.user, ignored_ids)
+
+    if user_latitude is None or user_longitude is None:
+        activities = await arandom_activities(queryset, count_to_get)
+    else:
+        user_location = Location(user_latitude, user_longitude)
+
+        if settings.ACTIVITIES_FEED_ENGINE == 'tree':
+            seen_ids = await sync_to_async(get_seen_ids)(request.user, ignored_ids)
+            activities = await sync_to_async(tree_nearest_activities)(
+                queryset,
+                user_location.latitude,
+                user_location.longitude,
+                count_to_get,
+                seen_ids
+            )
+        else:
+            activities = await anearest_activities(
+                queryset,
+                user_location.latitude,
+                user_location.longitude,
+                count_to_get
+            )
+
+    view_buffer = get_view_buffer()
+    if view_buffer is not None:
+        view_buffer.add(request.user.id, [activity.id for activity in activities])
+    else:
+        await ActivityView.objects.abulk_create(
+            [ActivityView(user=request.user, activity=activity) for activity in activities],
+            ignore_conflicts=True
+        )
+
+    data = await serialize(activities, {
+        'request': request,
+        'user_location': user_location
+    })
+    return JsonResponse(data, safe=False)
+
+
+@async_api_view
+async def get_liked_activities(request):
+    data = await parse(request)
+    try:
+        page_size = get_liked_page_size(data)
+    except (TypeError, ValueError):
+        return JsonResponse({'message': 'Invalid page size'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        queryset = get_liked_queryset(
+            request.user,
+            data.get('cursor'),
+            data.get('latitude'),
+            data.get('longitude')
+        )
+    except InvalidCursor:
+        return JsonResponse({'message': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+    activities, next_cursor = paginate_liked_activities(
+        [activity async for activity in queryset[:page_size + 1].aiterator()],
+        page_size
+    )
+
+    return JsonResponse({
+        'results': await serialize(activities, {'request': request}),
+        'next_cursor': next_cursor
+    })
+
+
+@async_api_view
+async def track_views(request):
+    data = await parse(request, (JSONParser,))
+    activities = data.get('activityIds', [])
+    await sync_to_async(mark_viewed)(request.user, activities)
+
+    return JsonResponse({'message': 'Activity saved'})
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Entity as ActivityEntity, Like as ActivityLike, Comment as ActivityComment
+from .serializers import ActivitySerializer, CommentSerializer, get_request_user
+
+# Fields which are overlaid on the cached representation on every response
+COUNTER_FIELDS = ['like_count', 'save_count', 'comment_count', 'rating_sum']
+# Fields left out of the cache, as they change without the activity being saved
+UNCACHED_FIELDS = ['comments']
+
+
+def get_activity_cache():
+    return caches[settings.ACTIVITIES_CACHE_ALIAS]
+
+
+def activity_cache_key(activity_id):
+    return f'activity:{activity_id}'
+
+
+def invalidate_activities(activity_ids):
+    # Once the write is committed, so that no other process caches the
+    # previous version of the activities in the meantime
+    keys = [activity_cache_key(activity_id) for activity_id in activity_ids]
+    transaction.on_commit(lambda: get_activity_cache().delete_many(keys))
+
+
+def serialize_activities(queryset, request):
+    """
+    Serialises activities of the queryset, reading the user-independent part
+    of each one from the activity cache. Counters, comments, `liked_by_user`
+    and `distance` are always overlaid from the database.
+    """
+    rows = list(queryset.prefetch_related(None).values('id', *COUNTER_FIELDS))
+    activity_ids = [row['id'] for row in rows]
+
+    cache = get_activity_cache()
+    keys = {activity_id: activity_cache_key(activity_id) for activity_id in activity_ids}
+    cached = cache.get_many(keys.values())
+
+    missing_ids = [activity_id for activity_id in activity_ids if keys[activity_id] not in cached]
+    if missing_ids:
+        # Serialised without a request, so no per-user data ends up in the cache
+        missing = ActivitySerializer(ActivityEntity.objects.filter(id__in=missing_ids), many=True).data
+        fresh = {
+            keys[activity['id']]: {field: value for field, value in activity.items() if field not in UNCACHED_FIELDS}
+            for activity in missing
+        }
+        cache.set_many(fresh)
+        cached.update(fresh)
+
+    liked_activity_ids = set()
+    user = get_request_user({'request': request})
+    if user is not None and activity_ids:
+        liked_activity_ids = set(
+            ActivityLike.objects.filter(user=user, activity_id__in=activity_ids).values_list('activity_id', flat=True)
+        )
+
+    comments = {activity_id: [] for activity_id in activity_ids}
+    if activity_ids:
+        for comment in ActivityComment.objects.filter(activity_id__in=activity_ids).select_related('user'):
+            comments[comment.activity_id].append(comment)
+
+    data = []
+    for row in rows:
+        activity = cached.get(keys[row['id']])
+        if activity is None:
+            # Deleted in the meantime
+            continue
+
+        activity = dict(activity)
+        activity.update({field: row[field] for field in COUNTER_FIELDS})
+        activity['rating_avg'] = row['rating_sum'] / row['comment_count'] if row['comment_count'] else None
+        activity['comments'] = CommentSerializer(comments[row['id']], many=True).data
+        activity['liked_by_user'] = row['id'] in liked_activity_ids
+        activity['distance'] = None
+        data.append(activity)
+
+    return data
@@ -1,6 +1,15 @@
-from django.db.models import F, Value, FloatField
+import random
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q, Value
 from django.db.models.functions import Power, Sqrt, Sin, Cos, Radians, ATan2
 
+from utils.geo_utils import Geohash
+from .models import Entity as ActivityEntity
+
 def annotate_with_distance(queryset, user_latitude, user_longitude):
     R = 6371
 
@@ -21,3 +30,232 @@ def annotate_with_distance(queryset, user_latitude, user_longitude):
 
         distance=R * F('c')
     )
+
+
+def evaluate_queries(queries):
+    """
+    Runs a generator of queries: every queryset it yields is evaluated and
+    its rows are sent back, and what it returns is returned. The same
+    generator runs through the async ORM with `aevaluate_queries`.
+    """
+    try:
+        queryset = next(queries)
+        while True:
+            queryset = queries.send(list(queryset))
+    except StopIteration as stop:
+        return stop.value
+
+
+async def aevaluate_queries(queries):
+    try:
+        queryset = next(queries)
+        while True:
+            queryset = queries.send([row async for row in queryset])
+    except StopIteration as stop:
+        return stop.value
+
+
+def nearest_activities_queries(queryset, user_latitude, user_longitude, count):
+    precision = settings.ACTIVITIES_GEOHASH_SEARCH_PRECISION
+
+    for current_precision in range(precision, 0, -1):
+        cells, radius = Geohash.block(user_latitude, user_longitude, current_precision)
+        if radius <= 0:
+            break
+
+        candidates = queryset.filter(
+            reduce(or_, [Q(address__geohash__startswith=cell) for cell in cells])
+        )
+        candidates = annotate_with_distance(candidates, user_latitude, user_longitude)
+        activities = yield candidates.filter(distance__lte=radius).order_by('distance')[:count]
+
+        if len(activities) >= count:
+            return activities
+
+    queryset = annotate_with_distance(queryset, user_latitude, user_longitude)
+    return (yield queryset.order_by('distance')[:count])
+
+
+def nearest_activities(queryset, user_latitude, user_longitude, count):
+    """
+    Returns the `count` activities closest to the user, ordered by distance.
+
+    Instead of computing the distance for the whole catalogue, candidates are
+    looked up by geohash prefix in the user's cell and its neighbours. The
+    block is widened (a shorter prefix) until it holds `count` activities that
+    are closer than the radius the block is guaranteed to cover; only then the
+    result is known to match a full scan.
+    """
+    return evaluate_queries(nearest_activities_queries(queryset, user_latitude, user_longitude, count))
+
+
+async def anearest_activities(queryset, user_latitude, user_longitude, count):
+    """
+    `nearest_activities` through the async ORM.
+    """
+    return await aevaluate_queries(nearest_activities_queries(queryset, user_latitude, user_longitude, count))
+
+
+def update_activity_counters(activity_id, **deltas):
+    """
+    Atomically shifts the engagement counters of an activity, e.g.
+    `update_activity_counters(1, like_count=1)`.
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    ActivityEntity.objects.filter(id=activity_id).update(**{
+        field: F(field) + delta for field, delta in deltas.items()
+    })
+
+
+def add_activity_relations(model, counter_field, user_id, activity_ids):
+    """
+    Stores a like or save (`model`) of the user for each of the activities
+    that exists and is not stored yet, and increments their `counter_field`,
+    in one statement. Returns the ids of the existing activities and of the
+    ones a row was added for.
+    """
+    table = model._meta.db_table
+    activities_table = ActivityEntity._meta.db_table
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH found AS (
+                SELECT id FROM {activities_table} WHERE id = ANY(%(activity_ids)s::bigint[])
+            ), added AS (
+                INSERT INTO {table} (activity_id, user_id, created_at)
+                SELECT id, %(user_id)s, NOW() FROM found
+                ON CONFLICT (activity_id, user_id) DO NOTHING
+                RETURNING activity_id
+            ), counted AS (
+                UPDATE {activities_table} SET {counter_field} = {counter_field} + 1
+                WHERE id IN (SELECT activity_id FROM added)
+            )
+            SELECT ARRAY(SELECT id FROM found), ARRAY(SELECT activity_id FROM added)
+            """,
+            {'activity_ids': list(activity_ids), 'user_id': user_id}
+        )
+        found, added = cursor.fetchone()
+
+    return set(found), set(added)
+
+
+def remove_activity_relations(model, counter_field, user_id, activity_ids):
+    """
+    Counterpart of `add_activity_relations`: deletes the user's rows of the
+    activities and decrements their `counter_field` in one statement.
+    """
+    table = model._meta.db_table
+    activities_table = ActivityEntity._meta.db_table
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH found AS (
+                SELECT id FROM {activities_table} WHERE id = ANY(%(activity_ids)s::bigint[])
+            ), removed AS (
+                DELETE FROM {table}
+                WHERE user_id = %(user_id)s AND activity_id = ANY(%(activity_ids)s::bigint[])
+                RETURNING activity_id
+            ), counted AS (
+                UPDATE {activities_table} SET {counter_field} = {counter_field} - 1
+                WHERE id IN (SELECT activity_id FROM removed)
+            )
+            SELECT ARRAY(SELECT id FROM found), ARRAY(SELECT activity_id FROM removed)
+            """,
+            {'activity_ids': list(activity_ids), 'user_id': user_id}
+        )
+        found, removed = cursor.fetchone()
+
+    return set(found), set(removed)
+
+
+def random_activities_queries(queryset, count):
+    start = random.random()
+
+    activities = yield queryset.filter(random_key__gte=start).order_by('random_key')[:count]
+
+    if len(activities) < count:
+        activities += (yield queryset.filter(random_key__lt=start).order_by('random_key')[:count - len(activities)])
+
+    random.shuffle(activities)
+    return activities
+
+
+def random_activities(queryset, count):
+    """
+    Returns `count` random activities by walking the `random_key` index from a
+    random start point, wrapping around to the beginning when the tail of the
+    index holds too few rows. Unlike `order_by('?')` the cost does not depend
+    on the table size.
+    """
+    return evaluate_queries(random_activities_queries(queryset, count))
+
+
+async def arandom_activities(queryset, count):
+    """
+    `random_activities` through the async ORM.
+    """
+    return await aevaluate_queries(random_activities_queries(queryset, count))
+
+
+def get_activities_by_external_ids(external_source, external_ids, fields=None):
+    """
+    Returns a dict mapping the given ids of a resource to the activities
+    migrated from them, looked up through the external id index. Only
+    `fields` are loaded when given.
+    """
+    queryset = ActivityEntity.objects.filter(external_source=external_source, external_id__in=external_ids)
+    if fields:
+        queryset = queryset.only('external_id', *fields)
+
+    return {activity.external_id: activity for activity in queryset}
+
+
+def backfill_content_hashes(batch_size=10000):
+    """
+    Computes the content hash of activities stored without one, walking the
+    id index in batches. An `open_street_map` activity whose content is
+    already stored under an earlier hashed row is left without a hash, as the
+    unique index does not allow it; the number of those is returned along
+    with the number of updated rows.
+    """
+    queryset = ActivityEntity.objects.filter(content_hash__isnull=True).order_by('id')
+    last_id = 0
+    updated, duplicates = 0, 0
+
+    while True:
+        batch = list(
+            queryset.filter(id__gt=last_id).only('id', 'name', 'images', 'description', 'destination_resource')[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        for activity in batch:
+            activity.update_content_hash()
+
+        taken = set(
+            ActivityEntity.objects.filter(
+                destination_resource='open_street_map',
+                content_hash__in=[activity.content_hash for activity in batch]
+            ).values_list('content_hash', flat=True)
+        )
+
+        hashed = []
+        for activity in batch:
+            if activity.destination_resource == 'open_street_map':
+                if activity.content_hash in taken:
+                    duplicates += 1
+                    continue
+                taken.add(activity.content_hash)
+            hashed.append(activity)
+
+        with transaction.atomic():
+            ActivityEntity.objects.bulk_update(hashed, ['content_hash'])
+        updated += len(hashed)
+
+    return updated, duplicates
@@ -0,0 +1,124 @@
+from django.db import transaction
+
+from .db_functions import add_activity_relations, remove_activity_relations
+from .models import Entity as ActivityEntity, View as ActivityView, Like as ActivityLike, Save as ActivitySave
+
+# Event types of a batch, grouped by the state they set: within a batch the
+# last like/unlike (save/unsave) of an activity wins, and a view becomes
+# `viewed` when the batch also marks it as viewed
+EVENT_GROUPS = {
+    'like': 'like',
+    'unlike': 'like',
+    'save': 'save',
+    'unsave': 'save',
+    'view': 'view',
+    'viewed': 'view',
+}
+
+APPLIED = 'applied'
+SUPERSEDED = 'superseded'
+NOT_FOUND = 'not_found'
+INVALID = 'invalid'
+
+
+def parse_event(event):
+    if not isinstance(event, dict) or event.get('type') not in EVENT_GROUPS:
+        return None
+
+    try:
+        return event['type'], int(event.get('activity'))
+    except (TypeError, ValueError):
+        return None
+
+
+def decisive_events(events):
+    """
+    Returns the index of the event deciding each (group, activity) state,
+    keyed by (group, activity).
+    """
+    decisive = {}
+    for index, (event_type, activity_id) in events.items():
+        key = (EVENT_GROUPS[event_type], activity_id)
+        current = decisive.get(key)
+
+        # A plain view never overrides a `viewed` of the same activity
+        if event_type == 'view' and current is not None and events[current][0] == 'viewed':
+            continue
+        decisive[key] = index
+
+    return decisive
+
+
+def apply_toggles(model, user, counter_field, add_ids, remove_ids):
+    # One statement each, counters included; see `add_activity_relations`
+    if add_ids:
+        add_activity_relations(model, counter_field, user.id, add_ids)
+    if remove_ids:
+        remove_activity_relations(model, counter_field, user.id, remove_ids)
+
+
+def apply_views(user, view_ids, viewed_ids):
+    if view_ids:
+        ActivityView.objects.bulk_create(
+            [ActivityView(user=user, activity_id=activity_id) for activity_id in view_ids],
+            ignore_conflicts=True
+        )
+
+    if viewed_ids:
+        ActivityView.objects.bulk_create(
+            [ActivityView(user=user, activity_id=activity_id, viewed=True) for activity_id in viewed_ids],
+            update_conflicts=True,
+            unique_fields=['activity', 'user'],
+            update_fields=['viewed']
+        )
+
+
+def apply_interactions(user, events):
+    """
+    Applies an ordered batch of interaction events of the user, e.g.
+    `[{'type': 'like', 'activity': 1}, {'type': 'viewed', 'activity': 2}]`,
+    with a few bulk statements per event type. Returns one result per event:
+    `applied`, `superseded` by a later event of the batch, `not_found` or
+    `invalid`.
+    """
+    results = [INVALID] * len(events)
+
+    parsed = {}
+    for index, event in enumerate(events):
+        parsed_event = parse_event(event)
+        if parsed_event is not None:
+            parsed[index] = parsed_event
+
+    found = set(
+        ActivityEntity.objects.filter(
+            id__in={activity_id for _, activity_id in parsed.values()}
+        ).values_list('id', flat=True)
+    )
+    for index, (_, activity_id) in list(parsed.items()):
+        if activity_id not in found:
+            results[index] = NOT_FOUND
+            del parsed[index]
+
+    decisive = decisive_events(parsed)
+    chosen = {event_type: [] for event_type in EVENT_GROUPS}
+    for index in parsed:
+        results[index] = SUPERSEDED
+    for index in sorted(decisive.values()):
+        event_type, activity_id = parsed[index]
+        chosen[event_type].append(activity_id)
+        results[index] = APPLIED
+
+    with transaction.atomic():
+        apply_toggles(ActivityLike, user, 'like_count', chosen['like'], chosen['unlike'])
+        apply_toggles(ActivitySave, user, 'save_count', chosen['save'], chosen['unsave'])
+        apply_views(user, chosen['view'], chosen['viewed'])
+
+    return [
+        dict(
+            index=index,
+            type=event.get('type') if isinstance(event, dict) else None,
+            activity=event.get('activity') if isinstance(event, dict) else None,
+            status=result
+        )
+        for index, (event, result) in enumerate(zip(events, results))
+    ]
@@ -0,0 +1,27 @@
+import logging
+
+from django.core.management import BaseCommand
+
+from activities.db_functions import backfill_content_hashes
+from utils.decorators.timeit_decorator import timeit_decorator
+
+
+class Command(BaseCommand):
+    help = 'Compute the content hash of activities stored without one'
+    logger = logging.getLogger(__name__)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Number of activities hashed per statement',
+            default=10000
+        )
+
+    @timeit_decorator
+    def handle(self, *args, **options):
+        updated, duplicates = backfill_content_hashes(options['batch_size'])
+
+        self.logger.info(f'Content hashes of {updated} activities were computed')
+        if duplicates:
+            self.logger.info(f'{duplicates} duplicated activities were left without one, run after_migration_actions --action delete_duplicates')
@@ -0,0 +1,184 @@
+import logging
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, call_command
+from django.db import transaction
+
+from activities.models import Address, ExternalLinks, Entity as ActivityEntity, Like as ActivityLike, \
+    View as ActivityView, Comment as ActivityComment
+from utils.decorators.timeit_decorator import timeit_decorator
+
+BENCHMARK_RESOURCE = 'benchmark'
+BENCHMARK_USERNAME_PREFIX = 'benchmark_user_'
+
+# (latitude, longitude, weight) of the clusters activities are spread around
+CITY_CENTERS = [
+    (52.2297, 21.0122, 0.30),
+    (50.0647, 19.9450, 0.20),
+    (51.1079, 17.0385, 0.15),
+    (54.3520, 18.6466, 0.15),
+    (52.4064, 16.9252, 0.10),
+    (53.4285, 14.5528, 0.10),
+]
+
+TAGS = ['interesting_places', 'amusements', 'adult', 'foods', 'transport', 'accomodations', 'museums', 'churches']
+
+DESCRIPTION = (
+    'Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore '
+    'et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris nisi ut '
+    'aliquip ex ea commodo consequat. '
+) * 4
+
+
+class Command(BaseCommand):
+    help = 'Generate a seeded synthetic dataset of activities, users and interactions for benchmarks'
+    logger = logging.getLogger(__name__)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entities', type=int, default=10000, help='Number of activities')
+        parser.add_argument('--users', type=int, default=100, help='Number of users')
+        parser.add_argument('--likes-per-user', type=float, default=20, help='Mean number of likes per user')
+        parser.add_argument('--views-per-user', type=float, default=300, help='Mean number of views per user')
+        parser.add_argument('--comments-per-user', type=float, default=3, help='Mean number of comments per user')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Remove previously generated benchmark data first'
+        )
+
+    def clear(self, batch_size):
+        activity_ids = list(
+            ActivityEntity.objects.filter(destination_resource=BENCHMARK_RESOURCE).values_list('id', flat=True)
+        )
+        for batch_start in range(0, len(activity_ids), batch_size):
+            batch = activity_ids[batch_start:batch_start + batch_size]
+            address_ids = list(Address.objects.filter(entity__id__in=batch).values_list('id', flat=True))
+
+            with transaction.atomic():
+                ExternalLinks.objects.filter(entity__id__in=batch).delete()
+                Address.objects.filter(id__in=address_ids).delete()
+
+        User.objects.filter(username__startswith=BENCHMARK_USERNAME_PREFIX).delete()
+        self.logger.info(f'{len(activity_ids)} benchmark activities were removed')
+
+    def create_activities(self, generator, count, batch_size):
+        centers = np.array([(lat, lon) for lat, lon, _ in CITY_CENTERS])
+        weights = np.array([weight for _, _, weight in CITY_CENTERS])
+
+        clusters = generator.choice(len(CITY_CENTERS), size=count, p=weights / weights.sum())
+        latitudes = centers[clusters, 0] + generator.normal(0, 0.25, count)
+        longitudes = centers[clusters, 1] + generator.normal(0, 0.4, count)
+        tag_counts = generator.integers(1, 4, count)
+
+        activity_ids = []
+        for batch_start in range(0, count, batch_size):
+            batch = range(batch_start, min(batch_start + batch_size, count))
+
+            with transaction.atomic():
+                addresses = []
+                for index in batch:
+                    address = Address(
+                        street=f'Benchmark street {index}',
+                        city='Benchmark city',
+                        country='Poland',
+                        latitude=float(latitudes[index]),
+                        longitude=float(longitudes[index])
+                    )
+                    address.update_geohash()
+                    addresses.append(address)
+
+                addresses = Address.objects.bulk_create(addresses)
+                external_links = ExternalLinks.objects.bulk_create([
+                    ExternalLinks(website_url=f'https://example.com/activities/{index}') for index in batch
+                ])
+
+                activities = ActivityEntity.objects.bulk_create([
+                    ActivityEntity(
+                        name=f'Benchmark activity {index}',
+                        description=DESCRIPTION,
+                        images=[f'https://example.com/images/{index}.jpg'],
+                        destination_resource=BENCHMARK_RESOURCE,
+                        address=address,
+                        external_links=links,
+                        tags=list(generator.choice(TAGS, size=tag_counts[index], replace=False)),
+                        original_language='en'
+                    )
+                    for index, address, links in zip(batch, addresses, external_links)
+                ])
+
+            activity_ids.extend(activity.id for activity in activities)
+            self.logger.info(f'{len(activity_ids)}/{count} activities created')
+
+        return np.array(activity_ids)
+
+    def create_users(self, count):
+        users = []
+        for index in range(count):
+            user = User(username=f'{BENCHMARK_USERNAME_PREFIX}{index}', email=f'benchmark{index}@example.com')
+            user.set_unusable_password()
+            users.append(user)
+
+        return User.objects.bulk_create(users)
+
+    def sample_activities(self, generator, cumulative_popularity, activity_ids, mean):
+        # Heavy-tailed amount of interactions per user, popular activities
+        # (Zipf-like weights) are picked more often
+        size = int(generator.lognormal(np.log(max(mean, 1)), 0.8))
+        picked = np.searchsorted(cumulative_popularity, generator.random(size))
+        return np.unique(activity_ids[np.minimum(picked, len(activity_ids) - 1)])
+
+    def create_interactions(self, generator, users, activity_ids, options):
+        ranks = generator.permutation(len(activity_ids)) + 1
+        popularity = 1.0 / ranks ** 1.1
+        cumulative_popularity = np.cumsum(popularity / popularity.sum())
+
+        for user in users:
+            with transaction.atomic():
+                views = self.sample_activities(
+                    generator, cumulative_popularity, activity_ids, options['views_per_user']
+                )
+                ActivityView.objects.bulk_create([
+                    ActivityView(user=user, activity_id=int(activity_id), viewed=bool(generator.random() < 0.8))
+                    for activity_id in views
+                ], batch_size=options['batch_size'], ignore_conflicts=True)
+
+                likes = self.sample_activities(
+                    generator, cumulative_popularity, activity_ids, options['likes_per_user']
+                )
+                ActivityLike.objects.bulk_create([
+                    ActivityLike(user=user, activity_id=int(activity_id)) for activity_id in likes
+                ], batch_size=options['batch_size'])
+
+                comments = self.sample_activities(
+                    generator, cumulative_popularity, activity_ids, options['comments_per_user']
+                )
+                ActivityComment.objects.bulk_create([
+                    ActivityComment(
+                        user=user,
+                        activity_id=int(activity_id),
+                        comment=f'Benchmark comment of {user.username}',
+                        rating=int(generator.integers(1, 6))
+                    )
+                    for activity_id in comments
+                ], batch_size=options['batch_size'])
+
+        self.logger.info(f'Interactions created for {len(users)} users')
+
+    @timeit_decorator
+    def handle(self, *args, **options):
+        generator = np.random.default_rng(options['seed'])
+
+        if options['clear']:
+            self.clear(options['batch_size'])
+
+        activity_ids = self.create_activities(generator, options['entities'], options['batch_size'])
+        users = self.create_users(options['users'])
+        self.create_interactions(generator, users, activity_ids, options)
+
+        call_command('reconcile_counters')
+        self.logger.info(
+            f'Benchmark dataset with {options["entities"]} activities and {options["users"]} users generated'
+        )
@@ -0,0 +1,31 @@
+import logging
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from activities.spatial_index import ActivitySpatialIndex
+from utils.decorators.timeit_decorator import timeit_decorator
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the in-memory nearest-neighbour index of activities'
+    logger = logging.getLogger(__name__)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='File to store the index in, defaults to ACTIVITIES_SPATIAL_INDEX_PATH',
+            default=settings.ACTIVITIES_SPATIAL_INDEX_PATH
+        )
+
+    @timeit_decorator
+    def handle(self, *args, **options):
+        output = options['output']
+        if not output:
+            self.logger.error('No output file given and ACTIVITIES_SPATIAL_INDEX_PATH is not set')
+            exit()
+
+        spatial_index = ActivitySpatialIndex.from_database()
+        spatial_index.save(output)
+        self.logger.info(f'Spatial index with {len(spatial_index)} activities saved to {output}')
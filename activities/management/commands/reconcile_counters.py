@@ -0,0 +1,59 @@
+import logging
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Max
+from django.db.models.functions import Coalesce
+
+from activities.models import Entity as ActivityEntity, Like as ActivityLike, Save as ActivitySave, \
+    Comment as ActivityComment
+from utils.decorators.timeit_decorator import timeit_decorator
+
+
+def aggregate_subquery(model, aggregate):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(activity=OuterRef('pk'))
+            .order_by()
+            .values('activity')
+            .annotate(value=aggregate)
+            .values('value'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = 'Recompute the engagement counters of activities from likes, saves and comments'
+    logger = logging.getLogger(__name__)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Number of activity ids updated per statement',
+            default=10000
+        )
+
+    @timeit_decorator
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_id = ActivityEntity.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        updated = 0
+
+        for batch_start in range(0, max_id + 1, batch_size):
+            with transaction.atomic():
+                updated += ActivityEntity.objects.filter(
+                    id__gte=batch_start,
+                    id__lt=batch_start + batch_size
+                ).update(
+                    like_count=aggregate_subquery(ActivityLike, Count('id')),
+                    save_count=aggregate_subquery(ActivitySave, Count('id')),
+                    comment_count=aggregate_subquery(ActivityComment, Count('id')),
+                    rating_sum=aggregate_subquery(ActivityComment, Sum('rating'))
+                )
+
+            self.logger.debug(f'Counters reconciled up to id {batch_start + batch_size}')
+
+        self.logger.info(f'Counters of {updated} activities were reconciled')
@@ -0,0 +1,189 @@
+import json
+import logging
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, call_command
+from django.db import connection
+from django.test import Client
+
+from activities.models import Entity as ActivityEntity
+from .generate_benchmark_data import BENCHMARK_RESOURCE, BENCHMARK_USERNAME_PREFIX, CITY_CENTERS
+
+ENDPOINTS = [
+    'get-activities', 'get-activities-random', 'liked-activities', 'track-views', 'interactions', 'activities', 'comments'
+]
+
+
+class Command(BaseCommand):
+    help = 'Measure latency percentiles and query counts of the activities API'
+    logger = logging.getLogger(__name__)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per endpoint')
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS)
+        parser.add_argument(
+            '--scales',
+            type=int,
+            nargs='+',
+            help='Regenerate the benchmark dataset with this many activities before each run, e.g. 10000 100000 1000000'
+        )
+        parser.add_argument('--users', type=int, default=100, help='Users generated per scale')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', type=str, default='benchmark_results.json', help='JSON file to write')
+        parser.add_argument('--label', type=str, default='', help='Free-form label stored with the results')
+
+    def get_client(self):
+        host = next((host for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost').lstrip('.')
+        return Client(SERVER_NAME=host)
+
+    def request(self, client, endpoint, generator):
+        latitude, longitude, _ = CITY_CENTERS[generator.randrange(len(CITY_CENTERS))]
+
+        if endpoint == 'get-activities':
+            return client.post(
+                '/api/activities/get-activities/?count=10',
+                {'latitude': latitude, 'longitude': longitude, 'ignored_ids': []},
+                content_type='application/json'
+            )
+        if endpoint == 'get-activities-random':
+            return client.post(
+                '/api/activities/get-activities/?count=10',
+                {'ignored_ids': []},
+                content_type='application/json'
+            )
+        if endpoint == 'liked-activities':
+            return client.post(
+                '/api/activities/liked-activities/',
+                {'latitude': latitude, 'longitude': longitude},
+                content_type='application/json'
+            )
+        if endpoint == 'track-views':
+            return client.post(
+                '/api/activities/track-views/',
+                {'activityIds': generator.sample(self.activity_ids, 10)},
+                content_type='application/json'
+            )
+        if endpoint == 'interactions':
+            return client.post(
+                '/api/activities/interactions/',
+                {'events': [
+                    {'type': generator.choice(['like', 'unlike', 'save', 'view', 'viewed']), 'activity': activity_id}
+                    for activity_id in generator.sample(self.activity_ids, 10)
+                ]},
+                content_type='application/json'
+            )
+        if endpoint == 'activities':
+            return client.get('/api/activities/activities/')
+        if endpoint == 'comments':
+            return client.post(
+                '/api/activities/comments/',
+                {'activity': generator.choice(self.activity_ids), 'comment': 'Benchmark comment', 'rating': 4},
+                content_type='application/json'
+            )
+
+        raise ValueError(f'Unknown endpoint {endpoint}')
+
+    def measure(self, endpoint, users, options):
+        client = self.get_client()
+        generator = random.Random(options['seed'])
+        latencies = []
+        query_counts = []
+
+        for iteration in range(options['warmup'] + options['iterations']):
+            client.force_login(users[generator.randrange(len(users))])
+
+            start_time = time.perf_counter()
+            response = self.request(client, endpoint, generator)
+            elapsed_time = time.perf_counter() - start_time
+
+            if response.status_code >= 400:
+                raise RuntimeError(f'{endpoint} responded with {response.status_code}: {response.content[:200]}')
+
+            if iteration >= options['warmup']:
+                latencies.append(elapsed_time * 1000)
+                query_counts.append(int(response['X-Query-Count']))
+
+        latencies = np.array(latencies)
+        return {
+            'iterations': len(latencies),
+            'latency_ms': {
+                'mean': float(latencies.mean()),
+                'min': float(latencies.min()),
+                'p50': float(np.percentile(latencies, 50)),
+                'p90': float(np.percentile(latencies, 90)),
+                'p99': float(np.percentile(latencies, 99)),
+                'max': float(latencies.max()),
+            },
+            'queries': {
+                'mean': float(np.mean(query_counts)),
+                'max': int(np.max(query_counts)),
+            },
+        }
+
+    def run(self, options):
+        users = list(User.objects.filter(username__startswith=BENCHMARK_USERNAME_PREFIX).order_by('id'))
+        self.activity_ids = list(
+            ActivityEntity.objects.filter(destination_resource=BENCHMARK_RESOURCE).values_list('id', flat=True)
+        )
+        if not users or not self.activity_ids:
+            raise RuntimeError('No benchmark data found, run generate_benchmark_data first')
+
+        results = {}
+        for endpoint in options['endpoints']:
+            results[endpoint] = self.measure(endpoint, users, options)
+            latency = results[endpoint]['latency_ms']
+            self.logger.info(
+                f'{endpoint}: p50 {latency["p50"]:.1f} ms, p99 {latency["p99"]:.1f} ms, '
+                f'{results[endpoint]["queries"]["mean"]:.1f} queries'
+            )
+
+        return {
+            'entities': len(self.activity_ids),
+            'users': len(users),
+            'endpoints': results,
+        }
+
+    def handle(self, *args, **options):
+        runs = []
+
+        if options['scales']:
+            for scale in options['scales']:
+                call_command(
+                    'generate_benchmark_data',
+                    entities=scale,
+                    users=options['users'],
+                    seed=options['seed'],
+                    clear=True
+                )
+                runs.append(self.run(options))
+        else:
+            runs.append(self.run(options))
+
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR
+            ).stdout.strip()
+        except OSError:
+            commit = None
+
+        report = {
+            'label': options['label'],
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'commit': commit or None,
+            'seed': options['seed'],
+            'feed_engine': settings.ACTIVITIES_FEED_ENGINE,
+            'database': connection.vendor,
+            'runs': runs,
+        }
+
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, indent=2)
+
+        self.logger.info(f'Benchmark results written to {options["output"]}')
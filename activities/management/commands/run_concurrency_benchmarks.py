@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import aiohttp
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_SECRET_LENGTH
+from django.test import Client
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from activities.models import Entity as ActivityEntity
+from .generate_benchmark_data import BENCHMARK_RESOURCE, BENCHMARK_USERNAME_PREFIX, CITY_CENTERS
+
+ENDPOINTS = ['get-activities', 'get-activities-random', 'liked-activities', 'track-views', 'like-activity']
+MODES = ['sync', 'async']
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure throughput and latency of the sync and async activities views under concurrent load. '
+        'Requests are sent to a running server, which should be an ASGI server serving the project '
+        '(e.g. `uvicorn travel_app_backend.asgi:application`) with ACTIVITIES_ASYNC_VIEWS unset, '
+        'so that sync views are served by their main route and async views by the async/ one'
+    )
+    logger = logging.getLogger(__name__)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', type=str, default='http://127.0.0.1:8000', help='URL of the server')
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            nargs='+',
+            default=[1, 10, 50],
+            help='Numbers of requests in flight to measure, e.g. 1 10 50 200'
+        )
+        parser.add_argument('--requests', type=int, default=500, help='Measured requests per endpoint and level')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per endpoint and level')
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS)
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+        parser.add_argument('--users', type=int, default=50, help='Benchmark users logged in for the run')
+        parser.add_argument('--timeout', type=float, default=60, help='Seconds before a request counts as failed')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--output', type=str, default='concurrency_benchmark_results.json', help='JSON file to write'
+        )
+        parser.add_argument('--label', type=str, default='', help='Free-form label stored with the results')
+
+    def login(self, users):
+        # Sessions are stored in the database the server reads, together with
+        # a CSRF secret sent both as cookie and header
+        sessions = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            csrf_token = get_random_string(CSRF_SECRET_LENGTH, CSRF_ALLOWED_CHARS)
+            sessions.append({
+                'cookies': {
+                    settings.SESSION_COOKIE_NAME: client.cookies[settings.SESSION_COOKIE_NAME].value,
+                    settings.CSRF_COOKIE_NAME: csrf_token,
+                },
+                'headers': {'X-CSRFToken': csrf_token},
+            })
+
+        return sessions
+
+    def build_request(self, endpoint, mode, generator):
+        # (path, query, body) of a request to the sync or async view
+        prefix = 'async-' if mode == 'async' else ''
+        latitude, longitude, _ = CITY_CENTERS[generator.randrange(len(CITY_CENTERS))]
+
+        if endpoint == 'get-activities':
+            return reverse(f'{prefix}get-activities'), {'count': 10}, {
+                'latitude': latitude, 'longitude': longitude, 'ignored_ids': []
+            }
+        if endpoint == 'get-activities-random':
+            return reverse(f'{prefix}get-activities'), {'count': 10}, {'ignored_ids': []}
+        if endpoint == 'liked-activities':
+            return reverse(f'{prefix}liked-activities'), {}, {'latitude': latitude, 'longitude': longitude}
+        if endpoint == 'track-views':
+            return reverse(f'{prefix}track-views'), {}, {'activityIds': generator.sample(self.activity_ids, 10)}
+        if endpoint == 'like-activity':
+            name = generator.choice(['like-activity', 'unlike-activity'])
+            return reverse(f'{prefix}{name}', args=[generator.choice(self.activity_ids)]), {}, {}
+
+        raise ValueError(f'Unknown endpoint {endpoint}')
+
+    async def send(self, http, session, request, options):
+        path, query, body = request
+        start_time = time.perf_counter()
+        try:
+            async with http.post(
+                options['base_url'].rstrip('/') + path,
+                params=query,
+                json=body,
+                cookies=session['cookies'],
+                headers=session['headers']
+            ) as response:
+                await response.read()
+                status = response.status
+                query_count = response.headers.get('X-Query-Count')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            status, query_count = type(err).__name__, None
+
+        return time.perf_counter() - start_time, status, query_count
+
+    async def measure(self, endpoint, mode, concurrency, sessions, options):
+        generator = random.Random(options['seed'])
+        count = options['warmup'] + options['requests']
+        requests = [
+            (sessions[generator.randrange(len(sessions))], self.build_request(endpoint, mode, generator))
+            for _ in range(count)
+        ]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(http, session, request):
+            async with semaphore:
+                return await self.send(http, session, request, options)
+
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        timeout = aiohttp.ClientTimeout(total=options['timeout'])
+        # Every request carries the cookies of its user, none are kept between them
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout, cookie_jar=aiohttp.DummyCookieJar()
+        ) as http:
+            for session, request in requests[:options['warmup']]:
+                await limited(http, session, request)
+
+            start_time = time.perf_counter()
+            results = await asyncio.gather(*[
+                limited(http, session, request) for session, request in requests[options['warmup']:]
+            ])
+            elapsed_time = time.perf_counter() - start_time
+
+        latencies = np.array([latency * 1000 for latency, status, _ in results if status == 200])
+        errors = {}
+        for _, status, _ in results:
+            if status != 200:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+        query_counts = [int(query_count) for _, _, query_count in results if query_count is not None]
+
+        return {
+            'concurrency': concurrency,
+            'requests': len(results),
+            'elapsed_s': elapsed_time,
+            'throughput_rps': len(latencies) / elapsed_time if elapsed_time else 0.0,
+            'errors': errors,
+            'latency_ms': {
+                'mean': float(latencies.mean()),
+                'p50': float(np.percentile(latencies, 50)),
+                'p90': float(np.percentile(latencies, 90)),
+                'p99': float(np.percentile(latencies, 99)),
+                'max': float(latencies.max()),
+            } if len(latencies) else None,
+            'queries': {
+                'mean': float(np.mean(query_counts)),
+                'max': int(np.max(query_counts)),
+            } if query_counts else None,
+        }
+
+    def handle(self, *args, **options):
+        users = list(
+            User.objects.filter(username__startswith=BENCHMARK_USERNAME_PREFIX).order_by('id')[:options['users']]
+        )
+        self.activity_ids = list(
+            ActivityEntity.objects.filter(destination_resource=BENCHMARK_RESOURCE).values_list('id', flat=True)
+        )
+        if not users or not self.activity_ids:
+            raise RuntimeError('No benchmark data found, run generate_benchmark_data first')
+
+        sessions = self.login(users)
+
+        results = {}
+        for endpoint in options['endpoints']:
+            for mode in options['modes']:
+                levels = results.setdefault(endpoint, {}).setdefault(mode, [])
+                for concurrency in options['concurrency']:
+                    result = asyncio.run(self.measure(endpoint, mode, concurrency, sessions, options))
+                    levels.append(result)
+
+                    latency = result['latency_ms'] or {}
+                    self.logger.info(
+                        f'{endpoint} ({mode}, {concurrency} concurrent): {result["throughput_rps"]:.1f} req/s, '
+                        f'p50 {latency.get("p50", 0):.1f} ms, p99 {latency.get("p99", 0):.1f} ms, '
+                        f'{sum(result["errors"].values())} errors'
+                    )
+
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR
+            ).stdout.strip()
+        except OSError:
+            commit = None
+
+        report = {
+            'label': options['label'],
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'commit': commit or None,
+            'seed': options['seed'],
+            'base_url': options['base_url'],
+            'feed_engine': settings.ACTIVITIES_FEED_ENGINE,
+            'entities': len(self.activity_ids),
+            'users': len(users),
+            'endpoints': results,
+        }
+
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, indent=2)
+
+        self.logger.info(f'Concurrency benchmark results written to {options["output"]}')
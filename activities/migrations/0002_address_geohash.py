@@ -0,0 +1,39 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:49
+
+from django.db import migrations, models
+
+from utils.geo_utils import Geohash
+
+
+def backfill_geohash(apps, schema_editor):
+    Address = apps.get_model('activities', 'Address')
+    batch = []
+
+    for address in Address.objects.filter(
+        latitude__isnull=False,
+        longitude__isnull=False
+    ).only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        address.geohash = Geohash.encode(address.latitude, address.longitude, 9)
+        batch.append(address)
+
+        if len(batch) >= 2000:
+            Address.objects.bulk_update(batch, ['geohash'])
+            batch = []
+
+    Address.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='geohash',
+            field=models.CharField(db_index=True, max_length=9, null=True),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
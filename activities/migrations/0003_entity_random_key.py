@@ -0,0 +1,24 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:50
+
+import activities.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0002_address_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entity',
+            name='random_key',
+            field=models.FloatField(db_index=True, default=activities.models.generate_random_key),
+        ),
+        # The default above is evaluated once for all existing rows
+        migrations.RunSQL(
+            'UPDATE activities_entity SET random_key = random()',
+            migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0004_like_user_created_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entity',
+            name='comment_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='entity',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='entity',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='entity',
+            name='save_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE activities_entity SET
+                like_count = (SELECT COUNT(*) FROM activities_like WHERE activity_id = activities_entity.id),
+                save_count = (SELECT COUNT(*) FROM activities_save WHERE activity_id = activities_entity.id),
+                comment_count = (SELECT COUNT(*) FROM activities_comment WHERE activity_id = activities_entity.id),
+                rating_sum = (
+                    SELECT COALESCE(SUM(rating), 0) FROM activities_comment WHERE activity_id = activities_entity.id
+                )
+            """,
+            migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0006_entity_content_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entity',
+            name='external_id',
+            field=models.CharField(max_length=250, null=True),
+        ),
+        migrations.AddField(
+            model_name='entity',
+            name='external_source',
+            field=models.CharField(max_length=250, null=True),
+        ),
+        # Only the most recently created activity of a duplicated xid gets it,
+        # the others are merged into it by 0010
+        migrations.RunSQL(
+            """
+            UPDATE activities_entity SET
+                external_source = destination_resource,
+                external_id = migration_data->>'xid'
+            WHERE id IN (
+                SELECT DISTINCT ON (destination_resource, migration_data->>'xid') id
+                FROM activities_entity
+                WHERE migration_data ? 'xid'
+                ORDER BY destination_resource, migration_data->>'xid', id DESC
+            )
+            """,
+            migrations.RunSQL.noop
+        ),
+        migrations.AddConstraint(
+            model_name='entity',
+            constraint=models.UniqueConstraint(fields=('external_source', 'external_id'), name='unique_external_id'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0007_entity_external_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # The oldest like/save of each pair is kept, and the counters are
+        # recomputed without the removed duplicates
+        migrations.RunSQL(
+            """
+            DELETE FROM activities_like duplicate USING activities_like original
+            WHERE duplicate.activity_id = original.activity_id
+                AND duplicate.user_id = original.user_id
+                AND duplicate.id > original.id
+            """,
+            migrations.RunSQL.noop
+        ),
+        migrations.RunSQL(
+            """
+            DELETE FROM activities_save duplicate USING activities_save original
+            WHERE duplicate.activity_id = original.activity_id
+                AND duplicate.user_id = original.user_id
+                AND duplicate.id > original.id
+            """,
+            migrations.RunSQL.noop
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE activities_entity SET
+                like_count = (SELECT COUNT(*) FROM activities_like WHERE activity_id = activities_entity.id),
+                save_count = (SELECT COUNT(*) FROM activities_save WHERE activity_id = activities_entity.id)
+            """,
+            migrations.RunSQL.noop
+        ),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('activity', 'user'), name='unique_like'),
+        ),
+        migrations.AddConstraint(
+            model_name='save',
+            constraint=models.UniqueConstraint(fields=('activity', 'user'), name='unique_save'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:00
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_tables(apps, schema_editor):
+    # Tables of the database cache backends, e.g. the activities cache, which
+    # already exist are left as they are
+    call_command('createcachetable', database=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0008_unique_like_save'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_tables, migrations.RunPython.noop),
+    ]
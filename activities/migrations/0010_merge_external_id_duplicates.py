@@ -0,0 +1,108 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0009_activities_cache_table'),
+    ]
+
+    # 0007 gave the external id of a duplicated xid to its most recent activity
+    # only. The older ones, which could never be upserted again, are merged
+    # into it: their likes, saves, views and comments are moved to it, then
+    # they are deleted along with their own address and links rows
+    operations = [
+        migrations.RunSQL(
+            """
+            CREATE TEMPORARY TABLE external_id_duplicates ON COMMIT DROP AS
+            SELECT duplicate.id AS duplicate_id, kept.id AS kept_id,
+                duplicate.address_id, duplicate.external_links_id
+            FROM activities_entity duplicate
+            JOIN activities_entity kept
+                ON kept.external_source = duplicate.destination_resource
+                AND kept.external_id = duplicate.migration_data->>'xid'
+            WHERE duplicate.external_id IS NULL AND duplicate.migration_data ? 'xid'
+            """,
+            migrations.RunSQL.noop
+        ),
+        # A user keeps a single like, save and view of the merged activity,
+        # the oldest one, and the view is viewed if any of them was
+        migrations.RunSQL(
+            """
+            INSERT INTO activities_like (activity_id, user_id, created_at)
+            SELECT merged.kept_id, relation.user_id, MIN(relation.created_at)
+            FROM activities_like relation
+            JOIN external_id_duplicates merged ON relation.activity_id = merged.duplicate_id
+            GROUP BY merged.kept_id, relation.user_id
+            ON CONFLICT (activity_id, user_id) DO UPDATE SET
+                created_at = LEAST(activities_like.created_at, EXCLUDED.created_at)
+            """,
+            migrations.RunSQL.noop
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO activities_save (activity_id, user_id, created_at)
+            SELECT merged.kept_id, relation.user_id, MIN(relation.created_at)
+            FROM activities_save relation
+            JOIN external_id_duplicates merged ON relation.activity_id = merged.duplicate_id
+            GROUP BY merged.kept_id, relation.user_id
+            ON CONFLICT (activity_id, user_id) DO UPDATE SET
+                created_at = LEAST(activities_save.created_at, EXCLUDED.created_at)
+            """,
+            migrations.RunSQL.noop
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO activities_view (activity_id, user_id, viewed, created_at)
+            SELECT merged.kept_id, relation.user_id, BOOL_OR(relation.viewed), MIN(relation.created_at)
+            FROM activities_view relation
+            JOIN external_id_duplicates merged ON relation.activity_id = merged.duplicate_id
+            GROUP BY merged.kept_id, relation.user_id
+            ON CONFLICT (activity_id, user_id) DO UPDATE SET
+                viewed = activities_view.viewed OR EXCLUDED.viewed,
+                created_at = LEAST(activities_view.created_at, EXCLUDED.created_at)
+            """,
+            migrations.RunSQL.noop
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE activities_comment SET activity_id = merged.kept_id
+            FROM external_id_duplicates merged
+            WHERE activities_comment.activity_id = merged.duplicate_id
+            """,
+            migrations.RunSQL.noop
+        ),
+        migrations.RunSQL(
+            """
+            DELETE FROM activities_like WHERE activity_id IN (SELECT duplicate_id FROM external_id_duplicates);
+            DELETE FROM activities_save WHERE activity_id IN (SELECT duplicate_id FROM external_id_duplicates);
+            DELETE FROM activities_view WHERE activity_id IN (SELECT duplicate_id FROM external_id_duplicates);
+            DELETE FROM activities_entity WHERE id IN (SELECT duplicate_id FROM external_id_duplicates);
+            """,
+            migrations.RunSQL.noop
+        ),
+        migrations.RunSQL(
+            """
+            DELETE FROM activities_address WHERE id IN (SELECT address_id FROM external_id_duplicates)
+                AND NOT EXISTS (SELECT 1 FROM activities_entity WHERE address_id = activities_address.id);
+            DELETE FROM activities_externallinks WHERE id IN (SELECT external_links_id FROM external_id_duplicates)
+                AND NOT EXISTS (SELECT 1 FROM activities_entity WHERE external_links_id = activities_externallinks.id);
+            """,
+            migrations.RunSQL.noop
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE activities_entity SET
+                like_count = (SELECT COUNT(*) FROM activities_like WHERE activity_id = activities_entity.id),
+                save_count = (SELECT COUNT(*) FROM activities_save WHERE activity_id = activities_entity.id),
+                comment_count = (SELECT COUNT(*) FROM activities_comment WHERE activity_id = activities_entity.id),
+                rating_sum = (
+                    SELECT COALESCE(SUM(rating), 0) FROM activities_comment WHERE activity_id = activities_entity.id
+                )
+            WHERE id IN (SELECT kept_id FROM external_id_duplicates)
+            """,
+            migrations.RunSQL.noop
+        ),
+    ]
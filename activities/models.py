@@ -1,7 +1,25 @@
+import hashlib
+import json
+import random
+
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import ArrayField
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import Q, UniqueConstraint
+
+from utils.geo_utils import Geohash
+
+GEOHASH_PRECISION = 9
+
+
+def generate_random_key():
+    return random.random()
+
+
+def compute_content_hash(name, images, description):
+    # Fingerprint of the fields duplicates are detected by
+    payload = json.dumps([name, list(images or []), description], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
 
 
 class Address(models.Model):
@@ -12,10 +30,24 @@ class Address(models.Model):
     postal_code = models.CharField(max_length=250, null=True)
     latitude = models.FloatField(null=True)
     longitude = models.FloatField(null=True)
+    geohash = models.CharField(max_length=GEOHASH_PRECISION, null=True, db_index=True)
 
     def __str__(self):
         return f"{self.street}, {self.city}, {self.country}"
 
+    def update_geohash(self):
+        if self.latitude is None or self.longitude is None:
+            self.geohash = None
+        else:
+            self.geohash = Geohash.encode(self.latitude, self.longitude, GEOHASH_PRECISION)
+
+    def save(self, *args, **kwargs):
+        self.update_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
 
 class ExternalLinks(models.Model):
     wikipedia_url = models.URLField(null=True, max_length=500)
@@ -34,16 +66,65 @@ class Entity(models.Model):
     external_links = models.ForeignKey(ExternalLinks, on_delete=models.CASCADE, null=True)
     tags = ArrayField(models.CharField(max_length=250), blank=True, default=list)
     original_language = models.CharField(max_length=250, null=False, default='pl')
+    # Persisted sort key used to sample random activities through an index
+    random_key = models.FloatField(default=generate_random_key, db_index=True)
+    # Engagement counters, updated together with the rows they count and
+    # recomputed by the `reconcile_counters` command
+    like_count = models.IntegerField(default=0)
+    save_count = models.IntegerField(default=0)
+    comment_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    content_hash = models.CharField(max_length=64, null=True)
+    # Identity of the activity in the resource it was migrated from
+    external_source = models.CharField(max_length=250, null=True)
+    external_id = models.CharField(max_length=250, null=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['external_source', 'external_id'], name='unique_external_id'),
+            UniqueConstraint(
+                fields=['content_hash'],
+                condition=Q(destination_resource='open_street_map'),
+                name='unique_open_street_map_content'
+            )
+        ]
 
     def __str__(self):
         return self.name
 
+    def update_content_hash(self):
+        self.content_hash = compute_content_hash(self.name, self.images, self.description)
+
+    def save(self, *args, **kwargs):
+        self.update_content_hash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'name', 'images', 'description'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'content_hash'}
+        super().save(*args, **kwargs)
+
+    @property
+    def rating_avg(self):
+        if not self.comment_count:
+            return None
+        return self.rating_sum / self.comment_count
+
 
 class Like(models.Model):
     activity = models.ForeignKey(Entity, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['activity', 'user'],
+                name='unique_like'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='like_user_created_at_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.activity.name}"
 
@@ -82,5 +163,13 @@ class Save(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['activity', 'user'],
+                name='unique_save'
+            )
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.activity.name}"
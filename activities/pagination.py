@@ -0,0 +1,27 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, id):
+    value = json.dumps([created_at.isoformat(), id])
+    return urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, id = json.loads(urlsafe_b64decode(cursor.encode()))
+        created_at = parse_datetime(created_at)
+    except (BinasciiError, ValueError, TypeError, AttributeError):
+        raise InvalidCursor(f'Invalid cursor: {cursor}')
+
+    if created_at is None or not isinstance(id, int):
+        raise InvalidCursor(f'Invalid cursor: {cursor}')
+
+    return created_at, id
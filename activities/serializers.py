@@ -1,4 +1,7 @@
 from math import radians, sin, cos, sqrt, atan2
+
+from django.db import models
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 
 from utils.geo_utils import Location
@@ -29,6 +32,33 @@ class CommentSerializer(serializers.ModelSerializer):
         return obj.user.username
 
 
+def get_request_user(context):
+    request = context.get('request')
+    if not request or not hasattr(request, 'user') or request.user.is_anonymous:
+        return None
+    return request.user
+
+
+class ActivityListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Loads relations of the whole list upfront, so serializing N activities
+        # costs a fixed number of queries instead of a few per activity
+        activities = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+
+        prefetch_related_objects(activities, *ActivitySerializer.prefetch_lookups())
+
+        user = get_request_user(self.context)
+        if user is not None:
+            self.context['liked_activity_ids'] = set(
+                ActivityLike.objects.filter(
+                    user=user,
+                    activity__in=activities
+                ).values_list('activity_id', flat=True)
+            )
+
+        return super().to_representation(activities)
+
+
 class ActivitySerializer(serializers.ModelSerializer):
     liked_by_user = serializers.SerializerMethodField()
     # coordinates = serializers.SerializerMethodField()
@@ -36,21 +66,32 @@ class ActivitySerializer(serializers.ModelSerializer):
     address = AddressSerializer(read_only=True)
     external_links = ExternalLinksSerializer()
     comments = serializers.SerializerMethodField()
+    rating_avg = serializers.FloatField(read_only=True)
 
     class Meta:
         model = ActivityEntity
-        fields = '__all__'
+        # Sampling key and content hash are internal to the feed and the migrations
+        exclude = ['random_key', 'content_hash']
+        read_only_fields = [
+            'like_count', 'save_count', 'comment_count', 'rating_sum', 'external_source', 'external_id'
+        ]
+        list_serializer_class = ActivityListSerializer
+
+    @staticmethod
+    def prefetch_lookups():
+        return [
+            'address',
+            'external_links',
+            Prefetch('comment_set', queryset=ActivityComment.objects.select_related('user')),
+        ]
 
     def get_liked_by_user(self, obj):
-        if (
-                not self.context.get('request') or
-                not hasattr(self.context['request'], 'user')
-        ):
+        user = get_request_user(self.context)
+        if user is None:
             return False
 
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
+        if 'liked_activity_ids' in self.context:
+            return obj.id in self.context['liked_activity_ids']
         return ActivityLike.objects.filter(activity=obj, user=user).exists()
 
     def get_distance(self, obj):
@@ -60,8 +101,7 @@ class ActivitySerializer(serializers.ModelSerializer):
         return None
 
     def get_comments(self, obj):
-        # Filter comments related to the current activity
-        comments = ActivityComment.objects.filter(activity=obj)
+        comments = obj.comment_set.all()
         return CommentSerializer(comments, many=True).data
 
 
@@ -0,0 +1,53 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_activities
+from .models import Entity as ActivityEntity, Address, ExternalLinks
+from .spatial_index import get_spatial_index, spatial_index_enabled
+
+
+def update_spatial_index(activity_id, address):
+    spatial_index = get_spatial_index()
+
+    if address is None or address.latitude is None or address.longitude is None:
+        spatial_index.delete(activity_id)
+    else:
+        spatial_index.insert(activity_id, address.latitude, address.longitude)
+
+
+@receiver(post_save, sender=ActivityEntity)
+def activity_saved(sender, instance, **kwargs):
+    invalidate_activities([instance.id])
+
+    if spatial_index_enabled():
+        update_spatial_index(instance.id, instance.address)
+
+
+@receiver(post_delete, sender=ActivityEntity)
+def activity_deleted(sender, instance, **kwargs):
+    invalidate_activities([instance.id])
+
+    if spatial_index_enabled():
+        get_spatial_index().delete(instance.id)
+
+
+@receiver(post_save, sender=Address)
+def address_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+
+    activity_ids = list(ActivityEntity.objects.filter(address=instance).values_list('id', flat=True))
+    invalidate_activities(activity_ids)
+
+    if spatial_index_enabled():
+        for activity_id in activity_ids:
+            update_spatial_index(activity_id, instance)
+
+
+@receiver(post_save, sender=ExternalLinks)
+def external_links_saved(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_activities(
+            ActivityEntity.objects.filter(external_links=instance).values_list('id', flat=True)
+        )
+
@@ -0,0 +1,399 @@
+import heapq
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+
+EARTH_RADIUS = 6371.0
+# Queries hydrating the nearest activities, when some of them are filtered out
+MAX_HYDRATION_ROUNDS = 3
+
+logger = logging.getLogger(__name__)
+
+
+def to_unit_vectors(latitudes, longitudes):
+    # Points on the unit sphere: the chord length between two of them is
+    # monotonic with the great-circle distance, so nearest-first order is kept
+    latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+    longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_latitudes = np.cos(latitudes)
+
+    return np.column_stack((
+        cos_latitudes * np.cos(longitudes),
+        cos_latitudes * np.sin(longitudes),
+        np.sin(latitudes),
+    ))
+
+
+def chord_to_distance(squared_chord):
+    chord = np.sqrt(squared_chord)
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(chord / 2, 1.0))
+
+
+class KDTree:
+    def __init__(self, points, leaf_size=64):
+        count = len(points)
+        order = np.arange(count)
+        lower, upper, left, right, start, end = [], [], [], [], [], []
+
+        def add_node(node_start, node_end):
+            node_points = points[order[node_start:node_end]]
+            lower.append(node_points.min(axis=0) if count else np.zeros(3))
+            upper.append(node_points.max(axis=0) if count else np.zeros(3))
+            left.append(-1)
+            right.append(-1)
+            start.append(node_start)
+            end.append(node_end)
+            return len(start) - 1
+
+        stack = [add_node(0, count)]
+        while stack:
+            node = stack.pop()
+            node_start, node_end = start[node], end[node]
+            if node_end - node_start <= leaf_size:
+                continue
+
+            axis = int(np.argmax(upper[node] - lower[node]))
+            middle = (node_start + node_end) // 2
+            node_order = order[node_start:node_end]
+            partition = np.argpartition(points[node_order, axis], middle - node_start)
+            order[node_start:node_end] = node_order[partition]
+
+            left[node] = add_node(node_start, middle)
+            right[node] = add_node(middle, node_end)
+            stack.extend((left[node], right[node]))
+
+        self.points = points[order]
+        self.positions = order
+        self.lower = np.array(lower)
+        self.upper = np.array(upper)
+        self.left = left
+        self.right = right
+        self.start = start
+        self.end = end
+
+    def _box_distance(self, node, target):
+        below = np.maximum(self.lower[node] - target, 0)
+        above = np.maximum(target - self.upper[node], 0)
+        return float(np.sum((below + above) ** 2))
+
+    def query(self, target, count, accept):
+        """
+        Returns up to `count` (squared chord, position) pairs nearest to
+        `target`, skipping positions rejected by the `accept` mask function.
+        """
+        best = []
+        nodes = [(0.0, 0)]
+
+        while nodes:
+            bound, node = heapq.heappop(nodes)
+            if len(best) >= count and bound > -best[0][0]:
+                break
+
+            if self.left[node] >= 0:
+                for child in (self.left[node], self.right[node]):
+                    heapq.heappush(nodes, (self._box_distance(child, target), child))
+                continue
+
+            node_slice = slice(self.start[node], self.end[node])
+            positions = self.positions[node_slice]
+            distances = np.sum((self.points[node_slice] - target) ** 2, axis=1)
+
+            mask = accept(positions)
+            distances, positions = distances[mask], positions[mask]
+            if len(distances) > count:
+                nearest = np.argpartition(distances, count - 1)[:count]
+                distances, positions = distances[nearest], positions[nearest]
+
+            for distance, position in zip(distances.tolist(), positions.tolist()):
+                if len(best) < count:
+                    heapq.heappush(best, (-distance, position))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, position))
+
+        return sorted((-distance, position) for distance, position in best)
+
+
+class ActivitySpatialIndex:
+    """
+    In-memory nearest-neighbour index over activity coordinates.
+
+    The tree itself is static: inserts go to a small brute-force buffer and
+    deletes only mark entries as dead, both are folded in by the next rebuild.
+    """
+
+    def __init__(self, ids=None, latitudes=None, longitudes=None, leaf_size=64, max_buffer_size=1000):
+        self.leaf_size = leaf_size
+        self.max_buffer_size = max_buffer_size
+        self.lock = threading.RLock()
+        self._build(
+            np.asarray(ids if ids is not None else [], dtype=np.int64),
+            np.asarray(latitudes if latitudes is not None else [], dtype=np.float64),
+            np.asarray(longitudes if longitudes is not None else [], dtype=np.float64),
+        )
+
+    def __len__(self):
+        return int(self.alive.sum()) + len(self.buffer)
+
+    def _build(self, ids, latitudes, longitudes):
+        ids, unique_positions = np.unique(ids[::-1], return_index=True)
+        unique_positions = len(latitudes) - 1 - unique_positions
+
+        self.ids = ids
+        self.latitudes = latitudes[unique_positions]
+        self.longitudes = longitudes[unique_positions]
+        self.alive = np.ones(len(ids), dtype=bool)
+        self.tree = KDTree(to_unit_vectors(self.latitudes, self.longitudes), self.leaf_size)
+        self.buffer = {}
+
+    def _position(self, activity_id):
+        position = int(np.searchsorted(self.ids, activity_id))
+        if position < len(self.ids) and self.ids[position] == activity_id:
+            return position
+        return None
+
+    def rebuild(self, ids=None, latitudes=None, longitudes=None):
+        with self.lock:
+            if ids is None:
+                ids = np.concatenate((self.ids[self.alive], np.fromiter(self.buffer.keys(), dtype=np.int64)))
+                latitudes = np.concatenate((self.latitudes[self.alive], [lat for lat, _ in self.buffer.values()]))
+                longitudes = np.concatenate((self.longitudes[self.alive], [lon for _, lon in self.buffer.values()]))
+
+            self._build(
+                np.asarray(ids, dtype=np.int64),
+                np.asarray(latitudes, dtype=np.float64),
+                np.asarray(longitudes, dtype=np.float64),
+            )
+
+    def insert(self, activity_id, latitude, longitude):
+        with self.lock:
+            position = self._position(activity_id)
+            if position is not None:
+                self.alive[position] = False
+
+            self.buffer[int(activity_id)] = (float(latitude), float(longitude))
+
+            if len(self.buffer) > self.max_buffer_size:
+                self.rebuild()
+
+    def delete(self, activity_id):
+        with self.lock:
+            position = self._position(activity_id)
+            if position is not None:
+                self.alive[position] = False
+
+            self.buffer.pop(int(activity_id), None)
+
+    def nearest(self, latitude, longitude, count, excluded_ids=()):
+        """
+        Returns up to `count` (activity id, distance in km) pairs nearest to the
+        given point, skipping `excluded_ids`.
+        """
+        if count <= 0:
+            return []
+
+        target = to_unit_vectors([latitude], [longitude])[0]
+        excluded_ids = np.unique(np.fromiter(excluded_ids, dtype=np.int64))
+
+        with self.lock:
+            ids, alive, tree, buffer = self.ids, self.alive, self.tree, dict(self.buffer)
+
+        def accept(positions):
+            return alive[positions] & ~np.isin(ids[positions], excluded_ids)
+
+        results = [
+            (distance, int(ids[position]))
+            for distance, position in tree.query(target, count, accept)
+        ]
+
+        excluded = set(excluded_ids.tolist())
+        buffer_ids = [activity_id for activity_id in buffer if activity_id not in excluded]
+        if buffer_ids:
+            buffer_points = to_unit_vectors(
+                [buffer[activity_id][0] for activity_id in buffer_ids],
+                [buffer[activity_id][1] for activity_id in buffer_ids],
+            )
+            buffer_distances = np.sum((buffer_points - target) ** 2, axis=1)
+            results.extend(zip(buffer_distances.tolist(), buffer_ids))
+            results.sort()
+
+        results = results[:count]
+        distances = chord_to_distance(np.array([distance for distance, _ in results]))
+        return [
+            (activity_id, float(distance))
+            for (_, activity_id), distance in zip(results, distances)
+        ]
+
+    def save(self, path):
+        with self.lock:
+            ids = np.concatenate((self.ids[self.alive], np.fromiter(self.buffer.keys(), dtype=np.int64)))
+            latitudes = np.concatenate((self.latitudes[self.alive], [lat for lat, _ in self.buffer.values()]))
+            longitudes = np.concatenate((self.longitudes[self.alive], [lon for _, lon in self.buffer.values()]))
+
+        np.savez(path, ids=ids, latitudes=latitudes, longitudes=longitudes)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['ids'], data['latitudes'], data['longitudes'])
+
+    @classmethod
+    def from_database(cls):
+        from .models import Entity as ActivityEntity
+
+        rows = ActivityEntity.objects.filter(
+            address__latitude__isnull=False,
+            address__longitude__isnull=False
+        ).values_list('id', 'address__latitude', 'address__longitude')
+
+        ids, latitudes, longitudes = [], [], []
+        for activity_id, latitude, longitude in rows.iterator(chunk_size=10000):
+            ids.append(activity_id)
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+
+        return cls(ids, latitudes, longitudes)
+
+
+_spatial_index = None
+_spatial_index_lock = threading.Lock()
+# When the index was loaded, and the modification time of the file it was loaded from
+_spatial_index_loaded_at = None
+_spatial_index_mtime = None
+
+
+def is_spatial_index_loaded():
+    return _spatial_index is not None
+
+
+def spatial_index_enabled():
+    # Before the first feed request the index is not loaded yet and will be
+    # built from the database anyway
+    return settings.ACTIVITIES_FEED_ENGINE == 'tree' and is_spatial_index_loaded()
+
+
+def load_spatial_index():
+    # Returns the index, with the modification time of its file
+    path = settings.ACTIVITIES_SPATIAL_INDEX_PATH
+    if path:
+        try:
+            mtime = os.path.getmtime(path)
+            return ActivitySpatialIndex.load(path), mtime
+        except FileNotFoundError:
+            logger.warning(f'Spatial index file {path} not found, building from database')
+
+    return ActivitySpatialIndex.from_database(), None
+
+
+def reload_spatial_index():
+    """
+    Replaces the index with the latest file written by `rebuild_spatial_index`
+    when it changed, or with a rebuild from the database when there is no
+    file, so that writes of other processes show up.
+    """
+    global _spatial_index, _spatial_index_mtime
+
+    try:
+        path = settings.ACTIVITIES_SPATIAL_INDEX_PATH
+        if path and _spatial_index_mtime is not None and os.path.exists(path) \
+                and os.path.getmtime(path) == _spatial_index_mtime:
+            return
+
+        spatial_index, mtime = load_spatial_index()
+        with _spatial_index_lock:
+            _spatial_index, _spatial_index_mtime = spatial_index, mtime
+        logger.info(f'Spatial index reloaded with {len(spatial_index)} activities')
+    except Exception as err:
+        logger.error(f'Error reloading the spatial index: {err}')
+    finally:
+        # The thread's connection is not reused by requests
+        connections.close_all()
+
+
+def get_spatial_index():
+    global _spatial_index, _spatial_index_loaded_at, _spatial_index_mtime
+
+    if _spatial_index is None:
+        with _spatial_index_lock:
+            if _spatial_index is None:
+                _spatial_index, _spatial_index_mtime = load_spatial_index()
+                _spatial_index_loaded_at = time.monotonic()
+                logger.info(f'Spatial index loaded with {len(_spatial_index)} activities')
+
+    interval = settings.ACTIVITIES_SPATIAL_INDEX_RELOAD_INTERVAL
+    if interval and time.monotonic() - _spatial_index_loaded_at >= interval:
+        with _spatial_index_lock:
+            stale = time.monotonic() - _spatial_index_loaded_at >= interval
+            if stale:
+                _spatial_index_loaded_at = time.monotonic()
+
+        # Requests keep using the current index while the next one is loaded
+        if stale:
+            threading.Thread(target=reload_spatial_index, name='spatial-index-reload', daemon=True).start()
+
+    return _spatial_index
+
+
+def refresh_spatial_index(activity_ids):
+    """
+    Brings the loaded index up to date with the given activities after bulk
+    writes, which send no model signals. Activities which no longer exist or
+    have no coordinates are removed.
+    """
+    if not spatial_index_enabled():
+        return
+
+    from .models import Entity as ActivityEntity
+
+    activity_ids = list(activity_ids)
+    coordinates = {
+        activity_id: (latitude, longitude)
+        for activity_id, latitude, longitude in ActivityEntity.objects.filter(id__in=activity_ids).values_list(
+            'id', 'address__latitude', 'address__longitude'
+        )
+    }
+
+    spatial_index = get_spatial_index()
+    for activity_id in activity_ids:
+        latitude, longitude = coordinates.get(activity_id, (None, None))
+        if latitude is None or longitude is None:
+            spatial_index.delete(activity_id)
+        else:
+            spatial_index.insert(activity_id, latitude, longitude)
+
+
+def tree_nearest_activities(queryset, latitude, longitude, count, excluded_ids=()):
+    """
+    Returns the `count` activities of `queryset` nearest to the given point,
+    with their `distance` set from the spatial index.
+
+    Activities the user has seen are passed as `excluded_ids` and skipped in
+    memory, so only the final `count` rows are hydrated. Filters of the
+    queryset only drop activities the index is behind on, which are replaced
+    by the next nearest ones in at most MAX_HYDRATION_ROUNDS queries.
+    """
+    spatial_index = get_spatial_index()
+    excluded_ids = set(excluded_ids)
+    activities = []
+
+    for _ in range(MAX_HYDRATION_ROUNDS):
+        nearest = spatial_index.nearest(latitude, longitude, count - len(activities), excluded_ids)
+        if not nearest:
+            break
+
+        activities_by_id = queryset.in_bulk([activity_id for activity_id, _ in nearest])
+        for activity_id, distance in nearest:
+            excluded_ids.add(activity_id)
+            activity = activities_by_id.get(activity_id)
+            if activity is not None:
+                activity.distance = distance
+                activities.append(activity)
+
+        if len(activities) >= count:
+            break
+
+    return activities
@@ -1,3 +1,582 @@
-from django.test import TestCase
+import random
+from datetime import timedelta
+from math import radians, degrees, sin, cos, asin, atan2
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from utils.geo_utils import EARTH_RADIUS, Geohash, Location, haversine_distances
+from .cache import activity_cache_key, get_activity_cache
+from .db_functions import add_activity_relations, nearest_activities
+from .models import Address, Entity as ActivityEntity, Like as ActivityLike, Save as ActivitySave, \
+    View as ActivityView, Comment as ActivityComment
+from .spatial_index import ActivitySpatialIndex, tree_nearest_activities
+from .view_buffer import ViewBuffer
+from .views import get_feed_queryset, get_seen_ids
+
+
+def destination(latitude, longitude, distance, bearing):
+    # Point `distance` km away from the given one in the direction `bearing` (radians)
+    lat1, lon1 = radians(latitude), radians(longitude)
+    angle = distance / EARTH_RADIUS
+
+    lat2 = asin(sin(lat1) * cos(angle) + cos(lat1) * sin(angle) * cos(bearing))
+    lon2 = lon1 + atan2(sin(bearing) * sin(angle) * cos(lat1), cos(angle) - sin(lat1) * sin(lat2))
+
+    return degrees(lat2), (degrees(lon2) + 180.0) % 360.0 - 180.0
+
+
+def create_activity(name, latitude, longitude):
+    address = Address.objects.create(latitude=latitude, longitude=longitude)
+    return ActivityEntity.objects.create(name=name, address=address, images=[f'https://example.com/{name}.jpg'])
+
+
+class GeohashBlockTests(SimpleTestCase):
+    def test_points_within_radius_lie_in_block(self):
+        generator = random.Random(1)
+
+        for _ in range(200):
+            latitude, longitude = generator.uniform(-80, 80), generator.uniform(-180, 180)
+            for precision in range(2, 7):
+                cells, radius = Geohash.block(latitude, longitude, precision)
+
+                for _ in range(20):
+                    point = destination(
+                        latitude, longitude, generator.uniform(0, radius) * 0.999, generator.uniform(0, 6.283)
+                    )
+                    self.assertIn(Geohash.encode(*point, precision), cells)
+
+
+class SpatialIndexTests(SimpleTestCase):
+    def test_nearest_matches_full_scan(self):
+        generator = np.random.default_rng(2)
+        ids = np.arange(1, 5001)
+        latitudes = generator.uniform(-60, 60, len(ids))
+        longitudes = generator.uniform(-180, 180, len(ids))
+
+        spatial_index = ActivitySpatialIndex(ids, latitudes, longitudes, leaf_size=16, max_buffer_size=50)
+        points = dict(zip(ids.tolist(), zip(latitudes.tolist(), longitudes.tolist())))
+
+        # Changes go through the buffer and the dead marks of the tree
+        for activity_id in generator.choice(ids, 100, replace=False).tolist():
+            spatial_index.delete(activity_id)
+            del points[activity_id]
+        for activity_id in range(5001, 5081):
+            points[activity_id] = (float(generator.uniform(-60, 60)), float(generator.uniform(-180, 180)))
+            spatial_index.insert(activity_id, *points[activity_id])
+
+        point_ids = np.array(list(points.keys()))
+        point_coordinates = np.array(list(points.values()))
+
+        for latitude, longitude in generator.uniform((-50, -170), (50, 170), (20, 2)).tolist():
+            excluded_ids = set(generator.choice(point_ids, 20, replace=False).tolist())
+            distances = haversine_distances(latitude, longitude, point_coordinates[:, 0], point_coordinates[:, 1])
+            expected = [
+                activity_id for activity_id in point_ids[np.argsort(distances)].tolist()
+                if activity_id not in excluded_ids
+            ][:25]
+
+            nearest = spatial_index.nearest(latitude, longitude, 25, excluded_ids)
+
+            self.assertEqual([activity_id for activity_id, _ in nearest], expected)
+
+
+class NearestActivitiesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generator = random.Random(3)
+        cls.center = (52.2297, 21.0122)
+
+        # A dense cluster around the center and a sparse spread around it, so
+        # both narrow and widened geohash blocks are searched
+        for index in range(60):
+            latitude, longitude = destination(*cls.center, generator.uniform(0, 3), generator.uniform(0, 6.283))
+            create_activity(f'near-{index}', latitude, longitude)
+        for index in range(200):
+            create_activity(
+                f'far-{index}',
+                cls.center[0] + generator.uniform(-8, 8),
+                cls.center[1] + generator.uniform(-8, 8)
+            )
+
+    def full_scan(self, latitude, longitude, count):
+        start = Location(latitude, longitude)
+        activities = ActivityEntity.objects.select_related('address')
+        return sorted(
+            activities,
+            key=lambda activity: Location.calculate_distance(
+                start, Location(activity.address.latitude, activity.address.longitude)
+            )
+        )[:count]
+
+    def test_nearest_activities_match_full_scan(self):
+        for latitude, longitude in [self.center, (52.5, 21.5), (48.0, 14.0)]:
+            for count in (1, 10, 70, 300):
+                with self.subTest(latitude=latitude, longitude=longitude, count=count):
+                    activities = nearest_activities(ActivityEntity.objects.all(), latitude, longitude, count)
+
+                    self.assertEqual(
+                        [activity.id for activity in activities],
+                        [activity.id for activity in self.full_scan(latitude, longitude, count)]
+                    )
+
+    def test_excluded_activities_are_skipped(self):
+        excluded_ids = [activity.id for activity in self.full_scan(*self.center, 5)]
+        queryset = ActivityEntity.objects.exclude(id__in=excluded_ids)
+
+        activities = nearest_activities(queryset, *self.center, 10)
+
+        self.assertEqual(
+            [activity.id for activity in activities],
+            [activity.id for activity in self.full_scan(*self.center, 15)][5:]
+        )
+
+    def test_tree_engine_matches_sql_engine(self):
+        spatial_index = ActivitySpatialIndex.from_database()
+
+        with mock.patch('activities.spatial_index.get_spatial_index', return_value=spatial_index):
+            for count in (5, 70):
+                activities = tree_nearest_activities(ActivityEntity.objects.all(), *self.center, count)
+
+                self.assertEqual(
+                    [activity.id for activity in activities],
+                    [activity.id for activity in nearest_activities(ActivityEntity.objects.all(), *self.center, count)]
+                )
+
+    def test_tree_engine_skips_seen_activities_in_memory(self):
+        user = User.objects.create(username='viewer')
+        seen = self.full_scan(*self.center, 50)
+        ActivityView.objects.bulk_create([ActivityView(user=user, activity=activity, viewed=True) for activity in seen])
+        queryset = get_feed_queryset(user, [])
+        spatial_index = ActivitySpatialIndex.from_database()
+
+        with mock.patch('activities.spatial_index.get_spatial_index', return_value=spatial_index):
+            # The views, then the final 10 rows
+            with self.assertNumQueries(2):
+                activities = tree_nearest_activities(queryset, *self.center, 10, get_seen_ids(user, []))
+
+        self.assertEqual(
+            [activity.id for activity in activities],
+            [activity.id for activity in self.full_scan(*self.center, 60)][50:]
+        )
+
+    def test_tree_engine_replaces_activities_missing_from_queryset(self):
+        spatial_index = ActivitySpatialIndex.from_database()
+        # Left in the index, as by another process's delete
+        hidden_ids = [activity.id for activity in self.full_scan(*self.center, 3)]
+
+        with mock.patch('activities.spatial_index.get_spatial_index', return_value=spatial_index):
+            activities = tree_nearest_activities(ActivityEntity.objects.exclude(id__in=hidden_ids), *self.center, 5)
+
+        self.assertEqual(
+            [activity.id for activity in activities],
+            [activity.id for activity in self.full_scan(*self.center, 8)][3:]
+        )
+
+
+class FeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='viewer')
+        cls.activities = [create_activity(f'activity-{index}', 50.0 + index / 100, 20.0) for index in range(30)]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_feed(self, count, **data):
+        response = self.client.post(
+            reverse('get-activities') + f'?count={count}', data, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [activity['id'] for activity in response.json()]
+
+    def test_seen_and_ignored_activities_are_excluded(self):
+        viewed_ids = [activity.id for activity in self.activities[:10]]
+        ActivityView.objects.bulk_create([
+            ActivityView(user=self.user, activity_id=activity_id, viewed=True) for activity_id in viewed_ids
+        ])
+        # Shown but not marked as viewed, so still served
+        ActivityView.objects.create(user=self.user, activity=self.activities[10])
+        ignored_ids = [activity.id for activity in self.activities[11:15]]
+
+        for data in ({}, {'latitude': 50.0, 'longitude': 20.0}):
+            with self.subTest(data=data):
+                activity_ids = self.get_feed(30, ignored_ids=ignored_ids, **data)
+
+                self.assertEqual(
+                    set(activity_ids),
+                    {activity.id for activity in self.activities} - set(viewed_ids) - set(ignored_ids)
+                )
+
+    def test_query_does_not_grow_with_views(self):
+        def feed_sql():
+            queryset = get_feed_queryset(self.user, [])
+            return str(queryset.query)
+
+        ActivityView.objects.create(user=self.user, activity=self.activities[0], viewed=True)
+        sql = feed_sql()
+
+        ActivityView.objects.bulk_create([
+            ActivityView(user=self.user, activity=activity, viewed=True) for activity in self.activities[1:]
+        ])
+
+        self.assertEqual(feed_sql(), sql)
+        self.assertEqual(self.get_feed(10), [])
+
+
+class ViewBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='viewer')
+        cls.activities = [create_activity(f'activity-{index}', 50.0 + index / 100, 20.0) for index in range(6)]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+        # Flushed by the tests rather than by the background thread
+        self.view_buffer = ViewBuffer(max_size=1000, interval=60)
+        for target in (
+                'activities.views.get_view_buffer',
+                'activities.async_views.get_view_buffer'
+        ):
+            patcher = mock.patch(target, return_value=self.view_buffer)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(ViewBuffer, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_feed(self, name='get-activities'):
+        response = self.client.post(reverse(name) + '?count=6', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return {activity['id'] for activity in response.json()}
+
+    def test_viewed_marks_are_not_buffered(self):
+        for prefix in ('', 'async-'):
+            with self.subTest(prefix=prefix):
+                ActivityView.objects.all().delete()
+
+                # Served views wait in the buffer
+                shown_ids = self.get_feed(f'{prefix}get-activities')
+                self.assertEqual(shown_ids, {activity.id for activity in self.activities})
+                self.assertFalse(ActivityView.objects.exists())
+
+                # Marks are written right away, so feeds of any process skip them
+                viewed_ids = sorted(shown_ids)[:2]
+                response = self.client.post(
+                    reverse(f'{prefix}track-views'), {'activityIds': viewed_ids}, content_type='application/json'
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    set(ActivityView.objects.filter(viewed=True).values_list('activity_id', flat=True)),
+                    set(viewed_ids)
+                )
+                self.assertEqual(self.get_feed(f'{prefix}get-activities'), shown_ids - set(viewed_ids))
+
+                # The buffered views do not undo the marks
+                self.view_buffer.flush()
+                self.assertEqual(
+                    dict(ActivityView.objects.values_list('activity_id', 'viewed')),
+                    {activity_id: activity_id in viewed_ids for activity_id in shown_ids}
+                )
+
+    def test_flush_skips_deleted_users_and_activities(self):
+        other = User.objects.create(username='other')
+        self.view_buffer.add(self.user.id, [activity.id for activity in self.activities[:3]])
+        self.view_buffer.add(other.id, [self.activities[0].id])
+        self.view_buffer.add(self.user.id, [self.activities[1].id])
+
+        self.activities[2].delete()
+        other.delete()
+        self.view_buffer.flush()
+
+        self.assertEqual(
+            sorted(ActivityView.objects.values_list('user_id', 'activity_id')),
+            [(self.user.id, self.activities[0].id), (self.user.id, self.activities[1].id)]
+        )
+        self.assertFalse(self.view_buffer.pending)
+
+
+class LikedActivitiesPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='liker')
+        other = User.objects.create(username='other')
+
+        activities = [create_activity(f'activity-{index}', 50.0 + index / 100, 20.0) for index in range(11)]
+        liked_at = timezone.now()
+        for index, activity in enumerate(activities):
+            like = ActivityLike.objects.create(user=cls.user, activity=activity)
+            # Several likes share a timestamp, so pages have to break ties on the like id
+            ActivityLike.objects.filter(id=like.id).update(created_at=liked_at - timedelta(minutes=index // 3))
+        ActivityLike.objects.create(user=other, activity=activities[0])
+
+        cls.expected_ids = list(
+            ActivityLike.objects.filter(user=cls.user).order_by('-created_at', '-id').values_list(
+                'activity_id', flat=True
+            )
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def walk_pages(self, page_size, **data):
+        activity_ids, cursor = [], None
+        while True:
+            response = self.client.post(
+                reverse('liked-activities'),
+                dict(data, page_size=page_size, cursor=cursor),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+
+            results = response.json()['results']
+            self.assertLessEqual(len(results), page_size)
+            activity_ids += [activity['id'] for activity in results]
+            cursor = response.json()['next_cursor']
+            if cursor is None:
+                return activity_ids
+
+    def test_pages_have_no_gaps_or_duplicates(self):
+        for page_size in (1, 3, 4, 11, 20):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.walk_pages(page_size), self.expected_ids)
+
+    def test_distance_only_with_location(self):
+        response = self.client.post(reverse('liked-activities'), {}, content_type='application/json')
+        self.assertIsNone(response.json()['results'][0]['distance'])
+
+        self.assertEqual(self.walk_pages(4, latitude=50.0, longitude=20.0), self.expected_ids)
+        response = self.client.post(
+            reverse('liked-activities'), {'latitude': 50.0, 'longitude': 20.0}, content_type='application/json'
+        )
+        self.assertIsNotNone(response.json()['results'][0]['distance'])
+
+    def test_invalid_page_size_or_cursor(self):
+        for data in ({'page_size': 0}, {'page_size': -1}, {'page_size': 'many'}, {'cursor': 'not-a-cursor'}):
+            with self.subTest(data=data):
+                response = self.client.post(reverse('liked-activities'), data, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+
+
+class ActivityRelationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user')
+        cls.activity = create_activity('activity', 50.0, 20.0)
+        cls.other_activity = create_activity('other', 51.0, 21.0)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post(self, name, activity_id):
+        return self.client.post(reverse(name, args=[activity_id]))
+
+    def assert_state(self, model, counter_field, count):
+        self.activity.refresh_from_db()
+        self.assertEqual(model.objects.filter(user=self.user, activity=self.activity).count(), count)
+        self.assertEqual(getattr(self.activity, counter_field), count)
+
+    def test_relations_are_idempotent(self):
+        for name, remove_name, model, counter_field in (
+                ('like-activity', 'unlike-activity', ActivityLike, 'like_count'),
+                ('save-activity', 'unsave-activity', ActivitySave, 'save_count')
+        ):
+            with self.subTest(name=name):
+                for _ in range(2):
+                    # One statement, whether the row is added or already there
+                    with self.assertNumQueries(1):
+                        add_activity_relations(model, counter_field, self.user.id, [self.activity.id])
+                    self.assertEqual(self.post(name, self.activity.id).status_code, 200)
+                    self.assert_state(model, counter_field, 1)
+
+                for _ in range(2):
+                    self.assertEqual(self.post(remove_name, self.activity.id).status_code, 200)
+                    self.assert_state(model, counter_field, 0)
+
+        self.other_activity.refresh_from_db()
+        self.assertEqual((self.other_activity.like_count, self.other_activity.save_count), (0, 0))
+
+    def test_unknown_activity(self):
+        missing_id = ActivityEntity.objects.order_by('-id').first().id + 1
+
+        for name in ('like-activity', 'unlike-activity', 'save-activity', 'unsave-activity'):
+            for activity_id in (missing_id, 'abc'):
+                with self.subTest(name=name, activity_id=activity_id):
+                    self.assertEqual(self.post(name, activity_id).status_code, 404)
+
+        found, added = add_activity_relations(
+            ActivityLike, 'like_count', self.user.id, [self.activity.id, missing_id]
+        )
+        self.assertEqual((found, added), ({self.activity.id}, {self.activity.id}))
+
+    def test_duplicate_through_viewset(self):
+        ActivityLike.objects.create(user=self.user, activity=self.activity)
+
+        response = self.client.post(
+            '/api/activities/activity-likes/', {'user': self.user.id, 'activity': self.activity.id}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ActivityLike.objects.filter(user=self.user, activity=self.activity).count(), 1)
+
+
+class CommentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user')
+        cls.activity = create_activity('activity', 50.0, 20.0)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create_comment(self, rating):
+        return self.client.post(
+            '/api/activities/comments/',
+            {'activity': self.activity.id, 'comment': 'Nice', 'rating': rating},
+            content_type='application/json'
+        )
+
+    def test_counters_follow_comments(self):
+        self.assertEqual(self.create_comment(4).status_code, 201)
+        self.assertEqual(self.create_comment('2').status_code, 201)
+
+        self.activity.refresh_from_db()
+        self.assertEqual((self.activity.comment_count, self.activity.rating_sum), (2, 6))
+
+    def test_invalid_rating(self):
+        for rating in ('great', None, [4], 4.5, True):
+            with self.subTest(rating=rating):
+                self.assertEqual(self.create_comment(rating).status_code, 400)
+
+        self.activity.refresh_from_db()
+        self.assertFalse(ActivityComment.objects.exists())
+        self.assertEqual((self.activity.comment_count, self.activity.rating_sum), (0, 0))
+
+
+class ActivityCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user')
+        cls.activity = create_activity('activity', 50.0, 20.0)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = f'/api/activities/activities/{self.activity.id}/'
+
+    def test_retrieve_malformed_id(self):
+        self.assertEqual(self.client.get('/api/activities/activities/abc/').status_code, 404)
+
+    def test_writes_invalidate_the_shared_cache(self):
+        self.assertEqual(self.client.get(self.url).json()['name'], 'activity')
+        self.assertIsNotNone(get_activity_cache().get(activity_cache_key(self.activity.id)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.activity.name = 'renamed'
+            self.activity.save()
+
+        self.assertIsNone(get_activity_cache().get(activity_cache_key(self.activity.id)))
+        self.assertEqual(self.client.get(self.url).json()['name'], 'renamed')
+
+    def test_counters_and_comments_are_read_on_every_request(self):
+        self.client.get(self.url)
+
+        ActivityEntity.objects.filter(id=self.activity.id).update(like_count=3)
+        ActivityComment.objects.create(user=self.user, activity=self.activity, comment='Nice', rating=4)
+
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['like_count'], 3)
+        self.assertEqual([comment['comment'] for comment in data['comments']], ['Nice'])
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user')
+        cls.activities = [create_activity(f'activity-{index}', 50.0 + index / 100, 20.0) for index in range(5)]
+        for activity in cls.activities[:3]:
+            ActivityLike.objects.create(user=cls.user, activity=activity)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_relations_match_sync_views(self):
+        activity = self.activities[4]
+
+        for name, model, counter_field in (
+                ('like-activity', ActivityLike, 'like_count'),
+                ('save-activity', ActivitySave, 'save_count')
+        ):
+            remove_name = name.replace('like-', 'unlike-').replace('save-', 'unsave-')
+            with self.subTest(name=name):
+                # Without a body, as a form and as JSON, like the sync views
+                for options in ({}, {'data': {'source': 'feed'}}, {'data': {}, 'content_type': 'application/json'}):
+                    response = self.client.post(reverse(f'async-{name}', args=[activity.id]), **options)
+                    self.assertEqual(response.status_code, 200)
+
+                self.assertEqual(model.objects.filter(user=self.user, activity=activity).count(), 1)
+                activity.refresh_from_db()
+                self.assertEqual(getattr(activity, counter_field), 1)
+
+                for _ in range(2):
+                    response = self.client.post(reverse(f'async-{remove_name}', args=[activity.id]))
+                    self.assertEqual(response.status_code, 200)
+
+                self.assertFalse(model.objects.filter(user=self.user, activity=activity).exists())
+                activity.refresh_from_db()
+                self.assertEqual(getattr(activity, counter_field), 0)
+
+    def test_unknown_activity(self):
+        missing_id = ActivityEntity.objects.order_by('-id').first().id + 1
+
+        for name in ('like-activity', 'unlike-activity', 'save-activity', 'unsave-activity'):
+            for activity_id in (missing_id, 'abc'):
+                with self.subTest(name=name, activity_id=activity_id):
+                    sync_response = self.client.post(reverse(name, args=[activity_id]))
+                    response = self.client.post(reverse(f'async-{name}', args=[activity_id]))
+
+                    self.assertEqual(sync_response.status_code, 404)
+                    self.assertEqual(response.status_code, 404)
+
+    def test_liked_page_matches_sync_view(self):
+        data = {'page_size': 2}
+
+        sync_response = self.client.post(reverse('liked-activities'), data, content_type='application/json')
+        response = self.client.post(reverse('async-liked-activities'), data, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), sync_response.json())
+
+    def test_feed_and_tracked_views(self):
+        response = self.client.post(
+            reverse('async-get-activities') + '?count=2', {'ignored_ids': []}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        shown_ids = [activity['id'] for activity in response.json()]
+        self.assertEqual(len(shown_ids), 2)
+
+        response = self.client.post(
+            reverse('async-track-views'), {'activityIds': shown_ids}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(ActivityView.objects.filter(user=self.user, viewed=True).values_list('activity_id', flat=True)),
+            set(shown_ids)
+        )
+
+        # Like their sync views, the feed and view tracking only accept JSON
+        response = self.client.post(reverse('async-track-views'), {'activityIds': shown_ids})
+        self.assertEqual(response.status_code, 415)
+
+    def test_anonymous_request(self):
+        self.client.logout()
+
+        response = self.client.post(reverse('async-like-activity', args=[self.activities[0].id]))
+        sync_response = self.client.post(reverse('like-activity', args=[self.activities[0].id]))
+
+        self.assertIn(response.status_code, (401, 403))
+        self.assertEqual(response.status_code, sync_response.status_code)
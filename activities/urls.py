@@ -1,8 +1,10 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
+from . import async_views
 from .views import ActivityViewSet, ActivityLikeViewSet, ActivitySaveViewSet, get_some_activities, like_activity, \
-    unlike_activity, get_liked_activities, track_views, CommentViewSet
+    unlike_activity, save_activity, unsave_activity, get_liked_activities, track_views, track_interactions, CommentViewSet
 
 router = DefaultRouter()
 router.register(r'activities', ActivityViewSet)
@@ -10,11 +12,26 @@ router.register(r'activity-likes', ActivityLikeViewSet)
 router.register(r'activity-save', ActivitySaveViewSet)
 router.register(r'comments', CommentViewSet)
 
+# Routes with an async view: (route, name, sync view, async view)
+ASYNC_ROUTES = [
+    ('get-activities/', 'get-activities', get_some_activities, async_views.get_some_activities),
+    ('like-activity/<str:activity_id>/', 'like-activity', like_activity, async_views.like_activity),
+    ('unlike-activity/<str:activity_id>/', 'unlike-activity', unlike_activity, async_views.unlike_activity),
+    ('save-activity/<str:activity_id>/', 'save-activity', save_activity, async_views.save_activity),
+    ('unsave-activity/<str:activity_id>/', 'unsave-activity', unsave_activity, async_views.unsave_activity),
+    ('liked-activities/', 'liked-activities', get_liked_activities, async_views.get_liked_activities),
+    ('track-views/', 'track-views', track_views, async_views.track_views),
+]
+
 urlpatterns = [
     path('', include(router.urls)),
-    path('get-activities/', get_some_activities, name='get-activities'),
-    path('like-activity/<str:activity_id>/', like_activity, name='like-activity'),
-    path('unlike-activity/<str:activity_id>/', unlike_activity, name='unlike-activity'),
-    path('liked-activities/', get_liked_activities, name='liked-activities'),
-    path('track-views/', track_views, name='track-views')
+    *[
+        path(route, async_view if name in settings.ACTIVITIES_ASYNC_VIEWS else sync_view, name=name)
+        for route, name, sync_view, async_view in ASYNC_ROUTES
+    ],
+    path('interactions/', track_interactions, name='interactions'),
+    *[
+        path(f'async/{route}', async_view, name=f'async-{name}')
+        for route, name, _, async_view in ASYNC_ROUTES
+    ]
 ]
@@ -0,0 +1,118 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+
+from .models import Entity as ActivityEntity, View as ActivityView
+
+logger = logging.getLogger(__name__)
+
+
+class ViewBuffer:
+    """
+    Write-behind buffer of the views of served activities. Views are gathered
+    in process and written by a background thread every `interval` seconds,
+    or as soon as `max_size` views are waiting.
+
+    Only these impressions are buffered: the feed does not read them, while
+    the activities marked as viewed, which it skips, are written right away
+    (see `mark_viewed`) so that every process sees them.
+    """
+
+    def __init__(self, max_size, interval):
+        self.max_size = max_size
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        # {user_id: {activity_id}}, pending and being written
+        self.pending = {}
+        self.flushing = {}
+        self.size = 0
+        atexit.register(self.flush)
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, name='view-buffer', daemon=True)
+            self.thread.start()
+
+    def merge(self, views):
+        # Called with the lock held
+        for user_id, activity_ids in views.items():
+            pending_views = self.pending.setdefault(user_id, set())
+            self.size += len(activity_ids - pending_views)
+            pending_views |= activity_ids
+
+    def add(self, user_id, activity_ids):
+        with self.lock:
+            self.merge({user_id: set(activity_ids)})
+            size = self.size
+
+        self.start()
+        if size >= self.max_size:
+            self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.flush()
+            # The thread's connection is not reused by requests
+            connections.close_all()
+
+    def flush(self):
+        with self.lock:
+            if self.flushing or not self.pending:
+                return
+            self.flushing, self.pending, self.size = self.pending, {}, 0
+
+        try:
+            # Activities or users deleted in the meantime would fail the whole insert
+            existing_activities = set(
+                ActivityEntity.objects.filter(
+                    id__in={activity_id for activity_ids in self.flushing.values() for activity_id in activity_ids}
+                ).values_list('id', flat=True)
+            )
+            existing_users = set(User.objects.filter(id__in=self.flushing.keys()).values_list('id', flat=True))
+            views = [
+                ActivityView(user_id=user_id, activity_id=activity_id)
+                for user_id, activity_ids in self.flushing.items()
+                if user_id in existing_users
+                for activity_id in activity_ids
+                if activity_id in existing_activities
+            ]
+
+            # Views marked as viewed in the meantime are left as they are
+            ActivityView.objects.bulk_create(views, ignore_conflicts=True)
+            logger.debug(f'{len(views)} buffered views written')
+        except Exception as err:
+            # Kept for the next flush
+            logger.error(f'Error writing buffered views: {err}')
+            with self.lock:
+                self.merge(self.flushing)
+        finally:
+            with self.lock:
+                self.flushing = {}
+
+
+_view_buffer = None
+_view_buffer_lock = threading.Lock()
+
+
+def get_view_buffer():
+    """
+    Returns the process' view buffer, or None when ACTIVITIES_VIEW_BUFFER is
+    off and views are written on the request path.
+    """
+    global _view_buffer
+
+    if not settings.ACTIVITIES_VIEW_BUFFER:
+        return None
+
+    with _view_buffer_lock:
+        if _view_buffer is None:
+            _view_buffer = ViewBuffer(settings.ACTIVITIES_VIEW_BUFFER_SIZE, settings.ACTIVITIES_VIEW_BUFFER_INTERVAL)
+        return _view_buffer
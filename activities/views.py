@@ -1,3 +1,7 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, F, Q, FilteredRelation
+from django.http import Http404
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.parsers import JSONParser
@@ -5,14 +9,59 @@ from rest_framework.response import Response
 
 from utils.decorators.timeit_decorator import timeit_decorator
 from utils.geo_utils import Location
-from .db_functions import annotate_with_distance
+from .cache import serialize_activities
+from .db_functions import annotate_with_distance, nearest_activities, random_activities, update_activity_counters, \
+    add_activity_relations, remove_activity_relations
+from .interactions import apply_interactions
 from .models import Entity as ActivityEntity, View as ActivityView, Like as ActivityLike, Save as ActivitySave, \
     Comment as ActivityComment
+from .pagination import encode_cursor, decode_cursor, InvalidCursor
+from .spatial_index import tree_nearest_activities
+from .view_buffer import get_view_buffer
 from .serializers import ActivitySerializer, ActivityLikeSerializer, ActivitySaveSerializer, \
     CommentSerializer
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class ActivityCountersMixin:
+    """
+    Keeps the activity counter named by `counter_field` in sync with the rows
+    created, moved or deleted through a viewset.
+    """
+    counter_field = None
+
+    def get_counter_deltas(self, instance, sign):
+        return {self.counter_field: sign}
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        instance = serializer.save()
+        update_activity_counters(instance.activity_id, **self.get_counter_deltas(instance, 1))
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        previous_activity_id = serializer.instance.activity_id
+        previous_deltas = self.get_counter_deltas(serializer.instance, -1)
+
+        instance = serializer.save()
+        update_activity_counters(previous_activity_id, **previous_deltas)
+        update_activity_counters(instance.activity_id, **self.get_counter_deltas(instance, 1))
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        update_activity_counters(instance.activity_id, **self.get_counter_deltas(instance, -1))
+        instance.delete()
+
+
+def get_rating(data):
+    # Raises TypeError or ValueError for a rating which is not an integer
+    rating = data.get('rating', 0)
+    if isinstance(rating, bool) or int(rating) != float(rating):
+        raise ValueError('Rating must be an integer')
+
+    return int(rating)
+
+
+class CommentViewSet(ActivityCountersMixin, viewsets.ModelViewSet):
     queryset = ActivityComment.objects.all()
     serializer_class = CommentSerializer
 
@@ -21,22 +70,32 @@ class CommentViewSet(viewsets.ModelViewSet):
         context['request'] = self.request
         return context
 
+    def get_counter_deltas(self, instance, sign):
+        return {'comment_count': sign, 'rating_sum': sign * instance.rating}
+
     def create(self, request, *args, **kwargs):
         user = request.user
         activity_id = request.data.get('activity')
         activity = ActivityEntity.objects.get(id=activity_id)
         comment = request.data.get('comment')
-        rating = request.data.get('rating', 0)
-        ActivityComment.objects.create(
-            user=user,
-            activity=activity,
-            comment=comment,
-            rating=rating,
-        )
+        try:
+            rating = get_rating(request.data)
+        except (TypeError, ValueError):
+            return Response({'message': 'Invalid rating'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            activity_comment = ActivityComment.objects.create(
+                user=user,
+                activity=activity,
+                comment=comment,
+                rating=rating,
+            )
+            update_activity_counters(activity.id, **self.get_counter_deltas(activity_comment, 1))
+
         return Response({'message': 'Comment created'}, status=status.HTTP_201_CREATED)
 
 class ActivityViewSet(viewsets.ModelViewSet):
-    queryset = ActivityEntity.objects.all()
+    queryset = ActivityEntity.objects.prefetch_related(*ActivitySerializer.prefetch_lookups())
     serializer_class = ActivitySerializer
 
     def get_serializer_context(self):
@@ -44,69 +103,159 @@ class ActivityViewSet(viewsets.ModelViewSet):
         context['request'] = self.request
         return context
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+
+        page = self.paginate_queryset(queryset.prefetch_related(None).values_list('id', flat=True))
+        if page is not None:
+            queryset = queryset.filter(id__in=page)
+            return self.get_paginated_response(serialize_activities(queryset, request))
+
+        return Response(serialize_activities(queryset, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: kwargs[lookup_url_kwarg]}
+            )
+        except (ValueError, TypeError):
+            raise Http404
+
+        data = serialize_activities(queryset, request)
+        if not data:
+            raise Http404
+
+        return Response(data[0])
+
+
+def toggle_activity_relation(request, activity_id, model, counter_field, add, message):
+    # A single statement, which also tells whether the activity exists
+    try:
+        activity_id = int(activity_id)
+    except ValueError:
+        raise Http404
+
+    change_relations = add_activity_relations if add else remove_activity_relations
+    found, _ = change_relations(model, counter_field, request.user.id, [activity_id])
+    if not found:
+        raise Http404
+
+    return Response({'message': message}, status=status.HTTP_200_OK)
+
 
 @api_view(['POST'])
 def like_activity(request, activity_id):
-    activity = ActivityEntity.objects.get(id=activity_id)
-    ActivityLike.objects.create(
-        user=request.user,
-        activity=activity
-    )
-    return Response({'message': 'Activity liked'}, status=status.HTTP_200_OK)
+    return toggle_activity_relation(request, activity_id, ActivityLike, 'like_count', True, 'Activity liked')
 
 
 @api_view(['POST'])
 def unlike_activity(request, activity_id):
-    activity = ActivityEntity.objects.get(id=activity_id)
-    ActivityLike.objects.filter(user=request.user, activity=activity).delete()
-    return Response({'message': 'Activity unliked'}, status=status.HTTP_200_OK)
+    return toggle_activity_relation(request, activity_id, ActivityLike, 'like_count', False, 'Activity unliked')
+
+
+@api_view(['POST'])
+def save_activity(request, activity_id):
+    return toggle_activity_relation(request, activity_id, ActivitySave, 'save_count', True, 'Activity saved')
+
+
+@api_view(['POST'])
+def unsave_activity(request, activity_id):
+    return toggle_activity_relation(request, activity_id, ActivitySave, 'save_count', False, 'Activity unsaved')
+
+
+def get_feed_queryset(user, ignored_ids):
+    """
+    Returns the activities the user has not seen and did not ignore.
+    """
+    # Anti-join against the user's views, so the query size does not grow
+    # with the number of activities the user has already seen
+    viewed_activities = ActivityView.objects.filter(
+        user=user,
+        viewed=True,
+        activity=OuterRef('pk')
+    )
+
+    return ActivityEntity.objects.exclude(id__in=ignored_ids).filter(~Exists(viewed_activities))
+
+
+def mark_viewed(user, activity_ids):
+    """
+    Marks the activities as viewed by the user. With the view buffer on, the
+    view of an activity may not be written yet, by this or another process,
+    so views are upserted rather than updated; the mark is never buffered so
+    that the feeds of all processes skip the activities right away.
+    """
+    if get_view_buffer() is None:
+        ActivityView.objects.filter(user=user, activity_id__in=activity_ids).update(viewed=True)
+        return
+
+    existing_ids = ActivityEntity.objects.filter(id__in=activity_ids).values_list('id', flat=True)
+    ActivityView.objects.bulk_create(
+        [ActivityView(user=user, activity_id=activity_id, viewed=True) for activity_id in existing_ids],
+        update_conflicts=True,
+        unique_fields=['activity', 'user'],
+        update_fields=['viewed']
+    )
+
+
+def get_seen_ids(user, ignored_ids):
+    """
+    Returns the ids of the activities the user has seen, for the spatial
+    index to skip them in memory instead of hydrating and dropping them.
+    """
+    viewed_ids = ActivityView.objects.filter(user=user, viewed=True).values_list('activity_id', flat=True)
+    return set(ignored_ids).union(viewed_ids)
 
 
 @api_view(['POST'])
 @parser_classes((JSONParser,))
 @timeit_decorator
 def get_some_activities(request):
-    ignored_ids = request.data.get('ignored_ids', [])
+    ignored_ids = [int(id) for id in request.data.get('ignored_ids', [])]
     user_latitude = request.data.get('latitude')
     user_longitude = request.data.get('longitude')
     user_location = None
 
     count_to_get = int(request.query_params.get('count', 10))
 
-    activities_viewed_ids = ActivityView.objects.filter(
-        user=request.user,
-        viewed=True
-    ).values_list('activity_id', flat=True)
-
-    all_excluded_ids = set(
-        [int(id) for id in ignored_ids] + list(activities_viewed_ids)
-    )
-
-    queryset = ActivityEntity.objects.exclude(id__in=all_excluded_ids)
+    queryset = get_feed_queryset(request.user, ignored_ids)
 
     if user_latitude is None or user_longitude is None:
-        activities = queryset.order_by('?')[:count_to_get]
+        activities = random_activities(queryset, count_to_get)
     else:
         user_location = Location(user_latitude, user_longitude)
 
-        queryset = annotate_with_distance(
-            queryset,
-            user_location.latitude,
-            user_location.longitude
-        )
-
-        activities = queryset.order_by('distance')[:count_to_get]
+        if settings.ACTIVITIES_FEED_ENGINE == 'tree':
+            activities = tree_nearest_activities(
+                queryset,
+                user_location.latitude,
+                user_location.longitude,
+                count_to_get,
+                get_seen_ids(request.user, ignored_ids)
+            )
+        else:
+            activities = nearest_activities(
+                queryset,
+                user_location.latitude,
+                user_location.longitude,
+                count_to_get
+            )
 
-    bulk_list = []
-    for activity in activities:
-        bulk_list.append(
-            ActivityView(
-                user=request.user,
-                activity=activity
+    view_buffer = get_view_buffer()
+    if view_buffer is not None:
+        view_buffer.add(request.user.id, [activity.id for activity in activities])
+    else:
+        bulk_list = []
+        for activity in activities:
+            bulk_list.append(
+                ActivityView(
+                    user=request.user,
+                    activity=activity
+                )
             )
-        )
 
-    ActivityView.objects.bulk_create(bulk_list, ignore_conflicts=True)
+        ActivityView.objects.bulk_create(bulk_list, ignore_conflicts=True)
 
     serializer = ActivitySerializer(activities, many=True, context={
         'request': request,
@@ -115,38 +264,95 @@ def get_some_activities(request):
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class ActivityLikeViewSet(viewsets.ModelViewSet):
+class ActivityLikeViewSet(ActivityCountersMixin, viewsets.ModelViewSet):
     queryset = ActivityLike.objects.all()
     serializer_class = ActivityLikeSerializer
+    counter_field = 'like_count'
 
 
-class ActivitySaveViewSet(viewsets.ModelViewSet):
+class ActivitySaveViewSet(ActivityCountersMixin, viewsets.ModelViewSet):
     queryset = ActivitySave.objects.all()
     serializer_class = ActivitySaveSerializer
+    counter_field = 'save_count'
+
+
+def get_liked_page_size(data):
+    # Raises TypeError or ValueError for an invalid page size
+    page_size = int(data.get('page_size', settings.ACTIVITIES_LIKED_PAGE_SIZE))
+    if page_size < 1:
+        raise ValueError('Page size must be positive')
+
+    return min(page_size, settings.ACTIVITIES_LIKED_MAX_PAGE_SIZE)
+
+
+def get_liked_queryset(user, cursor, user_latitude, user_longitude):
+    """
+    Returns the activities liked by the user after `cursor`, to be ordered by
+    `-liked_at, -like_id`. Raises `InvalidCursor` for a malformed cursor.
+    """
+    # Single join with the user's likes, walked newest first on (user, created_at)
+    queryset = ActivityEntity.objects.annotate(
+        user_like=FilteredRelation('like', condition=Q(like__user=user))
+    ).filter(
+        user_like__isnull=False
+    ).annotate(
+        liked_at=F('user_like__created_at'),
+        like_id=F('user_like__id')
+    )
 
+    if cursor:
+        liked_at, like_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(liked_at__lt=liked_at) | Q(liked_at=liked_at, like_id__lt=like_id)
+        )
 
-@api_view(['POST'])
-def get_liked_activities(request):
-    user = request.user
-    user_latitude = request.data.get('latitude')
-    user_longitude = request.data.get('longitude')
-    print(user_latitude, user_longitude)
-    user_location = Location(user_latitude, user_longitude)
+    if user_latitude is not None and user_longitude is not None:
+        user_location = Location(user_latitude, user_longitude)
+        queryset = annotate_with_distance(queryset, user_location.latitude, user_location.longitude)
 
-    liked_activity_ids = list(
-        ActivityLike.objects.filter(user=user)
-        .order_by('-created_at')
-        .values_list('activity_id', flat=True)
-    )
+    return queryset.order_by('-liked_at', '-like_id')
+
+
+def paginate_liked_activities(activities, page_size):
+    # `activities` holds one extra row, telling whether a next page exists
+    next_cursor = None
+    if len(activities) > page_size:
+        activities = activities[:page_size]
+        next_cursor = encode_cursor(activities[-1].liked_at, activities[-1].like_id)
 
-    activities_qs = ActivityEntity.objects.filter(id__in=liked_activity_ids)
-    activities_qs = annotate_with_distance(activities_qs, user_location.latitude, user_location.longitude)
+    return activities, next_cursor
 
-    activities = list(activities_qs)
-    activities.sort(key=lambda a: liked_activity_ids.index(a.id))
+
+@api_view(['POST'])
+def get_liked_activities(request):
+    """
+    Returns a page of the activities liked by the user, newest like first, as
+    `{'results': [...], 'next_cursor': ...}`. `next_cursor` is sent back to
+    get the next page and is null on the last one. Before pagination the
+    whole list was returned as a bare array.
+    """
+    try:
+        page_size = get_liked_page_size(request.data)
+    except (TypeError, ValueError):
+        return Response({'message': 'Invalid page size'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        queryset = get_liked_queryset(
+            request.user,
+            request.data.get('cursor'),
+            request.data.get('latitude'),
+            request.data.get('longitude')
+        )
+    except InvalidCursor:
+        return Response({'message': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+    activities, next_cursor = paginate_liked_activities(list(queryset[:page_size + 1]), page_size)
 
     serializer = ActivitySerializer(activities, many=True, context={'request': request})
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return Response({
+        'results': serializer.data,
+        'next_cursor': next_cursor
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
@@ -154,15 +360,23 @@ def get_liked_activities(request):
 @timeit_decorator
 def track_views(request):
     activities = request.data.get('activityIds', [])
+    mark_viewed(request.user, activities)
 
-    activities_to_update = ActivityView.objects.filter(user=request.user, activity_id__in=activities)
+    return Response({'message': 'Activity saved'}, status=status.HTTP_200_OK)
 
-    for activity in activities_to_update:
-        activity.viewed = True
 
-    ActivityView.objects.bulk_update(
-        activities_to_update,
-        ['viewed'],
-    )
+@api_view(['POST'])
+@parser_classes((JSONParser,))
+def track_interactions(request):
+    events = request.data.get('events', [])
+
+    if not isinstance(events, list):
+        return Response({'message': 'Events must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(events) > settings.ACTIVITIES_INTERACTIONS_MAX_BATCH:
+        return Response(
+            {'message': f'At most {settings.ACTIVITIES_INTERACTIONS_MAX_BATCH} events can be sent at once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-    return Response({'message': 'Activity saved'}, status=status.HTTP_200_OK)
+    results = apply_interactions(request.user, events)
+    return Response({'results': results}, status=status.HTTP_200_OK)
@@ -1,11 +1,12 @@
 import httpcore
 import logging
-import importlib
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 import sys
+import time
 import asyncio
 
-from data_migration.models import Resource as DataMigrationResource
+from services.cassette import Cassette
+from data_migration.services.runner import create_service, log_stats, migrate, ShardedMigration
 from utils.decorators.timeit_decorator import timeit_decorator
 
 
@@ -22,19 +23,8 @@ class Command(BaseCommand):
         )
         service_name = sys.argv[2]
 
-        def create_name_class():
-            parts = service_name.split('_')
-            return ''.join([part.capitalize() for part in parts]) + 'MigrationService'
-
         try:
-            module = importlib.import_module(f'data_migration.services.migrate.{service_name}')
-            service_class = getattr(module, f'{create_name_class()}')
-
-            credentials = DataMigrationResource.objects.filter(name=service_name).first()
-            if not credentials:
-                self.logger.error(f'Credentials for {service_name} not found')
-
-            self.service_instance = service_class(credentials)
+            self.service_instance = create_service(service_name)
             required_args = self.service_instance.required_arguments()
 
             for arg in required_args:
@@ -44,10 +34,50 @@ class Command(BaseCommand):
                     help=f'{arg} is required for {service_name} migration'
                 )
 
+            for stage in self.service_instance.stages():
+                parser.add_argument(
+                    f'--{stage.name}-workers',
+                    type=int,
+                    default=stage.workers,
+                    help=f'Number of concurrent workers of the {stage.name} stage'
+                )
+
         except ImportError:
             self.logger.error(f'Service {service_name} not found')
             exit()
 
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of processes, each migrating a disjoint shard of the data'
+        )
+
+        parser.add_argument(
+            '--cassette',
+            choices=Cassette.MODES,
+            help='Record API responses to, or replay them from, a local cassette (API_CASSETTE_MODE by default)'
+        )
+
+        parser.add_argument(
+            '--cassette-path',
+            type=str,
+            help='SQLite file of the cassette (API_CASSETTE_PATH by default)'
+        )
+
+        parser.add_argument(
+            '--cassette-latency',
+            type=str,
+            help='Seconds replayed responses are delayed by, or "recorded" (API_CASSETTE_LATENCY by default)'
+        )
+
+        parser.add_argument(
+            '--queue-size',
+            type=int,
+            default=100,
+            help='Maximum number of records waiting between two stages'
+        )
+
     # async def translate_activity(self, activity):
     #     def get_language_codes(languages):
     #         return [code for code, _ in languages]
@@ -89,23 +119,21 @@ class Command(BaseCommand):
     #     self.logger.info(f'Activity {activity.id} - {activity.name} has been translated')
 
     async def main(self, args):
-        async def handle_record(data):
-            activity = await self.service_instance.process_data(data)
-            # await self.translate_activity(activity)
-
-        tasks = []
-        async for data in self.service_instance.fetch_data(args):
-            task = asyncio.create_task(handle_record(data))
-            tasks.append(task)
-
-        await asyncio.gather(*tasks)
+        start_time = time.perf_counter()
+        report = await migrate(self.service_instance, args)
+        log_stats(report['stats'], report['processed'], time.perf_counter() - start_time)
 
     @timeit_decorator
     def handle(self, *args, **kwargs):
         # TODO: move here database logic (if it possible)
         self.logger.info('Starting data migration...')
         try:
-            asyncio.run(self.main(kwargs))
+            if kwargs['workers'] > 1:
+                migration = ShardedMigration(kwargs['service'], self.service_instance, kwargs, kwargs['workers'])
+                if not migration.run():
+                    raise CommandError('Some shards failed, run the migration again to resume them')
+            else:
+                asyncio.run(self.main(kwargs))
             self.logger.info('Data migration completed successfully')
         except Exception as e:
             self.logger.error(f'Error during migration: {e}')
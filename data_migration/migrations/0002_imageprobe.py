@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_migration', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageProbe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=2000, unique=True)),
+                ('status', models.IntegerField(null=True)),
+                ('content_type', models.CharField(max_length=250, null=True)),
+                ('checked_at', models.DateTimeField()),
+            ],
+        ),
+    ]
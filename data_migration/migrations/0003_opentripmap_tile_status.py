@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_migration', '0002_imageprobe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='opentripmap',
+            name='place_count',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='opentripmap',
+            name='status',
+            field=models.CharField(choices=[('done', 'Done'), ('split', 'Split')], default='done', max_length=10),
+        ),
+    ]
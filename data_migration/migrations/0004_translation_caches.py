@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_migration', '0003_opentripmap_tile_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LanguageDetectionCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_hash', models.CharField(max_length=64, unique=True)),
+                ('language', models.CharField(max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TranslationCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_hash', models.CharField(max_length=64)),
+                ('source', models.CharField(max_length=10)),
+                ('target', models.CharField(max_length=10)),
+                ('translation', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('text_hash', 'source', 'target'), name='unique_translation')],
+            },
+        ),
+    ]
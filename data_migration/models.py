@@ -8,8 +8,60 @@ class Resource(models.Model):
 
 
 class OpenTripMap(models.Model):
+    # A tile is either imported, or split into quadrants because it held more
+    # places than a single bbox request returns
+    STATUS_DONE = 'done'
+    STATUS_SPLIT = 'split'
+    STATUS_CHOICES = [
+        (STATUS_DONE, 'Done'),
+        (STATUS_SPLIT, 'Split'),
+    ]
+
     min_longitude = models.FloatField()
     min_latitude = models.FloatField()
     max_longitude = models.FloatField()
     max_latitude = models.FloatField()
     imported_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_DONE)
+    # Null for tiles imported before counts were recorded
+    place_count = models.IntegerField(null=True)
+
+
+class ImageProbe(models.Model):
+    url = models.URLField(max_length=2000, unique=True)
+    # Null when the image could not be reached at all
+    status = models.IntegerField(null=True)
+    content_type = models.CharField(max_length=250, null=True)
+    checked_at = models.DateTimeField()
+
+    @property
+    def is_available(self):
+        return self.status == 200 and 'image' in (self.content_type or '')
+
+
+class TranslationCache(models.Model):
+    # SHA-256 of the translated text
+    text_hash = models.CharField(max_length=64)
+    source = models.CharField(max_length=10)
+    target = models.CharField(max_length=10)
+    translation = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['text_hash', 'source', 'target'], name='unique_translation')
+        ]
+
+
+class LanguageDetectionCache(models.Model):
+    # SHA-256 of the text the language was detected in
+    text_hash = models.CharField(max_length=64, unique=True)
+    language = models.CharField(max_length=10)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class ActionCheckpoint(models.Model):
+    # Last activity id committed by a resumable after migration action
+    name = models.CharField(max_length=250, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
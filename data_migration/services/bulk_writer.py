@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from activities.cache import invalidate_activities
+from activities.db_functions import get_activities_by_external_ids
+from activities.models import Address, ExternalLinks, Entity as ActivityEntity, compute_content_hash
+from activities.spatial_index import refresh_spatial_index
+
+ACTIVITY_UPDATE_FIELDS = [
+    'name', 'description', 'migration_data', 'images', 'destination_resource', 'address', 'external_links',
+    'tags', 'original_language', 'content_hash',
+]
+
+
+def update_fields(model):
+    return [field.name for field in model._meta.concrete_fields if not field.primary_key]
+
+
+class ActivityBulkWriter:
+    """
+    Buffers processed places and writes them in chunks with a few bulk
+    statements per chunk. A place is a dict with `xid`, `address`,
+    `external_links` and `activity` field values; activities are upserted
+    on their `external_source` and `external_id`.
+
+    When a chunk fails it is written again place by place, so errors are
+    reported for the offending places only.
+
+    Places dropped before being written are passed to `discard`, so that
+    `on_write` learns about every place in the order they are settled: it is
+    called with the places of each chunk within the chunk's transaction, and
+    with `failed=True` for a place which could not be written.
+    """
+
+    def __init__(self, destination_resource, chunk_size=None, on_write=None):
+        self.destination_resource = destination_resource
+        self.on_write = on_write
+        self.chunk_size = chunk_size or settings.DATA_MIGRATION_CHUNK_SIZE
+        self.logger = logging.getLogger(__name__)
+        self.buffer = []
+        self.lock = asyncio.Lock()
+        self.written = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started_at = time.perf_counter()
+
+    @property
+    def records_per_second(self):
+        elapsed_time = time.perf_counter() - self.started_at
+        return self.written / elapsed_time if elapsed_time else 0.0
+
+    async def add(self, place):
+        self.buffer.append(place)
+        if len(self.buffer) >= self.chunk_size:
+            await self.flush()
+
+    async def discard(self, place, failed=False):
+        # Only settled, along with the places buffered before it
+        await self.add(dict(place, discarded=True, failed=failed))
+
+    def settle(self, places, failed=False):
+        if self.on_write is not None:
+            self.on_write(places, failed=failed)
+
+    async def flush(self):
+        async with self.lock:
+            places, self.buffer = self.buffer, []
+            if places:
+                await sync_to_async(self.write)(places)
+                self.logger.info(
+                    f'{self.written} places saved, {self.skipped} skipped, {self.failed} failed '
+                    f'({self.records_per_second:.1f} records/s)'
+                )
+
+    def write(self, places):
+        try:
+            with transaction.atomic():
+                written, skipped = self.write_chunk(places)
+                self.settle(places)
+        except Exception as err:
+            self.logger.warning(f'Chunk of {len(places)} places failed ({err}), retrying place by place')
+
+            written, skipped = 0, 0
+            for place in places:
+                try:
+                    with transaction.atomic():
+                        place_written, place_skipped = self.write_chunk([place])
+                        self.settle([place])
+                    written += place_written
+                    skipped += place_skipped
+                except Exception as err:
+                    self.failed += 1
+                    self.logger.error(f'Error processing place {place["xid"]}: {err}')
+                    self.settle([place], failed=True)
+
+        self.written += written
+        self.skipped += skipped
+
+    def find_duplicates(self, places):
+        # Same content as an already stored activity, or as an earlier place
+        # of the chunk. Stored activities are looked up by the indexed
+        # content hash; the one of the place's own previous version does not
+        # count, so an unchanged place is rewritten rather than skipped.
+        for place in places:
+            activity = place['activity']
+            place['content_hash'] = compute_content_hash(activity['name'], activity['images'], activity['description'])
+
+        stored = dict(
+            ActivityEntity.objects.filter(
+                destination_resource=self.destination_resource,
+                content_hash__in=[place['content_hash'] for place in places]
+            ).values_list('content_hash', 'external_id')
+        )
+
+        duplicates = set()
+        for place in places:
+            if stored.setdefault(place['content_hash'], place['xid']) != place['xid']:
+                duplicates.add(place['xid'])
+
+        return duplicates
+
+    def write_chunk(self, places):
+        # The last version of a place wins within a chunk
+        places = list({place['xid']: place for place in places if not place.get('discarded')}.values())
+        if not places:
+            return 0, 0
+
+        duplicates = self.find_duplicates(places)
+        for xid in duplicates:
+            self.logger.info(f'Place {xid} is a duplicate')
+        places = [place for place in places if place['xid'] not in duplicates]
+        if not places:
+            return 0, len(duplicates)
+
+        # Places migrated before keep their address and links rows, which are
+        # updated in place rather than replaced by new ones
+        existing = get_activities_by_external_ids(
+            self.destination_resource,
+            [place['xid'] for place in places],
+            fields=['address', 'external_links']
+        )
+
+        addresses, external_links = [], []
+        for place in places:
+            activity = existing.get(place['xid'])
+            address_id = activity.address_id if activity else None
+            external_links_id = activity.external_links_id if activity else None
+
+            address = Address(id=address_id, **place['address'])
+            address.update_geohash()
+            addresses.append(address)
+            external_links.append(ExternalLinks(id=external_links_id, **place['external_links']))
+
+        for model, rows in ((Address, addresses), (ExternalLinks, external_links)):
+            model.objects.bulk_update([row for row in rows if row.id is not None], update_fields(model))
+            model.objects.bulk_create([row for row in rows if row.id is None])
+
+        activities = []
+        for place, address, links in zip(places, addresses, external_links):
+            activity = ActivityEntity(
+                external_source=self.destination_resource,
+                external_id=place['xid'],
+                address=address,
+                external_links=links,
+                content_hash=place['content_hash'],
+                **place['activity']
+            )
+            activities.append(activity)
+
+        # Inserted, or updated in place when the place was migrated before
+        ActivityEntity.objects.bulk_create(
+            activities,
+            update_conflicts=True,
+            unique_fields=['external_source', 'external_id'],
+            update_fields=ACTIVITY_UPDATE_FIELDS
+        )
+        activity_ids = [activity.id for activity in activities]
+        invalidate_activities(activity_ids)
+        transaction.on_commit(lambda: refresh_spatial_index(activity_ids))
+
+        return len(places), len(duplicates)
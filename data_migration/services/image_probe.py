@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.utils import timezone
+
+from data_migration.models import ImageProbe
+from services.async_api_service import AsyncAPIService
+
+
+class ImageProbeService:
+    """
+    Checks whether image URLs are reachable, concurrently and at most once
+    per TTL: results are stored in the `ImageProbe` table and reused until
+    they expire.
+    """
+
+    def __init__(self, concurrency=None, ttl=None, retries=3):
+        self.logger = logging.getLogger(__name__)
+        self.ttl = timedelta(seconds=ttl or settings.IMAGE_PROBE_TTL)
+        self.retries = retries
+        self.concurrency = concurrency or settings.IMAGE_PROBE_CONCURRENCY
+        self.api_service = AsyncAPIService('', concurrency=self.concurrency)
+        self.in_flight = {}
+
+    async def close(self):
+        await self.api_service.close()
+
+    async def probe(self, url):
+        # Retried only when the request itself fails, like `APIService.head`
+        for _ in range(self.retries):
+            response = await self.api_service.head(headers={'User-Agent': 'Mozilla/5.0'}, url=url)
+            if response:
+                return ImageProbe(
+                    url=url,
+                    status=response.status,
+                    content_type=response.headers.get('Content-Type'),
+                    checked_at=timezone.now()
+                )
+
+        return ImageProbe(url=url, status=None, content_type=None, checked_at=timezone.now())
+
+    async def load(self, urls):
+        probes = {}
+        async for probe in ImageProbe.objects.filter(url__in=urls, checked_at__gte=timezone.now() - self.ttl):
+            probes[probe.url] = probe
+        return probes
+
+    async def store(self, probes):
+        await ImageProbe.objects.abulk_create(
+            probes,
+            update_conflicts=True,
+            unique_fields=['url'],
+            update_fields=['status', 'content_type', 'checked_at']
+        )
+
+    async def check(self, urls):
+        """
+        Returns a dict mapping every given URL to whether it serves an image.
+        """
+        urls = list(dict.fromkeys(url for url in urls if url))
+        if not urls:
+            return {}
+
+        probes = await self.load(urls)
+
+        # URLs already being probed by a concurrent call are awaited, not probed again
+        tasks = {}
+        shared = {}
+        for url in urls:
+            if url in probes:
+                continue
+            if url in self.in_flight:
+                shared[url] = self.in_flight[url]
+            else:
+                self.in_flight[url] = tasks[url] = asyncio.ensure_future(self.probe(url))
+
+        # They stay in flight until stored, so a concurrent call loads them
+        # either from its shared task or from the table
+        try:
+            fresh = await asyncio.gather(*tasks.values())
+            if fresh:
+                await self.store(fresh)
+        finally:
+            for url in tasks:
+                self.in_flight.pop(url, None)
+
+        probes.update({probe.url: probe for probe in fresh})
+
+        for url, task in shared.items():
+            probes[url] = await task
+
+        self.logger.debug(f'{len(urls)} images checked, {len(fresh)} of them probed')
+        return {url: probes[url].is_available for url in urls}
+
+    def check_sync(self, urls):
+        async def check_and_close():
+            # Every call runs in a new event loop, which the session and its
+            # semaphore can not be shared with
+            self.api_service = AsyncAPIService('', concurrency=self.concurrency)
+            try:
+                return await self.check(urls)
+            finally:
+                await self.close()
+
+        return async_to_sync(check_and_close)()
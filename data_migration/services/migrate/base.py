@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from data_migration.services.pipeline import Stage
+
 
 class DataMigrationService(ABC):
     @abstractmethod
@@ -18,6 +20,28 @@ class DataMigrationService(ABC):
     def process_data(self, obj):
         pass
 
+    def stages(self):
+        # Stages records yielded by `fetch_data` go through, see `Pipeline`
+        async def process(data):
+            result = await self.process_data(data)
+            if result is not None:
+                yield result
+
+        return [Stage('process', process, workers=10)]
+
+    def shards(self, args, count):
+        # Arguments of at most `count` disjoint parts of the migration, which
+        # can run in separate processes
+        return [args]
+
+    def share_rate_limit(self, share):
+        # Called in a shard's process with its share of the API budget
+        pass
+
+    async def finalize(self):
+        # Called once all fetched records were processed
+        pass
+
     # @abstractmethod
     # def migrate(self, args):
     #     pass
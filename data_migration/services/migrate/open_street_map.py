@@ -1,16 +1,20 @@
 import asyncio
-from pydoc import describe
-
-import numpy as np
 import logging
 
-from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.db import transaction
 
-from activities.models import Address, ExternalLinks, Entity as ActivityEntity
+from activities.db_functions import backfill_content_hashes
+from activities.cache import invalidate_activities
+from activities.models import Entity as ActivityEntity
 from data_migration.services.migrate.base import DataMigrationService
-from data_migration.models import OpenTripMap as OpenTripMapServiceData
-from services.api_service import APIService
+from data_migration.models import ActionCheckpoint, OpenTripMap as OpenTripMapServiceData
+from data_migration.services.bulk_writer import ActivityBulkWriter
+from data_migration.services.image_probe import ImageProbeService
+from data_migration.services.pipeline import Stage
+from data_migration.services.tiling import Tile, TileCheckpoints, TileProgress
+from data_migration.services.translation_cache import LanguageStore
+from services.async_api_service import AsyncAPIService
 from services.translator import Translator
 from utils.geo_utils import Location
 
@@ -20,218 +24,404 @@ class OpenStreetMapMigrationService(DataMigrationService):
         self.base_url = credentials.base_url
         self.api_key = credentials.credentials.get('api_key')
         self.logger = logging.getLogger(__name__)
-        self.api_service = APIService(self.base_url, limit=10, period=1)
+        self.api_service = AsyncAPIService(self.base_url, limit=10, period=1, concurrency=10)
+        self.image_probe = ImageProbeService()
+        self.writer = ActivityBulkWriter(destination_resource='open_street_map', on_write=self.settle_places)
+        self.language_store = LanguageStore()
+        self.checkpoints = TileCheckpoints([])
+        self.progress = TileProgress()
 
     def required_arguments(self):
         return ['min_lat', 'max_lat', 'min_lon', 'max_lon']
 
+    def get_area(self, args):
+        return Tile.create(args.get('min_lat'), args.get('max_lat'), args.get('min_lon'), args.get('max_lon'))
+
+    def shards(self, args, count):
+        # Shards are made of whole top-level tiles, so checkpoints are the
+        # same whatever the number of shards
+        return [
+            dict(
+                args,
+                min_lat=shard.min_latitude,
+                max_lat=shard.max_latitude,
+                min_lon=shard.min_longitude,
+                max_lon=shard.max_longitude
+            )
+            for shard in self.get_area(args).shards(count, settings.OPENTRIPMAP_TILE_SIZE)
+        ]
+
+    def share_rate_limit(self, share):
+        self.api_service.share_rate_limit(share)
+
+    async def load_checkpoints(self, area):
+        return TileCheckpoints([
+            checkpoint
+            async for checkpoint in OpenTripMapServiceData.objects.filter(
+                min_latitude__gte=area.min_latitude,
+                max_latitude__lte=area.max_latitude,
+                min_longitude__gte=area.min_longitude,
+                max_longitude__lte=area.max_longitude
+            )
+        ])
+
+    async def save_checkpoint(self, tile, status, place_count):
+        await OpenTripMapServiceData.objects.acreate(
+            min_latitude=tile.min_latitude,
+            max_latitude=tile.max_latitude,
+            min_longitude=tile.min_longitude,
+            max_longitude=tile.max_longitude,
+            status=status,
+            place_count=place_count
+        )
+
+    def settle_places(self, places, failed=False):
+        # Called by the writer within the transaction of the settled places:
+        # the tiles whose last place they are get checkpointed with them
+        failed_tiles = {place['tile'] for place in places if failed or place.get('failed')}
+        tiles = [place['tile'] for place in places]
+
+        OpenTripMapServiceData.objects.bulk_create([
+            OpenTripMapServiceData(
+                min_latitude=tile.min_latitude,
+                max_latitude=tile.max_latitude,
+                min_longitude=tile.min_longitude,
+                max_longitude=tile.max_longitude,
+                status=OpenTripMapServiceData.STATUS_DONE,
+                place_count=self.progress.place_counts[tile]
+            )
+            for tile in self.progress.completed(tiles)
+            if tile not in failed_tiles
+        ])
+
+        def settle():
+            self.progress.settle([tile for tile in tiles if tile not in failed_tiles])
+            self.progress.settle([tile for tile in tiles if tile in failed_tiles], failed=True)
+
+        transaction.on_commit(settle)
+
+    async def fetch_places_ids(self, tile):
+        places_result = await self.api_service.request(
+            method='GET',
+            endpoint='/places/bbox',
+            query_params=dict(
+                lon_min=tile.min_longitude,
+                lon_max=tile.max_longitude,
+                lat_min=tile.min_latitude,
+                lat_max=tile.max_latitude,
+                apikey=self.api_key,
+                rate=3,
+                limit=settings.OPENTRIPMAP_BBOX_LIMIT,
+                kinds='interesting_places,amusements,adult,foods,transport,accomodations'.replace(',', '%2C')
+            )
+        )
+
+        return list(map(lambda x: x.get('properties').get('xid'), places_result.get('features')))
+
+    def stages(self):
+        return [
+            Stage('tiles', self.crawl_tile, workers=2),
+            Stage('details', self.fetch_details, workers=4),
+            Stage('images', self.check_images, workers=8),
+            Stage('language', self.detect_language, workers=2),
+            Stage('write', self.write_place, workers=1),
+        ]
+
     async def fetch_data(self, args):
-        min_lat = float(args.get('min_lat'))
-        max_lat = float(args.get('max_lat')) - 0.001
-        min_lon = float(args.get('min_lon'))
-        max_lon = float(args.get('max_lon')) - 0.001
-
-        step_lat = 0.1
-        step_lon = 0.1
-
-        async def step_was_processed(min_lat_loc, max_lat_loc, min_lon_loc, max_lon_loc):
-            async for field in OpenTripMapServiceData.objects.filter(
-                    min_latitude=min_lat_loc,
-                    max_latitude=max_lat_loc,
-                    min_longitude=min_lon_loc,
-                    max_longitude=max_lon_loc
+        """
+        Yields the top-level tiles of the area, which are crawled as a
+        quadtree. Tiles start at OPENTRIPMAP_TILE_SIZE degrees, so sparse
+        regions take a single request, and a tile whose request returns
+        OPENTRIPMAP_BBOX_LIMIT places is split into quadrants instead of
+        being imported truncated.
+
+        Every tile's outcome is checkpointed. Checkpoints of the area are
+        loaded once; imported tiles are skipped and split ones are descended
+        into without a request, so an interrupted run resumes where it
+        stopped.
+        """
+        area = self.get_area(args)
+        self.checkpoints = await self.load_checkpoints(area)
+        self.logger.info(f'{len(self.checkpoints)} tiles of the area were already processed')
+
+        await self.api_service.open()
+        for tile in area.grid(settings.OPENTRIPMAP_TILE_SIZE):
+            yield tile
+
+    async def crawl_tile(self, tile):
+        # Yields the tiles left to import with the ids of their places
+        limit = settings.OPENTRIPMAP_BBOX_LIMIT
+        min_tile_size = settings.OPENTRIPMAP_MIN_TILE_SIZE
+
+        # Depth first, so a split tile is finished before its neighbours
+        tiles = [tile]
+        while tiles:
+            tile = tiles.pop()
+            status = self.checkpoints.status(tile)
+
+            if status == OpenTripMapServiceData.STATUS_DONE:
+                self.logger.info(f'Step with {tile} was already processed')
+                continue
+
+            if status == OpenTripMapServiceData.STATUS_SPLIT or (
+                    tile.can_split(min_tile_size) and self.checkpoints.has_within(tile)
             ):
-                return True
+                tiles.extend(reversed(tile.split()))
+                continue
 
-            return False
+            places_ids = await self.fetch_places_ids(tile)
 
-        for lat in np.arange(min_lat, max_lat, step_lat):
-            for lon in np.arange(min_lon, max_lon, step_lon):
-                min_lat_loc = round(lat, 1)
-                max_lat_loc = round(lat + step_lat, 1)
-                min_lon_loc = round(lon, 1)
-                max_lon_loc = round(lon + step_lon, 1)
-
-                if await step_was_processed(min_lat_loc, max_lat_loc, min_lon_loc, max_lon_loc):
-                    self.logger.info(f'Step with lat: {min_lat_loc}-{max_lat_loc} and lon: {min_lon_loc}-{max_lon_loc} was already processed')
+            if len(places_ids) >= limit:
+                if tile.can_split(min_tile_size):
+                    self.logger.info(f'Step with {tile} holds more than {limit} places, splitting it')
+                    await self.save_checkpoint(tile, OpenTripMapServiceData.STATUS_SPLIT, len(places_ids))
+                    tiles.extend(reversed(tile.split()))
                     continue
 
-                places_result = self.api_service.request(
-                    method='GET',
-                    endpoint=f'/places/bbox',
-                    query_params=dict(
-                        lon_min=min_lon_loc,
-                        lon_max=max_lon_loc,
-                        lat_min=min_lat_loc,
-                        lat_max=max_lat_loc,
-                        apikey=self.api_key,
-                        rate=3,
-                        kinds=f'interesting_places,amusements,adult,foods,transport,accomodations'.replace(',', '%2C')
-                    )
-                )
+                self.logger.warning(f'Step with {tile} can not be split further, only {limit} places are imported')
 
-                places_ids = list(map(lambda x: x.get('properties').get('xid'), places_result.get('features')))
-                self.logger.info(
-                    f'Found {len(places_ids)} places for step with lat: {min_lat_loc}-{max_lat_loc} and lon: {min_lon_loc}-{max_lon_loc}'
-                )
+            self.logger.info(f'Found {len(places_ids)} places for step with {tile}')
+            yield tile, places_ids
 
-                for place_id in places_ids:
-                    yield self.api_service.request(
-                        method='GET',
-                        endpoint=f'/places/xid/{place_id}',
-                        query_params=dict(apikey=self.api_key)
-                    )
-
-                await OpenTripMapServiceData.objects.acreate(
-                    min_latitude=min_lat_loc,
-                    max_latitude=max_lat_loc,
-                    min_longitude=min_lon_loc,
-                    max_longitude=max_lon_loc
-                )
+    async def fetch_details(self, step):
+        tile, places_ids = step
 
-    @sync_to_async
-    def process_data(self, data):
-        try:
-            with transaction.atomic():
-                address_data = data.get('address', {})
-
-                def get_images():
-                    def is_image_available(url):
-                        #  try 3 times to get the image
-                        for _ in range(3):
-                            response = APIService(url).head(headers={'User-Agent': 'Mozilla/5.0'})
-                            if response:
-                                return response.status_code == 200 and 'image' in response.headers['Content-Type']
-                        return False
-
-                    images = []
-                    preview_source = data.get('preview', {}).get('source')
-                    if preview_source and is_image_available(preview_source):
-                        images.append(preview_source)
-
-                    image = data.get('image')
-                    if image and is_image_available(image):
-                        images.append(image)
-
-                    return images
-
-                def get_point_field():
-                    if data.get('point'):
-                        return Location(
-                            latitude=data.get('point').get('lat'),
-                            longitude=data.get('point').get('lon')
-                        )
-                    return None
-
-                def get_original_language():
-                    if data.get('wikipedia_extracts', {}).get('text'):
-                        return Translator.detect_language(data.get('wikipedia_extracts', {}).get('text'))
-                    return Translator.detect_language(data.get('name'))
-
-                def get_tags():
-                    if data.get('kinds'):
-                        return data.get('kinds').split(',')
-                    return []
-
-                if not data.get('name'):
-                    return None
-
-                if not get_images():
-                    return None
-
-                if ActivityEntity.objects.filter(
-                    destination_resource='open_street_map',
-                    name=data.get('name'),
-                    images=get_images(),
-                    description=data.get('wikipedia_extracts', {}).get('text'),
-                ).count() > 0:
-                    self.logger.info(f'Place {data.get("xid")} - {data.get("name")} is a duplicate')
-                    return None
-
-                location = get_point_field()
-                address, _ = Address.objects.get_or_create(
-                    street=f'{address_data.get("road", "")} {address_data.get("house_number", "")}',
-                    city=address_data.get('town'),
-                    state=address_data.get('state'),
-                    country=address_data.get('country'),
-                    postal_code=address_data.get('postcode'),
-                    latitude=location.latitude if location else None,
-                    longitude=location.longitude if location else None
-                )
+        # Details are fetched concurrently, within the service's rate limit
+        places = await asyncio.gather(*[
+            self.api_service.request(
+                method='GET',
+                endpoint=f'/places/xid/{place_id}',
+                query_params=dict(apikey=self.api_key)
+            )
+            for place_id in places_ids
+        ], return_exceptions=True)
 
-                external_links, _ = ExternalLinks.objects.get_or_create(
-                    wikipedia_url=data.get('wikipedia'),
-                    website_url=data.get('url'),
-                )
+        fetched = [place for place in places if not isinstance(place, Exception)]
+        failed = len(places) - len(fetched)
+        if failed:
+            # Never checkpointed, so the step is retried on the next run
+            self.logger.error(f'{failed} places could not be fetched for step with {tile}')
 
-                activity, _ = ActivityEntity.objects.update_or_create(
-                    migration_data__xid=data.get('xid'),
-                    defaults=dict(
-                        name=data.get('name'),
-                        description=data.get('wikipedia_extracts', {}).get('text'),
-                        migration_data=dict(
-                            xid=data.get('xid'),
-                        ),
-                        images=get_images(),
-                        destination_resource='open_street_map',
-                        address=address,
-                        external_links=external_links,
-                        tags=get_tags(),
-                        original_language=get_original_language()
-                    )
-                )
+        # The tile is checkpointed once its places are written, see `settle_places`
+        if self.progress.start(tile, len(fetched), len(places_ids), failed=bool(failed)):
+            await self.save_checkpoint(tile, OpenTripMapServiceData.STATUS_DONE, len(places_ids))
+
+        for place in fetched:
+            yield tile, place
+
+    async def finalize(self):
+        await self.writer.flush()
+        await self.image_probe.close()
+        await self.api_service.close()
+
+    async def get_images(self, data):
+        candidates = [data.get('preview', {}).get('source'), data.get('image')]
+        candidates = [url for url in candidates if url]
 
-                self.logger.info(f'Place {activity.id} - {data.get("name")} was successfully saved')
+        available = await self.image_probe.check(candidates)
+        return [url for url in candidates if available[url]]
 
-                return activity
+    async def discard(self, tile, data, failed=False):
+        # Dropped places are settled by the writer, in order with the others
+        await self.writer.discard(dict(xid=data.get('xid'), tile=tile), failed=failed)
 
+    async def check_images(self, item):
+        tile, data = item
+
+        if not data.get('name'):
+            await self.discard(tile, data)
+            return
+
+        try:
+            images = await self.get_images(data)
         except Exception as err:
-            self.logger.error(f'Error processing place {data.get('xid')}: {err}')
+            self.logger.error(f'Error checking images of place {data.get("xid")}: {err}')
+            await self.discard(tile, data, failed=True)
+            return
 
+        if images:
+            yield tile, data, images
+        else:
+            await self.discard(tile, data)
 
-    @transaction.atomic
-    def filter_unreachable_photos(self):
-        allEntities = ActivityEntity.objects.filter(destination_resource='open_street_map')
+    async def detect_language(self, item):
+        tile, data, images = item
 
-        def is_image_available(url):
-            #  try 3 times to get the image
-            for _ in range(3):
-                response = APIService(url).head(headers={'User-Agent': 'Mozilla/5.0'})
-                if response:
-                    return response.status_code == 200 and 'image' in response.headers['Content-Type']
-            return False
+        try:
+            text = self.get_language_text(data)
+            languages = await Translator.adetect_languages([text], self.language_store)
+            place = self.prepare_place(data, images, languages[text])
+        except Exception as err:
+            self.logger.error(f'Error processing place {data.get("xid")}: {err}')
+            await self.discard(tile, data, failed=True)
+            return
 
-        filtered = 0
+        yield dict(place, tile=tile)
 
-        for entity in allEntities:
-            images = entity.images
-            images = list(filter(is_image_available, images))
-            entity.images = images
+    async def write_place(self, place):
+        await self.writer.add(place)
+        yield place
 
-            if len(images) == 0:
-                self.logger.info(f'Place {entity.id} - {entity.name} has no reachable images')
-                entity.delete()
-                filtered += 1
+    async def process_data(self, data):
+        # A single place through the image, language and write stages
+        async for item in self.check_images((None, data)):
+            async for place in self.detect_language(item):
+                async for place in self.write_place(place):
+                    return place
 
-        self.logger.info(f'{filtered} unreachable photos were filtered')
-        return True
+        return None
 
-    @transaction.atomic
-    def delete_duplicates(self):
-        allEntities = ActivityEntity.objects.filter(destination_resource='open_street_map')
+    def get_language_text(self, data):
+        # The text the original language of a place is detected in
+        return data.get('wikipedia_extracts', {}).get('text') or data.get('name')
 
-        duplicates = 0
+    def prepare_place(self, data, images, original_language):
+        address_data = data.get('address', {})
 
-        for entity in allEntities:
-            if ActivityEntity.objects.filter(
-                name=entity.name,
-                images=entity.images,
-                description=entity.description,
-                destination_resource='open_street_map'
-            ).count() > 1:
-                self.logger.info(f'Place {entity.id} - {entity.name} is a duplicate')
-                entity.delete()
-                duplicates += 1
+        def get_point_field():
+            if data.get('point'):
+                return Location(
+                    latitude=data.get('point').get('lat'),
+                    longitude=data.get('point').get('lon')
+                )
+            return None
+
+        def get_tags():
+            if data.get('kinds'):
+                return data.get('kinds').split(',')
+            return []
+
+        location = get_point_field()
+
+        return dict(
+            xid=data.get('xid'),
+            address=dict(
+                street=f'{address_data.get("road", "")} {address_data.get("house_number", "")}',
+                city=address_data.get('town'),
+                state=address_data.get('state'),
+                country=address_data.get('country'),
+                postal_code=address_data.get('postcode'),
+                latitude=location.latitude if location else None,
+                longitude=location.longitude if location else None
+            ),
+            external_links=dict(
+                wikipedia_url=data.get('wikipedia'),
+                website_url=data.get('url'),
+            ),
+            activity=dict(
+                name=data.get('name'),
+                description=data.get('wikipedia_extracts', {}).get('text'),
+                migration_data=dict(
+                    xid=data.get('xid'),
+                ),
+                images=images,
+                destination_resource='open_street_map',
+                tags=get_tags(),
+                original_language=original_language
+            )
+        )
+
+    def filter_unreachable_photos(self, chunk_size=None):
+        """
+        Drops unreachable images from activities and deletes the activities
+        left without any. Activities are streamed in id order through a
+        server-side cursor; each chunk is probed concurrently and committed on
+        its own, with the last committed id, so an interrupted run resumes
+        after it. A finished run starts from the beginning next time.
+        """
+        chunk_size = chunk_size or settings.DATA_MIGRATION_CHUNK_SIZE
+        checkpoint, _ = ActionCheckpoint.objects.get_or_create(name='open_street_map.filter_unreachable_photos')
+        if checkpoint.last_id:
+            self.logger.info(f'Resuming after place {checkpoint.last_id}')
+
+        entities = ActivityEntity.objects.filter(
+            destination_resource='open_street_map',
+            id__gt=checkpoint.last_id
+        ).order_by('id').only('id', 'name', 'images', 'description')
+
+        updated, filtered = 0, 0
+        chunk = []
+        for entity in entities.iterator(chunk_size=chunk_size):
+            chunk.append(entity)
+            if len(chunk) >= chunk_size:
+                chunk_updated, chunk_filtered = self.filter_unreachable_photos_chunk(chunk, checkpoint)
+                updated += chunk_updated
+                filtered += chunk_filtered
+                chunk = []
+
+        if chunk:
+            chunk_updated, chunk_filtered = self.filter_unreachable_photos_chunk(chunk, checkpoint)
+            updated += chunk_updated
+            filtered += chunk_filtered
+
+        checkpoint.last_id = 0
+        checkpoint.save(update_fields=['last_id', 'updated_at'])
+
+        self.logger.info(f'{updated} places lost unreachable photos, {filtered} places without photos were filtered')
+        return True
+
+    def filter_unreachable_photos_chunk(self, entities, checkpoint):
+        available = self.image_probe.check_sync([url for entity in entities for url in entity.images])
+
+        changed, deleted = [], []
+        for entity in entities:
+            images = [url for url in entity.images if available[url]]
+            if not images:
+                self.logger.info(f'Place {entity.id} - {entity.name} has no reachable images')
+                deleted.append(entity.id)
+            elif images != entity.images:
+                entity.images = images
+                entity.update_content_hash()
+                changed.append(entity)
+
+        # Without some images a place may have the content of another one
+        taken = set(
+            ActivityEntity.objects.filter(
+                destination_resource='open_street_map',
+                content_hash__in=[entity.content_hash for entity in changed]
+            ).exclude(id__in=[entity.id for entity in changed]).values_list('content_hash', flat=True)
+        )
+        updated = []
+        for entity in changed:
+            if entity.content_hash in taken:
+                self.logger.info(f'Place {entity.id} - {entity.name} is a duplicate without unreachable images')
+                deleted.append(entity.id)
+            else:
+                taken.add(entity.content_hash)
+                updated.append(entity)
+
+        with transaction.atomic():
+            ActivityEntity.objects.bulk_update(updated, ['images', 'content_hash'])
+            if deleted:
+                ActivityEntity.objects.filter(id__in=deleted).delete()
+
+            checkpoint.last_id = entities[-1].id
+            checkpoint.save(update_fields=['last_id', 'updated_at'])
+            invalidate_activities([entity.id for entity in updated])
+
+        return len(updated), len(deleted)
+
+    def delete_duplicates(self, batch_size=1000):
+        # Activities stored before content hashes existed get one; those left
+        # without a hash have the content of another activity. Every batch is
+        # committed on its own
+        backfill_content_hashes()
+
+        duplicates = ActivityEntity.objects.filter(
+            destination_resource='open_street_map',
+            content_hash__isnull=True
+        ).order_by('id')
+
+        deleted = 0
+        while True:
+            batch = list(duplicates.values_list('id', flat=True)[:batch_size])
+            if not batch:
+                break
+
+            self.logger.info(f'Places {batch} are duplicates')
+            with transaction.atomic():
+                ActivityEntity.objects.filter(id__in=batch).delete()
+            deleted += len(batch)
 
-        self.logger.info(f'{duplicates} duplicates were filtered')
+        self.logger.info(f'{deleted} duplicates were filtered')
         return True
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import time
+from typing import NamedTuple, Callable
+
+
+class Stage(NamedTuple):
+    """
+    A step records go through. `handler` is an async generator function: it
+    gets one item of the previous stage and yields the items of the next one
+    (none to drop the item). `workers` is the default number of items handled
+    concurrently.
+    """
+    name: str
+    handler: Callable
+    workers: int = 1
+
+
+class Pipeline:
+    """
+    Runs items of an async iterable through stages connected by bounded
+    queues. A full queue blocks the stage feeding it, so at most `queue_size`
+    items wait between two stages whatever the size of the source.
+
+    Items whose handler fails are logged and dropped; the counters of items
+    consumed, produced and failed per stage are kept in `stats`.
+    """
+
+    _done = object()
+
+    def __init__(self, stages, queue_size=100, workers=None):
+        self.logger = logging.getLogger(__name__)
+        self.stages = stages
+        self.queue_size = queue_size
+        self.workers = {stage.name: max((workers or {}).get(stage.name) or stage.workers, 1) for stage in stages}
+        self.stats = {stage.name: dict(consumed=0, produced=0, failed=0) for stage in stages}
+        self.started_at = None
+
+    @property
+    def processed(self):
+        # Items that made it through the last stage
+        return self.stats[self.stages[-1].name]['produced'] if self.stages else 0
+
+    @property
+    def records_per_second(self):
+        elapsed_time = time.perf_counter() - self.started_at if self.started_at else 0
+        return self.processed / elapsed_time if elapsed_time else 0.0
+
+    async def feed(self, source, queue):
+        async for item in source:
+            await queue.put(item)
+
+    async def work(self, stage, queue, next_queue):
+        stats = self.stats[stage.name]
+
+        while True:
+            item = await queue.get()
+            if item is self._done:
+                return
+
+            stats['consumed'] += 1
+            try:
+                async for result in stage.handler(item):
+                    stats['produced'] += 1
+                    if next_queue is not None:
+                        await next_queue.put(result)
+            except Exception as err:
+                stats['failed'] += 1
+                self.logger.error(f'Stage {stage.name} failed to handle an item: {err}')
+
+    async def close(self, index, queues):
+        # Tells every worker of the stage that no more items come
+        for _ in range(self.workers[self.stages[index].name]):
+            await queues[index].put(self._done)
+
+    async def run_stage(self, index, queues):
+        stage = self.stages[index]
+        next_queue = queues[index + 1] if index + 1 < len(queues) else None
+
+        async with asyncio.TaskGroup() as group:
+            for _ in range(self.workers[stage.name]):
+                group.create_task(self.work(stage, queues[index], next_queue))
+
+        if next_queue is not None:
+            await self.close(index + 1, queues)
+
+    async def run(self, source):
+        self.started_at = time.perf_counter()
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+
+        async def feed_and_close():
+            await self.feed(source, queues[0])
+            await self.close(0, queues)
+
+        async with asyncio.TaskGroup() as group:
+            group.create_task(feed_and_close())
+            for index in range(len(self.stages)):
+                group.create_task(self.run_stage(index, queues))
+
+        return self.stats
@@ -0,0 +1,191 @@
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import queue
+import time
+
+import django
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+from data_migration.services.pipeline import Pipeline
+from services.cassette import use_cassette
+
+# Seconds between two progress reports of a sharded migration
+PROGRESS_INTERVAL = 10
+
+logger = logging.getLogger(__name__)
+
+
+def create_service(service_name):
+    from data_migration.models import Resource as DataMigrationResource
+
+    module = importlib.import_module(f'data_migration.services.migrate.{service_name}')
+    service_class = getattr(module, ''.join([part.capitalize() for part in service_name.split('_')]) + 'MigrationService')
+
+    credentials = DataMigrationResource.objects.filter(name=service_name).first()
+    if not credentials:
+        logger.error(f'Credentials for {service_name} not found')
+
+    return service_class(credentials)
+
+
+def create_pipeline(service, args):
+    stages = service.stages()
+    return Pipeline(
+        stages,
+        queue_size=args['queue_size'],
+        workers={stage.name: args.get(f'{stage.name}_workers') for stage in stages}
+    )
+
+
+def merge_stats(reports):
+    # Sums the per stage counters of several pipelines
+    merged = {}
+    for report in reports:
+        for stage, stats in report['stats'].items():
+            merged_stats = merged.setdefault(stage, dict(consumed=0, produced=0, failed=0))
+            for counter, value in stats.items():
+                merged_stats[counter] += value
+
+    return merged
+
+
+def log_stats(stats, processed, elapsed_time):
+    for stage, stage_stats in stats.items():
+        logger.info(
+            f'Stage {stage}: {stage_stats["consumed"]} consumed, {stage_stats["produced"]} produced, '
+            f'{stage_stats["failed"]} failed'
+        )
+
+    logger.info(
+        f'{processed} records processed in {elapsed_time:.1f} s '
+        f'({processed / elapsed_time if elapsed_time else 0:.1f} records/s)'
+    )
+
+
+async def migrate(service, args, on_progress=None):
+    """
+    Runs the migration of `args` through the service's pipeline and returns
+    its report. `on_progress` is called with the report every
+    PROGRESS_INTERVAL seconds.
+    """
+    if args.get('cassette'):
+        use_cassette(args['cassette'], args.get('cassette_path'), args.get('cassette_latency'))
+
+    pipeline = create_pipeline(service, args)
+
+    def report():
+        return dict(stats=pipeline.stats, processed=pipeline.processed)
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            on_progress(report())
+
+    reporter = asyncio.create_task(report_progress()) if on_progress else None
+    try:
+        await pipeline.run(service.fetch_data(args))
+    finally:
+        if reporter:
+            reporter.cancel()
+        await service.finalize()
+        # The ORM calls of the pipeline run on the sync_to_async thread, whose
+        # connections Django would otherwise keep open until the process exits
+        await sync_to_async(connections.close_all)()
+
+    return report()
+
+
+def run_shard(service_name, args, index, share, messages):
+    # Entry point of a shard's process, which has its own database connection
+    django.setup()
+
+    service = create_service(service_name)
+    service.share_rate_limit(share)
+
+    try:
+        report = asyncio.run(migrate(service, args, lambda report: messages.put(('progress', index, report))))
+    except Exception as err:
+        logger.error(f'Shard {index} failed: {err}')
+        messages.put(('failed', index, str(err)))
+        raise SystemExit(1)
+
+    messages.put(('done', index, report))
+
+
+class ShardedMigration:
+    """
+    Runs a migration in `workers` processes, one per disjoint shard of its
+    arguments, each with an equal share of the API rate limit. Shards report
+    their progress through a queue; it is merged and logged here.
+    """
+
+    def __init__(self, service_name, service, args, workers):
+        self.service_name = service_name
+        self.shards = service.shards(args, workers)
+        self.reports = {}
+        self.failed = {}
+
+    def log_progress(self, elapsed_time):
+        reports = list(self.reports.values())
+        processed = sum(report['processed'] for report in reports)
+        logger.info(
+            f'{processed} records processed by {len(self.shards)} shards in {elapsed_time:.1f} s '
+            f'({processed / elapsed_time if elapsed_time else 0:.1f} records/s)'
+        )
+
+    def run(self):
+        context = multiprocessing.get_context('spawn')
+        messages = context.Queue()
+        processes = [
+            context.Process(
+                target=run_shard,
+                args=(self.service_name, shard_args, index, 1 / len(self.shards), messages),
+                name=f'data-migrate-shard-{index}'
+            )
+            for index, shard_args in enumerate(self.shards)
+        ]
+
+        logger.info(f'Migrating in {len(processes)} shards')
+        start_time = time.perf_counter()
+        for process in processes:
+            process.start()
+
+        finished = set()
+        last_progress = start_time
+        while len(finished) + len(self.failed) < len(processes):
+            try:
+                kind, index, payload = messages.get(timeout=1)
+            except queue.Empty:
+                # A shard killed before it could report
+                for index, process in enumerate(processes):
+                    if not process.is_alive() and process.exitcode and index not in self.failed:
+                        self.failed[index] = f'exited with code {process.exitcode}'
+                continue
+
+            if kind == 'failed':
+                self.failed[index] = payload
+                continue
+
+            self.reports[index] = payload
+            if kind == 'done':
+                finished.add(index)
+                logger.info(f'Shard {index} finished, {payload["processed"]} records processed')
+
+            if time.perf_counter() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.perf_counter()
+                self.log_progress(last_progress - start_time)
+
+        for process in processes:
+            process.join()
+
+        elapsed_time = time.perf_counter() - start_time
+        reports = list(self.reports.values())
+        log_stats(merge_stats(reports), sum(report['processed'] for report in reports), elapsed_time)
+
+        for index, error in sorted(self.failed.items()):
+            logger.error(f'Shard {index} ({self.shards[index]}) failed: {error}')
+
+        return not self.failed
@@ -0,0 +1,187 @@
+import threading
+from collections import Counter
+from math import ceil
+from typing import NamedTuple
+
+import numpy as np
+
+# Tile bounds are rounded, so that tiles computed in different runs compare
+# equal to the checkpoints stored for them
+COORDINATE_PRECISION = 6
+
+
+class Tile(NamedTuple):
+    min_latitude: float
+    max_latitude: float
+    min_longitude: float
+    max_longitude: float
+
+    @classmethod
+    def create(cls, min_latitude, max_latitude, min_longitude, max_longitude):
+        return cls(*(
+            round(float(value), COORDINATE_PRECISION)
+            for value in (min_latitude, max_latitude, min_longitude, max_longitude)
+        ))
+
+    def __str__(self):
+        return f'lat: {self.min_latitude}-{self.max_latitude} and lon: {self.min_longitude}-{self.max_longitude}'
+
+    @property
+    def size(self):
+        return max(self.max_latitude - self.min_latitude, self.max_longitude - self.min_longitude)
+
+    def can_split(self, min_size):
+        # Tolerates the rounding of the halved bounds
+        return self.size / 2 >= min_size - 10 ** -COORDINATE_PRECISION
+
+    def split(self):
+        middle_latitude = (self.min_latitude + self.max_latitude) / 2
+        middle_longitude = (self.min_longitude + self.max_longitude) / 2
+
+        return [
+            Tile.create(self.min_latitude, middle_latitude, self.min_longitude, middle_longitude),
+            Tile.create(self.min_latitude, middle_latitude, middle_longitude, self.max_longitude),
+            Tile.create(middle_latitude, self.max_latitude, self.min_longitude, middle_longitude),
+            Tile.create(middle_latitude, self.max_latitude, middle_longitude, self.max_longitude),
+        ]
+
+    def grid(self, size):
+        """
+        Covers the tile with tiles of `size` degrees, the last row and column
+        clipped to its bounds.
+        """
+        rows = max(ceil(round((self.max_latitude - self.min_latitude) / size, COORDINATE_PRECISION)), 1)
+        columns = max(ceil(round((self.max_longitude - self.min_longitude) / size, COORDINATE_PRECISION)), 1)
+
+        return [
+            Tile.create(
+                self.min_latitude + row * size,
+                min(self.min_latitude + (row + 1) * size, self.max_latitude),
+                self.min_longitude + column * size,
+                min(self.min_longitude + (column + 1) * size, self.max_longitude)
+            )
+            for row in range(rows)
+            for column in range(columns)
+        ]
+
+    def shards(self, count, size):
+        """
+        Splits the tile into at most `count` disjoint bands of whole rows or
+        columns of its `size` grid, so that every band is covered by the same
+        tiles as in the grid of the whole tile.
+        """
+        grid = self.grid(size)
+        rows = len({tile.min_latitude for tile in grid})
+        columns = len({tile.min_longitude for tile in grid})
+        by_rows = rows >= columns
+        lines = rows if by_rows else columns
+        count = max(min(count, lines), 1)
+
+        shards = []
+        for index in range(count):
+            first, last = index * lines // count, (index + 1) * lines // count
+            if by_rows:
+                shards.append(Tile.create(
+                    self.min_latitude + first * size,
+                    min(self.min_latitude + last * size, self.max_latitude),
+                    self.min_longitude,
+                    self.max_longitude
+                ))
+            else:
+                shards.append(Tile.create(
+                    self.min_latitude,
+                    self.max_latitude,
+                    self.min_longitude + first * size,
+                    min(self.min_longitude + last * size, self.max_longitude)
+                ))
+
+        return shards
+
+
+class TileCheckpoints:
+    """
+    In-memory view of the checkpoints stored for an area, so that a crawl
+    decides about every tile without a query.
+    """
+
+    def __init__(self, checkpoints):
+        self.statuses = {}
+        for checkpoint in checkpoints:
+            tile = Tile.create(
+                checkpoint.min_latitude,
+                checkpoint.max_latitude,
+                checkpoint.min_longitude,
+                checkpoint.max_longitude
+            )
+            self.statuses[tile] = checkpoint.status
+
+        self.bounds = np.array(list(self.statuses.keys()), dtype=float).reshape(-1, 4)
+
+    def __len__(self):
+        return len(self.statuses)
+
+    def status(self, tile):
+        return self.statuses.get(tile)
+
+    def has_within(self, tile):
+        """
+        Whether a smaller tile inside this one was checkpointed, e.g. by an
+        interrupted run or a grid of another size.
+        """
+        inside = (
+            (self.bounds[:, 0] >= tile.min_latitude) & (self.bounds[:, 1] <= tile.max_latitude)
+            & (self.bounds[:, 2] >= tile.min_longitude) & (self.bounds[:, 3] <= tile.max_longitude)
+        )
+        inside &= (self.bounds[:, 1] - self.bounds[:, 0] < tile.max_latitude - tile.min_latitude) \
+            | (self.bounds[:, 3] - self.bounds[:, 2] < tile.max_longitude - tile.min_longitude)
+
+        return bool(inside.any())
+
+
+class TileProgress:
+    """
+    Places of the tiles being imported which are not settled yet, i.e.
+    neither written nor dropped. A tile is done once all its places are
+    settled and none of them failed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.place_counts = {}
+        self.failed = set()
+
+    def start(self, tile, count, place_count, failed=False):
+        # Whether the tile is already done, having no place to settle
+        if not count:
+            return not failed
+
+        with self.lock:
+            self.pending[tile] = count
+            self.place_counts[tile] = place_count
+            if failed:
+                self.failed.add(tile)
+            return False
+
+    def completed(self, tiles):
+        # Tiles which settling one place of each of `tiles` would complete
+        with self.lock:
+            return [
+                tile
+                for tile, count in Counter(tile for tile in tiles if tile in self.pending).items()
+                if self.pending[tile] == count and tile not in self.failed
+            ]
+
+    def settle(self, tiles, failed=False):
+        with self.lock:
+            for tile in tiles:
+                if tile not in self.pending:
+                    continue
+
+                self.pending[tile] -= 1
+                if failed:
+                    self.failed.add(tile)
+                if not self.pending[tile]:
+                    del self.pending[tile]
+                    del self.place_counts[tile]
+                    self.failed.discard(tile)
@@ -0,0 +1,45 @@
+from data_migration.models import LanguageDetectionCache, TranslationCache
+
+
+class TranslationStore:
+    """
+    `Translator` store of the translations from `source` to `target`, kept
+    in the `TranslationCache` table.
+    """
+
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+
+    def get_many(self, hashes):
+        return dict(
+            TranslationCache.objects.filter(
+                text_hash__in=hashes,
+                source=self.source,
+                target=self.target
+            ).values_list('text_hash', 'translation')
+        )
+
+    def set_many(self, translations):
+        TranslationCache.objects.bulk_create([
+            TranslationCache(text_hash=hash_value, source=self.source, target=self.target, translation=translation)
+            for hash_value, translation in translations.items()
+        ], ignore_conflicts=True)
+
+
+class LanguageStore:
+    """
+    `Translator` store of detected languages, kept in the
+    `LanguageDetectionCache` table.
+    """
+
+    def get_many(self, hashes):
+        return dict(
+            LanguageDetectionCache.objects.filter(text_hash__in=hashes).values_list('text_hash', 'language')
+        )
+
+    def set_many(self, languages):
+        LanguageDetectionCache.objects.bulk_create([
+            LanguageDetectionCache(text_hash=hash_value, language=language)
+            for hash_value, language in languages.items()
+        ], ignore_conflicts=True)
@@ -1,3 +1,668 @@
-from django.test import TestCase
+import asyncio
+import sqlite3
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
 
-# Create your tests here.
+import aiohttp
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from activities.models import Address, Entity as ActivityEntity
+from data_migration.models import (
+    ActionCheckpoint, ImageProbe, LanguageDetectionCache, OpenTripMap as OpenTripMapServiceData, TranslationCache
+)
+from data_migration.services.bulk_writer import ActivityBulkWriter
+from data_migration.services.image_probe import ImageProbeService
+from data_migration.services.migrate.open_street_map import OpenStreetMapMigrationService
+from data_migration.services.pipeline import Pipeline, Stage
+from data_migration.services.runner import merge_stats, migrate
+from data_migration.services.tiling import Tile, TileCheckpoints, TileProgress
+from data_migration.services.translation_cache import LanguageStore, TranslationStore
+from services.async_api_service import AsyncAPIService
+from services.cassette import Cassette, RecordedResponse, use_cassette
+from services.translator import Translator
+
+
+def create_service():
+    return OpenStreetMapMigrationService(
+        SimpleNamespace(base_url='https://api.opentripmap.test/0.1/en', credentials={'api_key': 'secret'})
+    )
+
+
+def place_data(xid, name='Colosseo', latitude=41.89, longitude=12.49, **kwargs):
+    return dict(
+        xid=xid,
+        name=name,
+        point={'lat': latitude, 'lon': longitude},
+        address={'road': 'Piazza del Colosseo', 'town': 'Roma', 'country': 'Italia'},
+        kinds='interesting_places,historic',
+        **kwargs
+    )
+
+
+def image_response(url, status=200, content_type='image/jpeg'):
+    return RecordedResponse(url, status, {'Content-Type': content_type}, b'')
+
+
+@async_to_sync
+async def collect(generator):
+    return [item async for item in generator]
+
+
+class OpenTripMapAPI:
+    """
+    Stands in for `AsyncAPIService.request`: `places` maps a place id to its
+    (latitude, longitude), bbox requests return at most `limit` of them and
+    the details of the `failing` ones can not be fetched.
+    """
+
+    def __init__(self, places, limit, failing=()):
+        self.places = places
+        self.limit = limit
+        self.failing = set(failing)
+        self.bbox_requests = []
+
+    async def request(self, method, endpoint, query_params=None, data=None):
+        if endpoint == '/places/bbox':
+            tile = Tile.create(
+                query_params['lat_min'], query_params['lat_max'], query_params['lon_min'], query_params['lon_max']
+            )
+            self.bbox_requests.append(tile)
+            features = [
+                {'properties': {'xid': xid}}
+                for xid, (latitude, longitude) in self.places.items()
+                if tile.min_latitude <= latitude < tile.max_latitude
+                and tile.min_longitude <= longitude < tile.max_longitude
+            ]
+            return {'features': features[:self.limit]}
+
+        xid = endpoint.rsplit('/', 1)[-1]
+        if xid in self.failing:
+            raise aiohttp.ClientError(f'Place {xid} is not available')
+        latitude, longitude = self.places[xid]
+        return place_data(
+            xid, name=f'Place {xid}', latitude=latitude, longitude=longitude, image=f'https://images.test/{xid}.jpg'
+        )
+
+
+@override_settings(OPENTRIPMAP_TILE_SIZE=1, OPENTRIPMAP_MIN_TILE_SIZE=0.5, OPENTRIPMAP_BBOX_LIMIT=2)
+class CrawlTests(TestCase):
+    tile = Tile.create(0, 1, 0, 1)
+    places = {'N1': (0.1, 0.1), 'N3': (0.7, 0.7)}
+
+    def setUp(self):
+        self.service = create_service()
+        self.api = OpenTripMapAPI(self.places, limit=2)
+        self.service.api_service.request = self.api.request
+
+    def crawl(self):
+        return collect(self.service.crawl_tile(self.tile))
+
+    def test_full_tiles_are_split_into_quadrants(self):
+        steps = self.crawl()
+
+        quadrants = self.tile.split()
+        self.assertEqual(self.api.bbox_requests, [self.tile] + quadrants)
+        self.assertEqual(steps, list(zip(quadrants, [['N1'], [], [], ['N3']])))
+        checkpoint = OpenTripMapServiceData.objects.get()
+        self.assertEqual(checkpoint.status, OpenTripMapServiceData.STATUS_SPLIT)
+        self.assertEqual(checkpoint.place_count, 2)
+
+    def test_tiles_of_the_minimum_size_are_imported_truncated(self):
+        self.tile = self.tile.split()[0]
+        self.api.places = dict(self.places, N2=(0.2, 0.2))
+
+        with self.assertLogs('data_migration.services.migrate.open_street_map', 'WARNING'):
+            self.assertEqual(self.crawl(), [(self.tile, ['N1', 'N2'])])
+        self.assertFalse(OpenTripMapServiceData.objects.exists())
+
+    def test_crawl_resumes_from_checkpoints(self):
+        quadrants = self.tile.split()
+        for tile, status in ((self.tile, 'split'), (quadrants[0], 'done'), (quadrants[1], 'done')):
+            OpenTripMapServiceData.objects.create(
+                min_latitude=tile.min_latitude,
+                max_latitude=tile.max_latitude,
+                min_longitude=tile.min_longitude,
+                max_longitude=tile.max_longitude,
+                status=status
+            )
+        self.service.checkpoints = async_to_sync(self.service.load_checkpoints)(self.tile)
+
+        self.assertEqual(self.crawl(), [(quadrants[2], []), (quadrants[3], ['N3'])])
+        self.assertEqual(self.api.bbox_requests, quadrants[2:])
+
+    def test_tiles_with_checkpoints_inside_are_descended_into(self):
+        quadrant = self.tile.split()[3]
+        self.service.checkpoints = TileCheckpoints([SimpleNamespace(
+            min_latitude=quadrant.min_latitude,
+            max_latitude=quadrant.max_latitude,
+            min_longitude=quadrant.min_longitude,
+            max_longitude=quadrant.max_longitude,
+            status='done'
+        )])
+
+        quadrants = self.tile.split()[:3]
+        self.assertEqual(self.crawl(), list(zip(quadrants, [['N1'], [], []])))
+        self.assertEqual(self.api.bbox_requests, quadrants)
+
+
+class PipelineTests(SimpleTestCase):
+    async def source(self, count, pulled):
+        for item in range(count):
+            pulled.append(item)
+            yield item
+
+    def test_items_go_through_every_stage(self):
+        async def double(item):
+            yield item
+            yield item
+
+        async def drop_odd(item):
+            if item % 2:
+                raise ValueError(f'{item} is odd')
+            yield item
+
+        pipeline = Pipeline([Stage('double', double), Stage('even', drop_odd, workers=3)])
+        with self.assertLogs('data_migration.services.pipeline', 'ERROR') as logs:
+            stats = asyncio.run(pipeline.run(self.source(5, [])))
+
+        self.assertEqual(stats, {
+            'double': dict(consumed=5, produced=10, failed=0),
+            'even': dict(consumed=10, produced=6, failed=4),
+        })
+        self.assertEqual(pipeline.processed, 6)
+        self.assertEqual(len(logs.output), 4)
+
+    def test_full_queues_hold_the_source_back(self):
+        pulled = []
+
+        async def forward(item):
+            yield item
+
+        async def run():
+            released = asyncio.Event()
+
+            async def wait(item):
+                await released.wait()
+                yield item
+
+            pipeline = Pipeline([Stage('forward', forward), Stage('wait', wait)], queue_size=1)
+            task = asyncio.create_task(pipeline.run(self.source(100, pulled)))
+            await asyncio.sleep(0.05)
+            # One item held by each stage worker and the feeder, one in each queue
+            in_flight = len(pulled)
+            released.set()
+            return in_flight, await task
+
+        in_flight, stats = asyncio.run(run())
+        self.assertEqual(in_flight, 5)
+        self.assertEqual(stats['wait']['produced'], 100)
+
+    def test_worker_counts_can_be_overridden(self):
+        running = []
+        concurrency = []
+
+        async def track(item):
+            running.append(item)
+            concurrency.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(item)
+            yield item
+
+        pipeline = Pipeline([Stage('track', track, workers=1)], workers={'track': 4})
+        asyncio.run(pipeline.run(self.source(12, [])))
+
+        self.assertEqual(max(concurrency), 4)
+        self.assertEqual(pipeline.processed, 12)
+
+
+class TileProgressTests(SimpleTestCase):
+    tile = Tile.create(0, 1, 0, 1)
+
+    def test_tiles_without_places_are_done_at_once(self):
+        progress = TileProgress()
+
+        self.assertTrue(progress.start(self.tile, 0, 0))
+        self.assertFalse(progress.start(self.tile, 0, 3, failed=True))
+        self.assertEqual(progress.pending, {})
+
+    def test_tiles_are_completed_by_their_last_place(self):
+        progress = TileProgress()
+        progress.start(self.tile, 2, 3)
+
+        self.assertEqual(progress.completed([self.tile]), [])
+        self.assertEqual(progress.completed([self.tile, self.tile]), [self.tile])
+
+        progress.settle([self.tile])
+        self.assertEqual(progress.completed([self.tile]), [self.tile])
+        self.assertEqual(progress.place_counts[self.tile], 3)
+
+        progress.settle([self.tile])
+        self.assertEqual((progress.pending, progress.place_counts), ({}, {}))
+
+    def test_tiles_with_failed_places_are_never_completed(self):
+        progress = TileProgress()
+        progress.start(self.tile, 2, 2)
+
+        progress.settle([self.tile], failed=True)
+        self.assertEqual(progress.completed([self.tile]), [])
+
+        progress = TileProgress()
+        progress.start(self.tile, 1, 2, failed=True)
+        self.assertEqual(progress.completed([self.tile]), [])
+
+
+@override_settings(OPENTRIPMAP_TILE_SIZE=1, OPENTRIPMAP_MIN_TILE_SIZE=0.5, OPENTRIPMAP_BBOX_LIMIT=2)
+@patch('services.translator.detect', return_value='it')
+class MigrationTests(TransactionTestCase):
+    # The pipeline runs in its own event loop, as in the data_migrate command
+    places = {'N1': (0.1, 0.1), 'N2': (0.2, 0.7), 'N3': (0.7, 0.7), 'N4': (1.5, 0.5)}
+    args = dict(min_lat='0', max_lat='2', min_lon='0', max_lon='1', queue_size=2)
+
+    def migrate(self, failing=()):
+        service = create_service()
+        api = OpenTripMapAPI(self.places, limit=2, failing=failing)
+        service.api_service.request = api.request
+        service.image_probe.api_service.head = AsyncMock(
+            side_effect=lambda headers, url: image_response(url)
+        )
+        return asyncio.run(migrate(service, self.args)), api
+
+    def test_places_are_migrated_and_their_tiles_checkpointed(self, detect):
+        report, api = self.migrate()
+
+        self.assertEqual(report['processed'], 4)
+        self.assertEqual(
+            sorted(ActivityEntity.objects.values_list('external_id', 'original_language')),
+            [('N1', 'it'), ('N2', 'it'), ('N3', 'it'), ('N4', 'it')]
+        )
+
+        checkpoints = {
+            (checkpoint.min_latitude, checkpoint.min_longitude, checkpoint.max_latitude): (
+                checkpoint.status, checkpoint.place_count
+            )
+            for checkpoint in OpenTripMapServiceData.objects.all()
+        }
+        self.assertEqual(checkpoints, {
+            (0, 0, 1): ('split', 2),
+            (0, 0, 0.5): ('done', 1),
+            (0, 0.5, 0.5): ('done', 1),
+            (0.5, 0, 1): ('done', 0),
+            (0.5, 0.5, 1): ('done', 1),
+            (1, 0, 2): ('done', 1),
+        })
+
+    def test_migrated_tiles_are_not_requested_again(self, detect):
+        self.migrate()
+        report, api = self.migrate()
+
+        self.assertEqual(api.bbox_requests, [])
+        self.assertEqual(report['processed'], 0)
+
+    def test_tiles_with_failed_places_are_retried(self, detect):
+        with self.assertLogs('data_migration.services.migrate.open_street_map', 'ERROR'):
+            report, api = self.migrate(failing={'N4'})
+        self.assertEqual(report['processed'], 3)
+        self.assertFalse(OpenTripMapServiceData.objects.filter(min_latitude=1).exists())
+
+        report, api = self.migrate()
+        self.assertEqual(api.bbox_requests, [Tile.create(1, 2, 0, 1)])
+        self.assertEqual(report['processed'], 1)
+        self.assertEqual(OpenTripMapServiceData.objects.get(min_latitude=1).place_count, 1)
+
+
+class ShardingTests(SimpleTestCase):
+    def test_shards_share_the_rate_limit(self):
+        api_service = AsyncAPIService('https://api.test', limit=10, period=1)
+        api_service.share_rate_limit(1 / 4)
+
+        self.assertEqual((api_service.limiter.max_rate, api_service.limiter.time_period), (2.5, 1))
+
+    def test_shares_below_one_call_stretch_the_period(self):
+        api_service = AsyncAPIService('https://api.test', limit=2, period=1)
+        api_service.share_rate_limit(1 / 4)
+
+        self.assertEqual((api_service.limiter.max_rate, api_service.limiter.time_period), (1, 2))
+
+    def test_unlimited_services_stay_unlimited(self):
+        api_service = AsyncAPIService('https://api.test')
+        api_service.share_rate_limit(1 / 4)
+
+        self.assertIsNone(api_service.limiter)
+
+    @override_settings(OPENTRIPMAP_TILE_SIZE=1)
+    def test_shards_are_disjoint_bands_of_whole_tiles(self):
+        args = dict(min_lat='0', max_lat='3', min_lon='0', max_lon='1', queue_size=10)
+
+        shards = create_service().shards(args, 2)
+
+        self.assertEqual(shards, [
+            dict(args, min_lat=0, max_lat=1, min_lon=0, max_lon=1),
+            dict(args, min_lat=1, max_lat=3, min_lon=0, max_lon=1),
+        ])
+
+    def test_shard_stats_are_summed(self):
+        stats = {'write': dict(consumed=2, produced=2, failed=0)}
+        failed_stats = {'write': dict(consumed=3, produced=1, failed=2)}
+
+        self.assertEqual(
+            merge_stats([dict(stats=stats), dict(stats=failed_stats)]),
+            {'write': dict(consumed=5, produced=3, failed=2)}
+        )
+
+
+class CassetteTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(use_cassette, None)
+        self.path = Path(directory.name) / 'api.sqlite3'
+
+        self.api_service = AsyncAPIService('https://api.opentripmap.test/0.1/en')
+        response = MagicMock(status=200, headers={'Content-Type': 'application/json'})
+        response.read = AsyncMock(return_value=b'{"xid": "N1"}')
+        self.api_service.session = MagicMock(closed=False)
+        self.api_service.session.request.return_value.__aenter__.return_value = response
+
+    def request(self, api_key):
+        return asyncio.run(self.api_service.request('GET', '/places/xid/N1', query_params=dict(apikey=api_key)))
+
+    def test_secrets_are_left_out_of_recorded_urls(self):
+        self.assertEqual(
+            Cassette.clean_url('https://api.test/places?apikey=secret&rate=3'), 'https://api.test/places?rate=3'
+        )
+        self.assertEqual(Cassette.clean_url('https://api.test/places?apikey=secret'), 'https://api.test/places')
+        self.assertEqual(Cassette.clean_url('https://api.test/places'), 'https://api.test/places')
+
+    def test_recorded_responses_are_replayed_with_any_key(self):
+        use_cassette(Cassette.RECORD, self.path, 0)
+        self.assertEqual(self.request('secret'), {'xid': 'N1'})
+
+        use_cassette(Cassette.REPLAY, self.path, 0)
+        self.assertEqual(self.request('other'), {'xid': 'N1'})
+        self.api_service.session.request.assert_called_once()
+
+        with sqlite3.connect(self.path) as connection:
+            urls = [url for url, in connection.execute('SELECT url FROM interactions')]
+        self.assertEqual(urls, ['https://api.opentripmap.test/0.1/en/places/xid/N1'])
+
+    def test_unrecorded_requests_fail_on_replay(self):
+        use_cassette(Cassette.REPLAY, self.path, 0)
+
+        with self.assertLogs('services', 'WARNING'), self.assertRaises(aiohttp.ClientError):
+            self.request('secret')
+        self.api_service.session.request.assert_not_called()
+
+
+class ImageProbeServiceTests(TestCase):
+    def setUp(self):
+        self.service = ImageProbeService(ttl=60)
+        self.head = self.service.api_service.head = AsyncMock(side_effect=self.respond)
+
+    @staticmethod
+    def respond(headers, url):
+        return image_response(url, content_type='text/html' if url.endswith('.html') else 'image/jpeg')
+
+    def check(self, urls):
+        return async_to_sync(self.service.check)(urls)
+
+    def test_images_are_probed_once_within_the_ttl(self):
+        urls = ['https://images.test/1.jpg', 'https://images.test/page.html']
+
+        self.assertEqual(self.check(urls), {urls[0]: True, urls[1]: False})
+        self.assertEqual(self.check(urls + [urls[0], None]), {urls[0]: True, urls[1]: False})
+        self.assertEqual(self.head.call_count, 2)
+        self.assertEqual(ImageProbe.objects.count(), 2)
+
+    def test_expired_probes_are_probed_again(self):
+        url = 'https://images.test/1.jpg'
+        ImageProbe.objects.create(
+            url=url, status=404, content_type=None, checked_at=timezone.now() - timedelta(seconds=61)
+        )
+
+        self.assertEqual(self.check([url]), {url: True})
+        self.head.assert_called_once()
+        self.assertEqual(ImageProbe.objects.get(url=url).status, 200)
+
+    def test_concurrent_checks_share_a_probe(self):
+        url = 'https://images.test/1.jpg'
+
+        async def check_twice():
+            return await asyncio.gather(self.service.check([url]), self.service.check([url]))
+
+        self.assertEqual(async_to_sync(check_twice)(), [{url: True}, {url: True}])
+        self.head.assert_called_once()
+
+    def test_unreachable_images_are_retried(self):
+        url = 'https://images.test/1.jpg'
+        self.head.side_effect = [False, False, False]
+
+        self.assertEqual(self.check([url]), {url: False})
+        self.assertEqual(self.head.call_count, 3)
+        self.assertIsNone(ImageProbe.objects.get(url=url).status)
+
+
+class ActivityBulkWriterTests(TestCase):
+    def setUp(self):
+        self.service = create_service()
+        self.settled = []
+        self.writer = ActivityBulkWriter('open_street_map', chunk_size=2, on_write=self.on_write)
+
+    def on_write(self, places, failed=False):
+        self.settled.append(([place['xid'] for place in places], failed))
+
+    def place(self, xid, images=None, **kwargs):
+        data = place_data(xid, **kwargs)
+        return self.service.prepare_place(data, images or [f'https://images.test/{xid}.jpg'], 'it')
+
+    def add(self, *places):
+        for place in places:
+            async_to_sync(self.writer.add)(place)
+
+    def flush(self):
+        async_to_sync(self.writer.flush)()
+
+    def test_places_are_written_in_chunks(self):
+        self.add(self.place('N1'), self.place('N2'), self.place('N3'))
+        self.assertEqual(ActivityEntity.objects.count(), 2)
+
+        self.flush()
+        self.assertEqual(
+            sorted(ActivityEntity.objects.values_list('external_id', flat=True)), ['N1', 'N2', 'N3']
+        )
+        self.assertEqual(self.settled, [(['N1', 'N2'], False), (['N3'], False)])
+        self.assertEqual(self.writer.written, 3)
+
+    def test_discarded_places_are_settled_in_order(self):
+        self.add(self.place('N1'))
+        async_to_sync(self.writer.discard)(dict(xid='N2', tile=None), failed=True)
+
+        self.assertEqual(list(ActivityEntity.objects.values_list('external_id', flat=True)), ['N1'])
+        self.assertEqual(self.settled, [(['N1', 'N2'], False)])
+
+    def test_failing_chunk_is_written_place_by_place(self):
+        with self.assertLogs('data_migration.services.bulk_writer', 'ERROR') as logs:
+            self.add(self.place('N1', name='x' * 300), self.place('N2'))
+
+        self.assertIn('Error processing place N1', logs.output[0])
+        self.assertEqual(list(ActivityEntity.objects.values_list('external_id', flat=True)), ['N2'])
+        self.assertEqual(self.settled, [(['N1'], True), (['N2'], False)])
+        self.assertEqual((self.writer.written, self.writer.failed), (1, 1))
+
+    def test_reimported_places_update_their_address_in_place(self):
+        self.add(self.place('N1'))
+        self.flush()
+        address_id = ActivityEntity.objects.get().address_id
+
+        place = self.place('N1')
+        place['address']['city'] = 'Rome'
+        self.add(place)
+        self.flush()
+
+        self.assertEqual(Address.objects.count(), 1)
+        self.assertEqual(Address.objects.get(id=address_id).city, 'Rome')
+
+    def test_duplicate_content_is_skipped(self):
+        images = ['https://images.test/colosseo.jpg']
+        self.add(self.place('N1', images=images), self.place('N2', images=images))
+        self.add(self.place('N3', images=images))
+        self.flush()
+
+        self.assertEqual(list(ActivityEntity.objects.values_list('external_id', flat=True)), ['N1'])
+        self.assertEqual((self.writer.written, self.writer.skipped), (1, 2))
+        self.assertEqual(self.settled, [(['N1', 'N2'], False), (['N3'], False)])
+
+    def test_unchanged_places_are_not_duplicates_of_themselves(self):
+        self.add(self.place('N1'))
+        self.flush()
+        self.add(self.place('N1'))
+        self.flush()
+
+        self.assertEqual(ActivityEntity.objects.count(), 1)
+        self.assertEqual((self.writer.written, self.writer.skipped), (2, 0))
+
+    def test_places_are_upserted_on_their_external_id(self):
+        self.add(self.place('N1'))
+        self.flush()
+        activity_id = ActivityEntity.objects.get().id
+
+        self.add(self.place('N1', name='Colosseum'), self.place('N1', name='Flavian Amphitheatre'))
+
+        activity = ActivityEntity.objects.get()
+        self.assertEqual(activity.id, activity_id)
+        self.assertEqual(activity.name, 'Flavian Amphitheatre')
+        self.assertEqual((activity.external_source, activity.external_id), ('open_street_map', 'N1'))
+
+
+class FilterUnreachablePhotosTests(TestCase):
+    def setUp(self):
+        self.service = create_service()
+        # The probe service opens a new API service for every chunk
+        head = patch.object(
+            AsyncAPIService,
+            'head',
+            AsyncMock(side_effect=lambda headers, url: image_response(url, status=404 if 'broken' in url else 200))
+        )
+        self.head = head.start()
+        self.addCleanup(head.stop)
+
+        self.activities = [
+            ActivityEntity.objects.create(
+                name=name, images=images, destination_resource='open_street_map', external_source='open_street_map'
+            )
+            for name, images in (
+                ('Colosseo', ['https://images.test/colosseo.jpg', 'https://images.test/broken-1.jpg']),
+                ('Pantheon', ['https://images.test/broken-2.jpg']),
+                ('Trevi', ['https://images.test/trevi.jpg']),
+                ('Colosseo', ['https://images.test/colosseo.jpg', 'https://images.test/broken-3.jpg']),
+            )
+        ]
+
+    def remaining(self):
+        return list(ActivityEntity.objects.order_by('id').values_list('id', 'images'))
+
+    def checkpoint(self):
+        return ActionCheckpoint.objects.get(name='open_street_map.filter_unreachable_photos')
+
+    def test_unreachable_photos_are_filtered(self):
+        colosseo, _, trevi, _ = self.activities
+
+        self.service.filter_unreachable_photos(chunk_size=2)
+
+        # The second Colosseo has the content of the first one once filtered
+        self.assertEqual(self.remaining(), [
+            (colosseo.id, ['https://images.test/colosseo.jpg']),
+            (trevi.id, ['https://images.test/trevi.jpg']),
+        ])
+        self.assertEqual(self.checkpoint().last_id, 0)
+
+    def test_interrupted_runs_resume_after_the_last_chunk(self):
+        filter_chunk = self.service.filter_unreachable_photos_chunk
+        calls = []
+
+        def interrupt_second_chunk(entities, checkpoint):
+            calls.append([entity.id for entity in entities])
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return filter_chunk(entities, checkpoint)
+
+        with patch.object(self.service, 'filter_unreachable_photos_chunk', side_effect=interrupt_second_chunk):
+            with self.assertRaises(KeyboardInterrupt):
+                self.service.filter_unreachable_photos(chunk_size=2)
+        self.assertEqual(self.checkpoint().last_id, self.activities[1].id)
+
+        self.head.reset_mock()
+        self.service.filter_unreachable_photos(chunk_size=2)
+
+        # The images of the first chunk are not probed again
+        self.assertEqual(
+            [call.kwargs['url'] for call in self.head.call_args_list],
+            ['https://images.test/trevi.jpg', 'https://images.test/broken-3.jpg']
+        )
+        self.assertEqual(len(self.remaining()), 2)
+        self.assertEqual(self.checkpoint().last_id, 0)
+
+
+class TranslatorTests(TestCase):
+    @patch('services.translator.GoogleTranslator.translate')
+    def test_translations_are_stored_as_they_arrive(self, translate):
+        translate.side_effect = ['Bonjour', 'Monde', RuntimeError('Quota exceeded')]
+        translator = Translator('fr', 'en', TranslationStore('en', 'fr'))
+
+        with self.assertRaises(RuntimeError):
+            translator.translate_batch(['Hello', 'World', 'Again'])
+        self.assertEqual(TranslationCache.objects.count(), 2)
+
+        translate.side_effect = ['Encore']
+        self.assertEqual(
+            translator.translate_batch(['Hello', 'World', 'Again', 'Hello', '']),
+            ['Bonjour', 'Monde', 'Encore', 'Bonjour', '']
+        )
+        self.assertEqual(translate.call_count, 4)
+
+    @patch('services.translator.detect', return_value='de')
+    def test_stored_languages_are_not_detected_again(self, detect):
+        store = LanguageStore()
+
+        Translator.detect_languages(['Hallo', 'Welt'], store)
+        languages = Translator.detect_languages(['Hallo', 'Welt', 'Guten Tag'], store)
+
+        self.assertEqual(languages, {'Hallo': 'de', 'Welt': 'de', 'Guten Tag': 'de'})
+        self.assertEqual(detect.call_count, 3)
+        self.assertEqual(LanguageDetectionCache.objects.count(), 3)
+
+    @patch('services.translator.detect', return_value='de')
+    def test_nothing_is_stored_without_a_store(self, detect):
+        Translator.detect_language('Hallo')
+        Translator.detect_language('Hallo')
+
+        self.assertEqual(detect.call_count, 2)
+        self.assertFalse(LanguageDetectionCache.objects.exists())
+
+
+class LanguageStageTests(TestCase):
+    tile = Tile.create(41, 42, 12, 13)
+
+    @patch('services.translator.detect', return_value='it')
+    def test_language_is_detected_once_per_text(self, detect):
+        service = create_service()
+        data = place_data('N1', wikipedia_extracts={'text': 'Il Colosseo è un anfiteatro'})
+
+        first = collect(service.detect_language((self.tile, data, ['https://images.test/1.jpg'])))
+        second = collect(service.detect_language((self.tile, data, ['https://images.test/1.jpg'])))
+
+        detect.assert_called_once_with('Il Colosseo è un anfiteatro')
+        self.assertEqual(first, second)
+        self.assertEqual(first[0]['activity']['original_language'], 'it')
+        self.assertEqual(first[0]['tile'], self.tile)
+        self.assertTrue(LanguageDetectionCache.objects.filter(language='it').exists())
+
+    @patch('services.translator.detect', return_value='it')
+    def test_language_falls_back_to_the_name(self, detect):
+        collect(create_service().detect_language((self.tile, place_data('N1'), ['https://images.test/1.jpg'])))
+
+        detect.assert_called_once_with('Colosseo')
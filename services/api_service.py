@@ -1,8 +1,11 @@
 import requests
+import time
 from ratelimit import sleep_and_retry, limits
 from requests.exceptions import RequestException
 import logging
 
+from services.cassette import get_cassette
+
 
 class APIService:
     def __init__(self, base_url, limit=None, period=None):
@@ -16,9 +19,36 @@ class APIService:
             self.get = set_rate_limit(self.get)
             self.request = set_rate_limit(self.request)
 
+    def fetch(self, method, url, headers=None, data=None, allow_redirects=True):
+        # Recorded to or replayed from the active cassette, see `services.cassette`
+        cassette = get_cassette()
+
+        if cassette and cassette.replaying:
+            response = cassette.load(method, url, data)
+            if response is None:
+                raise RequestException(f"{method} {url} is not recorded")
+            time.sleep(cassette.delay(response))
+            return response
+
+        response = requests.request(
+            method=method,
+            url=url,
+            headers=headers,
+            data=data,
+            allow_redirects=allow_redirects
+        )
+
+        if cassette and cassette.recording:
+            cassette.store(
+                method, url, data, response.status_code, response.headers, response.content,
+                response.elapsed.total_seconds()
+            )
+
+        return response
+
     def head(self, headers):
         try:
-            return requests.head(self.base_url, headers=headers)
+            return self.fetch('HEAD', self.base_url, headers=headers, allow_redirects=False)
         except RequestException as e:
             return False
 
@@ -28,7 +58,7 @@ class APIService:
                 endpoint += "?" + "&".join([f"{k}={v}" for k, v in query_params.items()])
 
             self.logger.debug(f"Fetching data from {self.base_url + endpoint} - get method")
-            response = requests.get(self.base_url + endpoint)
+            response = self.fetch('GET', self.base_url + endpoint)
             response.raise_for_status()
             return response.json()
         except RequestException as e:
@@ -42,11 +72,7 @@ class APIService:
 
             self.logger.debug(f"Fetching data from {self.base_url + endpoint} - {method} method")
             self.logger.debug(f"Data: {data}")
-            response = requests.request(
-                method=method,
-                url=self.base_url + endpoint,
-                data=data
-            )
+            response = self.fetch(method, self.base_url + endpoint, data=data)
 
             self.logger.debug(f"Response: {response.json()}")
             response.raise_for_status()
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+from aiolimiter import AsyncLimiter
+from requests import HTTPError
+from yarl import URL
+
+from services.cassette import RecordedResponse, get_cassette
+
+
+class AsyncAPIService:
+    """
+    Non-blocking counterpart of `APIService`. Connections are pooled in one
+    session, at most `concurrency` requests are in flight and `limit` calls
+    per `period` seconds are let through. Responses are recorded to or
+    replayed from the active cassette, see `services.cassette`.
+    """
+
+    def __init__(self, base_url, limit=None, period=None, concurrency=10, timeout=30):
+        self.base_url = base_url
+        self.logger = logging.getLogger(__name__)
+        self.concurrency = concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.limit = limit
+        self.period = period
+        self.limiter = AsyncLimiter(limit, period) if limit and period else None
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session = None
+
+    def share_rate_limit(self, share):
+        # When several processes call the API, each gets `share` of the budget.
+        # A limiter must let at least one call through at once, so a share of
+        # less than one call per period stretches the period instead
+        if self.limit and self.period:
+            rate = self.limit * share
+            max_rate = max(rate, 1)
+            self.limiter = AsyncLimiter(max_rate, self.period * max_rate / rate)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    async def open(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=self.timeout
+            )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @asynccontextmanager
+    async def throttle(self, limited=True):
+        async with self.semaphore:
+            if self.limiter and limited:
+                await self.limiter.acquire()
+            yield
+
+    def build_url(self, endpoint, query_params=None):
+        # Query strings are built the same way as in `APIService`, values
+        # may be already percent-encoded
+        if query_params:
+            endpoint += "?" + "&".join([f"{k}={v}" for k, v in query_params.items()])
+        return self.base_url + endpoint
+
+    async def fetch(self, method, url, headers=None, data=None, allow_redirects=True, encoded=False):
+        cassette = get_cassette()
+
+        if cassette and cassette.replaying:
+            # Replays use no API quota, so they are not rate limited
+            async with self.throttle(limited=False):
+                response = cassette.load(method, url, data)
+                if response is None:
+                    raise aiohttp.ClientError(f"{method} {url} is not recorded")
+                await asyncio.sleep(cassette.delay(response))
+                return response
+
+        await self.open()
+        async with self.throttle():
+            start_time = time.perf_counter()
+            async with self.session.request(
+                    method,
+                    URL(url, encoded=True) if encoded else url,
+                    headers=headers,
+                    data=data,
+                    allow_redirects=allow_redirects
+            ) as response:
+                body = await response.read()
+                elapsed_time = time.perf_counter() - start_time
+
+        if cassette and cassette.recording:
+            cassette.store(method, url, data, response.status, response.headers, body, elapsed_time)
+
+        return RecordedResponse(url, response.status, response.headers, body, elapsed_time)
+
+    async def head(self, headers, url=None):
+        try:
+            return await self.fetch('HEAD', url or self.base_url, headers=headers, allow_redirects=False)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def get(self, endpoint, query_params=None):
+        return await self.request('GET', endpoint, query_params=query_params)
+
+    async def request(self, method, endpoint, query_params=None, data=None):
+        url = self.build_url(endpoint, query_params)
+
+        try:
+            self.logger.debug(f"Fetching data from {url} - {method} method")
+            self.logger.debug(f"Data: {data}")
+
+            response = await self.fetch(method, url, data=data, encoded=True)
+            response.raise_for_status()
+            result = response.json()
+
+            self.logger.debug(f"Response: {result}")
+            return result
+        except (aiohttp.ClientError, asyncio.TimeoutError, HTTPError, ValueError) as e:
+            self.logger.error(f"Error while fetching data from {url}: {e}")
+            raise aiohttp.ClientError(e)
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+
+from requests import HTTPError
+from requests.structures import CaseInsensitiveDict
+
+# Query parameters left out of recorded URLs, so that no secret is stored
+# and a cassette replays with any key
+SECRET_PARAMS = ('apikey',)
+
+logger = logging.getLogger(__name__)
+
+
+class RecordedResponse:
+    """
+    Response served from a cassette, with the parts of the `requests` and
+    `aiohttp` response interfaces the API services use.
+    """
+
+    def __init__(self, url, status, headers, body, elapsed=0.0):
+        self.url = url
+        self.status = status
+        self.status_code = status
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = body
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.status < 400
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise HTTPError(f'{self.status} error for {self.url}', response=self)
+
+
+class Cassette:
+    """
+    Store of HTTP interactions in a SQLite file. In `record` mode the API
+    services save every response they get; in `replay` mode they are served
+    from the store instead of the network, after `latency` seconds (or the
+    recorded response time when latency is `recorded`).
+    """
+
+    RECORD = 'record'
+    REPLAY = 'replay'
+    MODES = (RECORD, REPLAY)
+
+    def __init__(self, path, mode, latency=None):
+        if mode not in self.MODES:
+            raise ValueError(f'Unknown cassette mode {mode}')
+
+        self.path = str(path)
+        self.mode = mode
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.connection = None
+        self.connection_pid = None
+
+    @property
+    def recording(self):
+        return self.mode == self.RECORD
+
+    @property
+    def replaying(self):
+        return self.mode == self.REPLAY
+
+    def connect(self):
+        # A connection can not be shared with forked processes
+        if self.connection is None or self.connection_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS interactions ('
+                'key TEXT PRIMARY KEY, method TEXT, url TEXT, status INTEGER, headers TEXT, body BLOB, elapsed REAL'
+                ')'
+            )
+            self.connection_pid = os.getpid()
+        return self.connection
+
+    @staticmethod
+    def clean_url(url):
+        if '?' not in url:
+            return url
+
+        path, query = url.split('?', 1)
+        params = [param for param in query.split('&') if param.split('=', 1)[0] not in SECRET_PARAMS]
+        return f'{path}?{"&".join(params)}' if params else path
+
+    def key(self, method, url, data=None):
+        payload = json.dumps([method.upper(), self.clean_url(url), data], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def load(self, method, url, data=None):
+        with self.lock:
+            row = self.connect().execute(
+                'SELECT status, headers, body, elapsed FROM interactions WHERE key = ?',
+                (self.key(method, url, data),)
+            ).fetchone()
+
+        if row is None:
+            logger.warning(f'{method} {self.clean_url(url)} is not recorded')
+            return None
+
+        status, headers, body, elapsed = row
+        return RecordedResponse(url, status, json.loads(headers), zlib.decompress(body), elapsed)
+
+    def store(self, method, url, data, status, headers, body, elapsed):
+        with self.lock:
+            connection = self.connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO interactions VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    self.key(method, url, data),
+                    method.upper(),
+                    self.clean_url(url),
+                    status,
+                    json.dumps(dict(headers)),
+                    zlib.compress(body or b''),
+                    elapsed
+                )
+            )
+            connection.commit()
+
+    def delay(self, response):
+        # Seconds a replayed response is held back
+        if self.latency == 'recorded':
+            return response.elapsed
+        return float(self.latency or 0)
+
+
+_cassette = None
+_configured = False
+
+
+def use_cassette(mode, path=None, latency=None):
+    """
+    Makes the API services of this process record to or replay from a
+    cassette; `mode` None turns it off. Defaults come from the
+    API_CASSETTE_* settings.
+    """
+    global _cassette, _configured
+    from django.conf import settings
+
+    _cassette = Cassette(
+        path or settings.API_CASSETTE_PATH,
+        mode,
+        settings.API_CASSETTE_LATENCY if latency is None else latency
+    ) if mode else None
+    _configured = True
+    return _cassette
+
+
+def get_cassette():
+    if not _configured:
+        from django.conf import settings
+        use_cassette(settings.API_CASSETTE_MODE)
+    return _cassette
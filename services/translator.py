@@ -1,19 +1,103 @@
+import asyncio
+import hashlib
+
+from asgiref.sync import sync_to_async
 from deep_translator import GoogleTranslator
 from datetime import timedelta
 from ratelimit import limits, sleep_and_retry
 from langdetect import detect
 
 
+def text_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
 class Translator:
-    def __init__(self, target):
+    """
+    Translations and detected languages can be memoised by the hash of the
+    text, so that only text not seen before is sent to the API or run
+    through `langdetect`. Stores are injected: any object with
+    `get_many(hashes)`, returning a dict of the known hashes, and
+    `set_many(values)`, taking a dict mapping hashes to values. Without one
+    nothing is memoised.
+    """
+
+    def __init__(self, target, source='auto', store=None):
+        self.source = source
         self.target = target
-        self.translator = GoogleTranslator(source='auto', target=target)
+        self.store = store
+        self.translator = GoogleTranslator(source=source, target=target)
 
     @sleep_and_retry
     @limits(calls=5, period=timedelta(seconds=1).total_seconds())
-    def translate(self, text):
+    def translate_uncached(self, text):
         return self.translator.translate(text)
 
+    def translate(self, text):
+        return self.translate_batch([text])[0]
+
+    def translate_batch(self, texts):
+        """
+        Returns the translations of `texts`, in the same order. Stored ones
+        are fetched in a single call, the others are translated once per
+        distinct text and stored as soon as they arrive, so that a failing
+        call does not lose the translations already paid for.
+        """
+        hashes = {text: text_hash(text) for text in texts if text}
+        translations = self.store.get_many(set(hashes.values())) if self.store else {}
+
+        for text, hash_value in hashes.items():
+            if hash_value in translations:
+                continue
+
+            translations[hash_value] = self.translate_uncached(text)
+            if self.store:
+                self.store.set_many({hash_value: translations[hash_value]})
+
+        return [translations[hashes[text]] if text else text for text in texts]
+
     @staticmethod
-    def detect_language(text):
-        return detect(text)
+    def detect_uncached(texts):
+        # Maps the hash of every text to its language, without any store
+        return {text_hash(text): detect(text) for text in texts}
+
+    @staticmethod
+    def detect_language(text, store=None):
+        return Translator.detect_languages([text], store)[text]
+
+    @staticmethod
+    def detect_languages(texts, store=None):
+        """
+        Returns a dict mapping every given text to its detected language,
+        detecting it only for texts not stored yet.
+        """
+        hashes = {text: text_hash(text) for text in texts}
+        languages = store.get_many(set(hashes.values())) if store else {}
+
+        missing = [text for text, hash_value in hashes.items() if hash_value not in languages]
+        if missing:
+            detected = Translator.detect_uncached(missing)
+            if store:
+                store.set_many(detected)
+            languages.update(detected)
+
+        return {text: languages[hash_value] for text, hash_value in hashes.items()}
+
+    @staticmethod
+    async def adetect_languages(texts, store=None):
+        """
+        Async `detect_languages`. The store is called through `sync_to_async`
+        and only the CPU bound detection runs in a worker thread, which never
+        touches the database.
+        """
+        hashes = {text: text_hash(text) for text in texts}
+        languages = await sync_to_async(store.get_many)(set(hashes.values())) if store else {}
+
+        missing = [text for text, hash_value in hashes.items() if hash_value not in languages]
+        if missing:
+            detected = await asyncio.to_thread(Translator.detect_uncached, missing)
+            if store:
+                await sync_to_async(store.set_many)(detected)
+            languages.update(detected)
+
+        return {text: languages[hash_value] for text, hash_value in hashes.items()}
@@ -110,6 +110,7 @@ USERSESSIONS_TRACK_ACTIVITY = True
 # Middleware settings
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'utils.middleware.query_count_middleware.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -118,11 +119,12 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
-    'allauth.usersessions.middleware.UserSessionsMiddleware',
+    'utils.middleware.user_sessions_middleware.UserSessionsMiddleware',
 ]
 
 # Cors settings
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_EXPOSE_HEADERS = ['X-Query-Count']
 
 CORS_ALLOW_METHODS = [
     'GET',
@@ -179,6 +181,29 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Serialised activities, in a table shared by every process so that the
+    # invalidations of any of them (web workers, data_migrate, after
+    # migration actions) reach all. Culled past MAX_ENTRIES
+    'activities': {
+        'BACKEND': environ.get('ACTIVITIES_CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': environ.get('ACTIVITIES_CACHE_LOCATION', 'activities_cache'),
+        'TIMEOUT': int(environ.get('ACTIVITIES_CACHE_TTL', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(environ.get('ACTIVITIES_CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+}
+
+ACTIVITIES_CACHE_ALIAS = 'activities'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -220,6 +245,52 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Activities feed settings
+# Geohash precision the nearest-first feed starts its candidate search at
+ACTIVITIES_GEOHASH_SEARCH_PRECISION = int(environ.get('ACTIVITIES_GEOHASH_SEARCH_PRECISION', 6))
+# Nearest-first feed implementation: 'sql' (geohash prefilter) or 'tree' (in-memory KD-tree)
+ACTIVITIES_FEED_ENGINE = environ.get('ACTIVITIES_FEED_ENGINE', 'sql')
+# .npz file written by `rebuild_spatial_index`, the tree is built from the database when unset
+ACTIVITIES_SPATIAL_INDEX_PATH = environ.get('ACTIVITIES_SPATIAL_INDEX_PATH')
+# Seconds between reloads of the tree, from the file when it changed or else
+# from the database. Writes of the serving process are applied right away,
+# writes of other processes show up after a reload; 0 turns reloading off
+ACTIVITIES_SPATIAL_INDEX_RELOAD_INTERVAL = float(environ.get('ACTIVITIES_SPATIAL_INDEX_RELOAD_INTERVAL', 300))
+# Page sizes of the liked activities endpoint
+ACTIVITIES_LIKED_PAGE_SIZE = int(environ.get('ACTIVITIES_LIKED_PAGE_SIZE', 20))
+ACTIVITIES_LIKED_MAX_PAGE_SIZE = int(environ.get('ACTIVITIES_LIKED_MAX_PAGE_SIZE', 100))
+# Maximum number of events accepted by the batched interactions endpoint
+ACTIVITIES_INTERACTIONS_MAX_BATCH = int(environ.get('ACTIVITIES_INTERACTIONS_MAX_BATCH', 500))
+# Write-behind buffering of views: when on, views are written by a background
+# thread every ACTIVITIES_VIEW_BUFFER_INTERVAL seconds or once
+# ACTIVITIES_VIEW_BUFFER_SIZE of them are waiting
+ACTIVITIES_VIEW_BUFFER = environ.get('ACTIVITIES_VIEW_BUFFER', 'False') == 'True'
+ACTIVITIES_VIEW_BUFFER_SIZE = int(environ.get('ACTIVITIES_VIEW_BUFFER_SIZE', 1000))
+ACTIVITIES_VIEW_BUFFER_INTERVAL = float(environ.get('ACTIVITIES_VIEW_BUFFER_INTERVAL', 5))
+# Comma-separated names of the routes served by their async view (e.g.
+# 'get-activities,track-views'), which pays off when run under an ASGI server.
+# The async views are also mounted under async/ whatever this setting
+ACTIVITIES_ASYNC_VIEWS = {name for name in environ.get('ACTIVITIES_ASYNC_VIEWS', '').split(',') if name}
+
+# Data migration settings
+# Concurrent HEAD requests used to check images, and how long (in seconds) a result is reused
+IMAGE_PROBE_CONCURRENCY = int(environ.get('IMAGE_PROBE_CONCURRENCY', 20))
+IMAGE_PROBE_TTL = int(environ.get('IMAGE_PROBE_TTL', 7 * 24 * 60 * 60))
+# Number of places written per bulk statement
+DATA_MIGRATION_CHUNK_SIZE = int(environ.get('DATA_MIGRATION_CHUNK_SIZE', 500))
+# OpenTripMap is crawled from tiles of OPENTRIPMAP_TILE_SIZE degrees, split in
+# quadrants (down to OPENTRIPMAP_MIN_TILE_SIZE) while a bbox request returns
+# OPENTRIPMAP_BBOX_LIMIT places
+OPENTRIPMAP_TILE_SIZE = float(environ.get('OPENTRIPMAP_TILE_SIZE', 0.8))
+OPENTRIPMAP_MIN_TILE_SIZE = float(environ.get('OPENTRIPMAP_MIN_TILE_SIZE', 0.0125))
+OPENTRIPMAP_BBOX_LIMIT = int(environ.get('OPENTRIPMAP_BBOX_LIMIT', 500))
+# API responses are recorded to ('record') or replayed from ('replay') a SQLite
+# cassette; replayed responses are delayed by API_CASSETTE_LATENCY seconds,
+# or by the recorded response time when it is 'recorded'
+API_CASSETTE_MODE = environ.get('API_CASSETTE_MODE') or None
+API_CASSETTE_PATH = environ.get('API_CASSETTE_PATH', str(BASE_DIR / 'cassettes' / 'api.sqlite3'))
+API_CASSETTE_LATENCY = environ.get('API_CASSETTE_LATENCY', '')
+
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = environ.get('EMAIL_HOST')
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark of the batch distance API against the scalar loop.
+
+Usage: python -m utils.benchmarks.geo_distance_benchmark [--sizes 1000 1000000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from utils.geo_utils import Location
+
+
+def measure(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument(
+        '--fallback-max-size',
+        type=int,
+        default=100_000,
+        help='Largest size the (slow) scalar fallback is measured at'
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generator = np.random.default_rng(args.seed)
+    start = Location(52.2297, 21.0122)
+
+    print(f'{"points":>10} {"scalar loop":>14} {"fallback":>14} {"batch":>14} {"speedup":>9}')
+
+    for size in args.sizes:
+        latitudes = generator.uniform(-90, 90, size)
+        longitudes = generator.uniform(-180, 180, size)
+        locations = [Location(lat, lon) for lat, lon in zip(latitudes.tolist(), longitudes.tolist())]
+
+        scalar_time = measure(
+            lambda: [Location.calculate_distance(start, location) for location in locations],
+            args.repeat
+        )
+        batch_time = measure(lambda: Location.calculate_distances(start, latitudes, longitudes), args.repeat)
+
+        fallback = '-'
+        if size <= args.fallback_max_size:
+            fallback_time = measure(
+                lambda: Location.calculate_distances_scalar(start, latitudes.tolist(), longitudes.tolist()),
+                1
+            )
+            fallback = f'{size / fallback_time:,.0f}/s'
+
+            # Equal up to the last-bit rounding of sin and cos
+            if not np.allclose(
+                Location.calculate_distances(start, latitudes, longitudes),
+                Location.calculate_distances_scalar(start, latitudes.tolist(), longitudes.tolist()),
+                rtol=1e-12,
+                atol=1e-9
+            ):
+                raise AssertionError(f'Batch and scalar fallback results differ for {size} points')
+
+        print(
+            f'{size:>10} {size / scalar_time:>12,.0f}/s {fallback:>14} '
+            f'{size / batch_time:>12,.0f}/s {scalar_time / batch_time:>8.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
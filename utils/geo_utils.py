@@ -1,4 +1,27 @@
-from math import radians, sin, cos, sqrt, atan2
+from math import radians, sin, cos, sqrt, atan2, asin
+
+import numpy as np
+
+EARTH_RADIUS = 6371.0
+
+
+def haversine_distances(start_latitude, start_longitude, latitudes, longitudes):
+    """
+    Vectorised counterpart of `Location.calculate_distance`: distances in
+    kilometres between broadcastable arrays of coordinates in degrees.
+    """
+    lat1, lon1 = np.radians(start_latitude), np.radians(start_longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+
+    # Squares are written as products: scalar `**` goes through pow(), which
+    # is not guaranteed to round like the vectorised square
+    sin_dlat = np.sin((lat2 - lat1) / 2)
+    sin_dlon = np.sin((lon2 - lon1) / 2)
+    a = sin_dlat * sin_dlat + np.cos(lat1) * np.cos(lat2) * (sin_dlon * sin_dlon)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return EARTH_RADIUS * c
+
 
 class Location:
     def __init__(self, latitude, longitude):
@@ -26,3 +49,183 @@ class Location:
         distance = R * c
 
         return distance
+
+    @staticmethod
+    def calculate_distances(start, latitudes, longitudes):
+        """
+        Distances in kilometres from `start` to every point given as arrays of
+        latitudes and longitudes.
+        """
+        return haversine_distances(
+            start.latitude,
+            start.longitude,
+            np.asarray(latitudes, dtype=np.float64),
+            np.asarray(longitudes, dtype=np.float64)
+        )
+
+    @staticmethod
+    def calculate_distances_scalar(start, latitudes, longitudes):
+        """
+        Pure `math` fallback of `calculate_distances`, returning a list. It
+        uses the same product-form formula; `math` and NumPy may round sin
+        and cos differently in the last bit, so results agree to about 1e-11
+        km rather than exactly.
+        """
+        lat1, lon1 = radians(start.latitude), radians(start.longitude)
+        cos_lat1 = cos(lat1)
+
+        distances = []
+        for latitude, longitude in zip(latitudes, longitudes):
+            lat2, lon2 = radians(latitude), radians(longitude)
+            sin_dlat = sin((lat2 - lat1) / 2)
+            sin_dlon = sin((lon2 - lon1) / 2)
+            a = sin_dlat * sin_dlat + cos_lat1 * cos(lat2) * (sin_dlon * sin_dlon)
+            distances.append(EARTH_RADIUS * 2 * atan2(sqrt(a), sqrt(1 - a)))
+
+        return distances
+
+    @staticmethod
+    def nearest(start, latitudes, longitudes, k):
+        """
+        Returns indices and distances of the `k` points nearest to `start`,
+        closest first.
+        """
+        distances = Location.calculate_distances(start, latitudes, longitudes)
+        k = min(k, len(distances))
+        if k <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+        indices = np.argpartition(distances, k - 1)[:k]
+        indices = indices[np.argsort(distances[indices], kind='stable')]
+
+        return indices, distances[indices]
+
+    @staticmethod
+    def pairwise_nearest(latitudes, longitudes, k, chunk_size=1024):
+        """
+        Returns, for every point, the indices and distances of its `k` nearest
+        other points. Rows are computed in chunks so memory stays at
+        `chunk_size` x N distances.
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        count = len(latitudes)
+        k = min(k, count - 1)
+
+        indices = np.empty((count, max(k, 0)), dtype=np.int64)
+        distances = np.empty((count, max(k, 0)), dtype=np.float64)
+        if k <= 0:
+            return indices, distances
+
+        for chunk_start in range(0, count, chunk_size):
+            chunk = slice(chunk_start, min(chunk_start + chunk_size, count))
+            rows = np.arange(chunk.start, chunk.stop)
+
+            chunk_distances = haversine_distances(
+                latitudes[chunk, np.newaxis],
+                longitudes[chunk, np.newaxis],
+                latitudes[np.newaxis, :],
+                longitudes[np.newaxis, :]
+            )
+            chunk_distances[rows - chunk.start, rows] = np.inf
+
+            nearest = np.argpartition(chunk_distances, k - 1, axis=1)[:, :k]
+            nearest_distances = np.take_along_axis(chunk_distances, nearest, axis=1)
+            order = np.argsort(nearest_distances, axis=1, kind='stable')
+
+            indices[chunk] = np.take_along_axis(nearest, order, axis=1)
+            distances[chunk] = np.take_along_axis(nearest_distances, order, axis=1)
+
+        return indices, distances
+
+
+class Geohash:
+    BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+    @staticmethod
+    def encode(latitude, longitude, precision=9):
+        lat_range = [-90.0, 90.0]
+        lon_range = [-180.0, 180.0]
+        geohash = []
+        bits = 0
+        bit_count = 0
+        even = True
+
+        while len(geohash) < precision:
+            # Even bits split longitude, odd bits split latitude
+            value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+            mid = (value_range[0] + value_range[1]) / 2
+            if value >= mid:
+                bits = (bits << 1) | 1
+                value_range[0] = mid
+            else:
+                bits = bits << 1
+                value_range[1] = mid
+
+            even = not even
+            bit_count += 1
+            if bit_count == 5:
+                geohash.append(Geohash.BASE32[bits])
+                bits = 0
+                bit_count = 0
+
+        return ''.join(geohash)
+
+    @staticmethod
+    def cell_size(precision):
+        lon_bits = (5 * precision + 1) // 2
+        lat_bits = (5 * precision) // 2
+        return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+    @staticmethod
+    def bounds(geohash):
+        lat_range = [-90.0, 90.0]
+        lon_range = [-180.0, 180.0]
+        even = True
+
+        for char in geohash:
+            value = Geohash.BASE32.index(char)
+            for shift in range(4, -1, -1):
+                value_range = lon_range if even else lat_range
+                mid = (value_range[0] + value_range[1]) / 2
+                if (value >> shift) & 1:
+                    value_range[0] = mid
+                else:
+                    value_range[1] = mid
+                even = not even
+
+        return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+    @staticmethod
+    def block(latitude, longitude, precision):
+        """
+        Returns the cell containing the point together with its (up to 8)
+        neighbours, and the radius in kilometres around the point that is
+        guaranteed to lie inside these cells.
+        """
+        center = Geohash.encode(latitude, longitude, precision)
+        min_lat, max_lat, min_lon, max_lon = Geohash.bounds(center)
+        lat_step, lon_step = Geohash.cell_size(precision)
+        center_lat = (min_lat + max_lat) / 2
+        center_lon = (min_lon + max_lon) / 2
+
+        cells = set()
+        for lat_offset in (-1, 0, 1):
+            neighbour_lat = center_lat + lat_offset * lat_step
+            if not -90.0 < neighbour_lat < 90.0:
+                continue
+            for lon_offset in (-1, 0, 1):
+                neighbour_lon = (center_lon + lon_offset * lon_step + 180.0) % 360.0 - 180.0
+                cells.add(Geohash.encode(neighbour_lat, neighbour_lon, precision))
+
+        if 3 * lon_step >= 360.0:
+            return cells, 0.0
+
+        # A point outside the block differs either in latitude by at least one
+        # cell height, or in longitude by at least one cell width while staying
+        # within the block's latitude band, where cos(lat) >= cos(edge_lat).
+        edge_lat = min(max(abs(min_lat - lat_step), abs(max_lat + lat_step)), 90.0)
+        lat_radius = radians(lat_step)
+        lon_radius = 2 * asin(min(1.0, cos(radians(edge_lat)) * sin(radians(lon_step) / 2)))
+
+        return cells, EARTH_RADIUS * min(lat_radius, lon_radius)
@@ -0,0 +1,60 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connection
+
+
+class QueryCountMiddleware:
+    """
+    Publishes the number of database queries a request made in the
+    `X-Query-Count` response header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        query_count = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            response = self.get_response(request)
+
+        return self.publish(request, response, query_count)
+
+    async def __acall__(self, request):
+        query_count = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        # Queries of an async request run in its sync thread, so the wrapper
+        # is put on that thread's connection
+        await sync_to_async(lambda: connection.execute_wrappers.append(count_queries))()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(lambda: connection.execute_wrappers.remove(count_queries))()
+
+        return self.publish(request, response, query_count)
+
+    def publish(self, request, response, query_count):
+        response['X-Query-Count'] = str(query_count)
+        self.logger.debug(f'{request.method} {request.path} - {query_count} queries')
+        return response
@@ -0,0 +1,39 @@
+from allauth.usersessions import app_settings
+from allauth.usersessions.middleware import UserSessionsMiddleware as BaseUserSessionsMiddleware
+from allauth.usersessions.models import UserSession
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+
+def track_session(request):
+    if (
+        app_settings.TRACK_ACTIVITY
+        and hasattr(request, 'session')
+        and request.session.session_key
+        and hasattr(request, 'user')
+        and request.user.is_authenticated
+    ):
+        UserSession.objects.create_from_request(request)
+
+
+class UserSessionsMiddleware(BaseUserSessionsMiddleware):
+    """
+    allauth's user session tracking, which also runs async so that async
+    views are not served through a sync thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        await sync_to_async(track_session)(request)
+        return await self.get_response(request)